@@ -0,0 +1,54 @@
+# Latency of switching PI / area in the Portfolio view: substring scans over the capability
+# sheet vs. the inverted CapabilityIndex, at 10k and 100k capabilities.
+#
+#   python benchmarks/capability_filter_benchmark.py
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from capacity_core.capability_index import CapabilityIndex
+
+PIS = [f"{year}-0{number}" for year in (24, 25, 26) for number in range(1, 6)]
+AREAS = ["CRM", "MA", "Finance", "Aftersales", "Parts", "Dealer"]
+OTHER_TAGS = ["Top2024", "WSJF_SM", "Draft WSJF", "CRM WG", "UX / UI", "training", "Parent"]
+
+def make_capabilities(count, seed=0):
+    rng = np.random.default_rng(seed)
+    tags = [
+        ", ".join(rng.choice(PIS, size=rng.integers(1, 4), replace=False).tolist() + rng.choice(OTHER_TAGS, size=2, replace=False).tolist())
+        for _ in range(count)
+    ]
+    arts = rng.choice(AREAS, size=count)
+    areas = rng.choice(AREAS, size=count)
+    return pd.DataFrame({
+        "ID": np.arange(1_000_000, 1_000_000 + count).astype(str),
+        "Tags": tags,
+        "Area Path": [f"ONE Digital\\{art} and {area} art\\{area} area" for art, area in zip(arts, areas)],
+    })
+
+def time_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    print(f"{'capabilities':>12} {'index build (ms)':>17} {'substring (ms)':>15} {'index (ms)':>11}")
+    for count in (10_000, 100_000):
+        data = make_capabilities(count)
+        build_ms = time_call(lambda: CapabilityIndex(data), 1)
+        index = CapabilityIndex(data)
+
+        selections = [(pi, area) for pi in PIS[:5] for area in AREAS[:4]]
+        substring_ms = np.mean([
+            time_call(lambda: data[data["Tags"].str.contains(pi) & data["Area Path"].str.contains(area)].index, 3)
+            for pi, area in selections
+        ])
+        index_ms = np.mean([time_call(lambda: index.rows_for(pi, area), 20) for pi, area in selections])
+        print(f"{count:>12,} {build_ms:>17.1f} {substring_ms:>15.2f} {index_ms:>11.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# Benchmarks of the hot paths on a synthetic production-size workbook (see synthetic_workbook.py):
+# loading team members, the capacity and velocity calculations, the capability transforms and
+# the saves. Every case reports its time over several rounds and its peak memory (tracemalloc,
+# measured in one extra round so tracing doesn't slow down the timed ones).
+#
+#   python benchmarks/capacity_benchmark.py --save results.json
+#   python benchmarks/capacity_benchmark.py --compare results.json
+#
+# With --compare, cases whose median time or peak memory grew by more than --threshold against
+# the saved results are marked as regressions and the script exits with status 1. The same cases
+# run as pytest tests in test_capacity_benchmark.py.
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from capacity_core.loaders import get_team_members, read_sheet, read_sheet_at_version, save_data, save_role_relevance
+from capacity_core.sheet_cache import invalidate_sheets
+from capacity_core.storage import get_backend
+from capacity_core.write_coordinator import get_sheet_version
+from capacity_core.capacity import calculate_team_capacity
+from capacity_core.velocity import calculate_avg_velocity
+from capacity_core.capabilities import prepare_capability_data, apply_capability_edits
+from capacity_core.validation import budget_status, validate_capabilities
+from synthetic_workbook import make_workbook, pi_names, team_names, DEFAULT_RELEVANT_ROLES
+
+MEMBER_SHEET = "team_member_data"
+TEAM_SHEET = "team_data"
+VELOCITY_SHEET = "team_velocity"
+RELEVANCE_SHEET = "role_relevance"
+CAPABILITY_SHEET = "capability_data"
+ROUNDS = 20
+# Saves rewrite or append to the workbook, so they get fewer rounds
+SAVE_ROUNDS = 3
+# Smaller changes are noise rather than regressions, whatever the relative growth
+MIN_TIME_DELTA = 0.0005
+MIN_PEAK_DELTA = 64 * 1024
+
+class Case:
+    def __init__(self, name, function, setup=None, rounds=ROUNDS):
+        self.name = name
+        self.function = function
+        self.setup = setup
+        self.rounds = rounds
+
+    def run(self):
+        times = []
+        for _ in range(self.rounds):
+            if self.setup is not None:
+                self.setup()
+            start = time.perf_counter()
+            self.function()
+            times.append(time.perf_counter() - start)
+
+        if self.setup is not None:
+            self.setup()
+        tracemalloc.start()
+        try:
+            self.function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {"min": min(times), "median": statistics.median(times), "max": max(times), "rounds": self.rounds, "peak_bytes": peak}
+
+def make_cases(path, team_name, pi):
+    relevance = {role: True for role in DEFAULT_RELEVANT_ROLES}
+    members = get_team_members(path, MEMBER_SHEET, team_name, pi)
+    velocity_data = read_sheet(path, VELOCITY_SHEET)
+    team_data, _ = read_sheet_at_version(path, TEAM_SHEET)
+
+    prepared = prepare_capability_data(path, CAPABILITY_SHEET)
+    capabilities = prepared.data
+    pi_columns = list(prepared.pi_columns)
+    edited = capabilities.loc[prepared.rows_for(pi, team_name.split(" ")[0]), ["ID"] + pi_columns].copy()
+    edited[pi_columns] = edited[pi_columns] + 1
+
+    return [
+        Case("read_sheet after refresh (sheet cache)", lambda: read_sheet(path, MEMBER_SHEET), setup=lambda: get_backend(path).refresh(), rounds=5),
+        Case("get_team_members (uncached)", lambda: get_team_members(path, MEMBER_SHEET, team_name, pi), setup=lambda: invalidate_sheets(path, [MEMBER_SHEET])),
+        Case("get_team_members (cached)", lambda: get_team_members(path, MEMBER_SHEET, team_name, pi)),
+        Case("get_team_members as_table (uncached)", lambda: get_team_members(path, MEMBER_SHEET, team_name, pi, as_table=True), setup=lambda: invalidate_sheets(path, [MEMBER_SHEET])),
+        Case("calculate_team_capacity", lambda: calculate_team_capacity(members, 0.1, "Velocity", 8, role_relevance_dict=relevance)),
+        Case("calculate_avg_velocity", lambda: calculate_avg_velocity(velocity_data, team_name, pi, 3)),
+        Case("prepare_capability_data (uncached)", lambda: prepare_capability_data(path, CAPABILITY_SHEET), setup=lambda: invalidate_sheets(path, [CAPABILITY_SHEET])),
+        Case("capabilities rows_for PI and area", lambda: prepared.rows_for(pi, team_name.split(" ")[0])),
+        Case("apply_capability_edits", lambda: apply_capability_edits(capabilities.copy(), edited, pi_columns)),
+        Case("budget_status", lambda: budget_status(capabilities, pi_columns)),
+        Case("validate_capabilities", lambda: validate_capabilities(capabilities, pi_columns)),
+        Case("save_role_relevance", lambda: save_role_relevance(path, RELEVANCE_SHEET, team_name, pi, relevance), rounds=SAVE_ROUNDS),
+        Case("save_data (team_data)", lambda: save_data(path, TEAM_SHEET, team_data, get_sheet_version(path, TEAM_SHEET)), rounds=SAVE_ROUNDS),
+    ]
+
+def format_time(seconds):
+    return f"{seconds * 1000:.2f} ms" if seconds < 1 else f"{seconds:.2f} s"
+
+def compare(results, baseline, threshold):
+    regressions = {}
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        changes = []
+        if result["median"] > before["median"] * (1 + threshold) and result["median"] - before["median"] > MIN_TIME_DELTA:
+            changes.append(f"time {format_time(before['median'])} -> {format_time(result['median'])}")
+        if result["peak_bytes"] > before["peak_bytes"] * (1 + threshold) and result["peak_bytes"] - before["peak_bytes"] > MIN_PEAK_DELTA:
+            changes.append(f"peak {before['peak_bytes'] / 1024:.0f} -> {result['peak_bytes'] / 1024:.0f} KiB")
+        if changes:
+            regressions[name] = ", ".join(changes)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the capacity planning hot paths on a synthetic workbook.")
+    parser.add_argument("--teams", type=int, default=60)
+    parser.add_argument("--pis", type=int, default=8)
+    parser.add_argument("--members", type=int, default=15)
+    parser.add_argument("--capabilities", type=int, default=5000)
+    parser.add_argument("--workbook", help="Benchmark a copy of this workbook, written by synthetic_workbook.py with the same scale options, instead of generating one")
+    parser.add_argument("-k", dest="keyword", help="Only run the cases whose name contains this text")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare with results saved by --save")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative growth reported as a regression (default 0.2)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "workbook.xlsx")
+        start = time.perf_counter()
+        if args.workbook:
+            shutil.copyfile(args.workbook, path)
+        else:
+            make_workbook(path, args.teams, args.pis, args.members, args.capabilities)
+        print(f"Workbook ready in {time.perf_counter() - start:.1f} s: {args.teams} teams x {args.pis} PIs x {args.members} members, {args.capabilities:,} capabilities")
+
+        team_name = team_names(args.teams)[0]
+        pi = pi_names(args.pis)[min(2, args.pis - 1)]
+        cases = [case for case in make_cases(path, team_name, pi) if args.keyword is None or args.keyword in case.name]
+
+        results = {}
+        print(f"{'case':<40}{'min':>12}{'median':>12}{'max':>12}{'rounds':>8}{'peak':>12}")
+        for case in cases:
+            result = results[case.name] = case.run()
+            print(f"{case.name:<40}{format_time(result['min']):>12}{format_time(result['median']):>12}{format_time(result['max']):>12}{result['rounds']:>8}{result['peak_bytes'] / 1024:>8.0f} KiB")
+
+        if args.save:
+            with open(args.save, "w") as file:
+                json.dump({"scale": {"teams": args.teams, "pis": args.pis, "members": args.members, "capabilities": args.capabilities}, "results": results}, file, indent=1)
+            print(f"Results saved to {args.save}")
+        if args.compare:
+            with open(args.compare) as file:
+                regressions = compare(results, json.load(file)["results"], args.threshold)
+            for name, change in regressions.items():
+                print(f"REGRESSION {name}: {change}")
+            if regressions:
+                sys.exit(1)
+            print(f"No regressions above {args.threshold:.0%} against {args.compare}")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
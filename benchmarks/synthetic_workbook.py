@@ -0,0 +1,178 @@
+# Synthetic capacity planning workbook with the sheets app.py expects, at a configurable scale.
+# The defaults are production size: 60 teams x 8 PIs x 15 members and 5,000 capabilities.
+#
+#   python benchmarks/synthetic_workbook.py synthetic.xlsx --teams 60 --pis 8 --members 15 --capabilities 5000
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+
+AREAS = ["CRM", "MA", "ERP", "DATA", "WEB", "IOT"]
+ROLES = ["Developer", "Business Analyst", "Tester", "Product Owner", "Product Manager", "Solution Owner", "Solution Manager", "Product Solution Specialist", "SCRUM Master", "Test Automation Engineer", "Development Lead", "System Architect", "Quality Assurance Analyst", "Solution Architect", "UI/UX Designer", "Data Analyst"]
+ROLE_EMOJIS = ["👨‍💻", "📊", "🐞", "👑", "📈", "🧭", "🗺️", "🛠️", "🏉", "🤖", "🧑‍🏫", "🏛️", "🔎", "📐", "🎨", "📉"]
+# Most members of a team are developers and testers, as in the real data
+ROLE_WEIGHTS = np.array([8, 2, 4, 1, 0.5, 0.5, 0.5, 0.5, 1, 1, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5])
+DEFAULT_RELEVANT_ROLES = ["Developer", "Tester", "Test Automation Engineer"]
+STATES = ["1 - New", "2 - Solution Backlog", "3 - Refinement", "4 - Implementing", "5 - Validating", "6 - Deploying", "7 - Done"]
+T_SHIRTS = ["XS", "S", "M", "L", "XL"]
+SPRINTS_PER_PI = 5
+PIS_PER_YEAR = 5
+
+# PIs in the workbook's "24-03" format: five per year, starting with the first PI of 2024
+def pi_names(count, first_year=24):
+    return [f"{first_year + i // PIS_PER_YEAR:02d}-{i % PIS_PER_YEAR + 1:02d}" for i in range(count)]
+
+def team_names(count):
+    return [f"{AREAS[i % len(AREAS)]} Team {i // len(AREAS) + 1}" for i in range(count)]
+
+def team_area(team_name):
+    return team_name.split(" ")[0]
+
+def make_team_data(teams, pis, members, rng):
+    team, pi = [column.ravel() for column in np.meshgrid(teams, pis, indexing="ij")]
+    return pd.DataFrame({
+        "PI": pi,
+        "Team Name": team,
+        "Average Velocity": rng.uniform(15, 60, len(team)).round(2),
+        "Average Duration": 10,
+        "Average Team Members": members,
+        "SP Focus Factor": rng.uniform(0.2, 0.8, len(team)).round(4),
+        "Approach": rng.choice(["Percentages", "Velocity"], len(team)),
+        "SP Conversion": 8,
+    })
+
+def make_team_member_data(teams, pis, members, rng):
+    team, pi, member = [column.ravel() for column in np.meshgrid(teams, pis, np.arange(members), indexing="ij")]
+    rows = len(team)
+    days_off = rng.choice(6, size=(rows, SPRINTS_PER_PI), p=[0.55, 0.15, 0.1, 0.1, 0.05, 0.05])
+    data = pd.DataFrame({
+        "Team Name": team,
+        "PI": pi,
+        # The same people stay in a team from PI to PI
+        "Name": [f"{team_name.replace(' ', '')} Member {number + 1}" for team_name, number in zip(team, member)],
+        "Role": rng.choice(ROLES, rows, p=ROLE_WEIGHTS / ROLE_WEIGHTS.sum()),
+    })
+    for sprint in range(SPRINTS_PER_PI):
+        data[f"Days Off Sprint {sprint + 1}"] = days_off[:, sprint]
+    data["SP Focus Factor (%)"] = rng.uniform(0.2, 0.8, rows).round(2)
+    data["Hours"] = rng.choice([4, 6, 8], rows, p=[0.1, 0.1, 0.8])
+    data["FTE"] = rng.choice([0.5, 0.8, 1.0], rows, p=[0.1, 0.2, 0.7])
+    data["Total Days Off"] = days_off.sum(axis=1).astype(float)
+    data["Days Off Bar"] = [str(list(row)) for row in days_off]
+    data["Status"] = rng.choice(["Active", "Inactive"], rows, p=[0.95, 0.05])
+    data["Multiplier"] = rng.choice([0.5, 1.0], rows, p=[0.1, 0.9])
+    return data
+
+def make_team_velocity(teams, pis, rng):
+    sprints = [f"Sprint {number}" for number in range(1, SPRINTS_PER_PI)] + ["IP"]
+    team, pi, sprint = [column.ravel() for column in np.meshgrid(teams, pis, sprints, indexing="ij")]
+    return pd.DataFrame({
+        "Team": team,
+        "Year": [2000 + int(name[:2]) for name in pi],
+        "PI": [f"PI {name}" for name in pi],
+        "Sprint": [f"{name} {label}" for name, label in zip(pi, sprint)],
+        "SprintVelocity": rng.gamma(6, 5, len(team)).round(1),
+    })
+
+def make_role_relevance(teams, pis):
+    team, pi, role = [column.ravel() for column in np.meshgrid(teams, pis, ROLES, indexing="ij")]
+    return pd.DataFrame({"Team Name": team, "PI": pi, "Role": role, "Relevant": np.isin(role, DEFAULT_RELEVANT_ROLES)})
+
+def make_capability_data(count, pis, rng):
+    areas = rng.choice(AREAS, count)
+    ids = rng.choice(np.arange(100_000, 2_000_000), count, replace=False)
+    first_pi = rng.integers(0, len(pis), count)
+    start_dates = pd.Timestamp("2024-01-08") + pd.to_timedelta(first_pi * 70 + rng.integers(0, 30, count), unit="D")
+    budget = rng.choice([5, 10, 20, 50, 100, 200], count)
+
+    data = pd.DataFrame({
+        "ID": ids,
+        "Work Item Type": "Capability",
+        "Title": [f"{area} Capability {number + 1}" for number, area in enumerate(areas)],
+        "State": rng.choice(STATES, count),
+        "Priority": rng.integers(1, 5, count),
+        "WSJF": rng.uniform(1, 40, count).round(2),
+        "Bus. Priority": rng.choice(["1 - Must-have", "2 - Should-have", "3 - Could-have"], count),
+        "Start Date": start_dates,
+        "Target Date": start_dates + pd.to_timedelta(rng.integers(60, 400, count), unit="D"),
+        "Iteration Path": "ONE Digital\\" + pd.Series(start_dates.year.astype(str)),
+        "Assigned To": [f"Owner {number}" for number in rng.integers(1, 40, count)],
+        # Every capability is tagged with the PIs it is planned in, among other tags
+        "Tags": [", ".join(pis[start:start + 3] + ["WSJF_SM", f"{area} WG"]) for start, area in zip(first_pi, areas)],
+        "Area Path": [f"ONE Digital\\{area} art\\{area} area" for area in areas],
+        "Parent": rng.integers(100_000, 2_000_000, count),
+        "Act. SP": rng.choice([0.0, 5.0, 10.0, np.nan], count),
+        "Planned SP": rng.choice([10.0, 30.0, 50.0, np.nan], count),
+        "Budget SP": budget,
+        "T-Shirt": rng.choice(T_SHIRTS, count),
+        "WSJF Value": rng.choice([1, 2, 3, 5, 8, 13, 20], count),
+        "WSJF Time": rng.choice([1, 2, 3, 5, 8, 13, 20], count),
+        "WSJF Risk": rng.choice([1, 2, 3, 5, 8, 13, 20], count),
+        "WSJF Effort": rng.choice([1, 2, 3, 5, 8, 13, 20], count),
+        "T-Shirt by Effort": rng.choice(T_SHIRTS, count),
+        "Discovery PI": [pis[max(start - 1, 0)] for start in first_pi],
+        "Fit-Scope PI": [pis[start] for start in first_pi],
+        f"{pis[0]} Status": np.nan,
+        "Comment": rng.choice(["", "Effort to be discussed", "Capacity in buffer below"], count),
+    })
+    # Story points spread over the PIs from the capability's first PI on
+    pi_points = np.zeros((count, len(pis)))
+    for offset in range(3):
+        columns = np.minimum(first_pi + offset, len(pis) - 1)
+        pi_points[np.arange(count), columns] += (budget * rng.uniform(0, 0.5, count)).round()
+    for position, pi in enumerate(pis):
+        data[f"PI {pi}"] = pi_points[:, position]
+    data["To be aligned"] = rng.random(count) < 0.1
+    data["Ranking"] = np.nan
+    data["Core Team Coverage"] = rng.choice([1.0, np.nan], count)
+    data["Link"] = "https://agco-dcx.visualstudio.com/ONE%20Digital/_workitems/edit/" + data["ID"].astype(str)
+    data["Total PI SP"] = pi_points.sum(axis=1)
+    data["Status"] = np.where(data["Total PI SP"] > budget, "Over Budget", "Within Budget")
+    return data
+
+# All sheets of the workbook, in the order of test_data.xlsx
+def make_sheets(teams=60, pis=8, members=15, capabilities=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    team_list = team_names(teams)
+    pi_list = pi_names(pis)
+    return {
+        "AREA DATA ->": pd.DataFrame(),
+        "capability_data": make_capability_data(capabilities, pi_list, rng),
+        "TEAM DATA ->": pd.DataFrame(),
+        "team_data": make_team_data(team_list, pi_list, members, rng),
+        "team_member_data": make_team_member_data(team_list, pi_list, members, rng),
+        "team_velocity": make_team_velocity(team_list, pi_list, rng),
+        "role_relevance": make_role_relevance(team_list, pi_list),
+        "DROPDOWNS ->": pd.DataFrame(),
+        "pi_dropdown": pd.DataFrame({"PI": pi_list}),
+        "team_dropdown": pd.DataFrame({"Team": team_list, "Area": [team_area(team) for team in team_list]}),
+        "portfolio_dropdown": pd.DataFrame({"Area": sorted({team_area(team) for team in team_list})}),
+        "role_dropdown": pd.DataFrame({"Role": ROLES, "Emoji": ROLE_EMOJIS}),
+        "approach_dropdown": pd.DataFrame({"Approach": ["Percentages", "Velocity"], "Emoji": ["🔢", "💨"]}),
+    }
+
+def make_workbook(path, teams=60, pis=8, members=15, capabilities=5000, seed=0):
+    sheets = make_sheets(teams, pis, members, capabilities, seed)
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for sheet_name, data in sheets.items():
+            data.to_excel(writer, sheet_name=sheet_name, index=False)
+    return sheets
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic capacity planning workbook.")
+    parser.add_argument("path", help="Path of the workbook to write, e.g. synthetic.xlsx")
+    parser.add_argument("--teams", type=int, default=60)
+    parser.add_argument("--pis", type=int, default=8)
+    parser.add_argument("--members", type=int, default=15, help="Members per team and PI")
+    parser.add_argument("--capabilities", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    sheets = make_workbook(args.path, args.teams, args.pis, args.members, args.capabilities, args.seed)
+    rows = ", ".join(f"{sheet_name} {len(data):,}" for sheet_name, data in sheets.items() if len(data.columns))
+    print(f"Wrote {args.path} ({os.path.getsize(args.path) / 1e6:.1f} MB) in {time.perf_counter() - start:.1f} s: {rows}")
+
+if __name__ == "__main__":
+    main()
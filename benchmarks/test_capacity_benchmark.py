@@ -0,0 +1,65 @@
+# The cases of capacity_benchmark.py as pytest tests, one per case, on a small synthetic workbook:
+#
+#   python -m pytest benchmarks
+#
+# With BENCHMARK_BASELINE set to results saved by capacity_benchmark.py --save, the workbook has
+# the scale of those results and a case fails if it regressed by more than BENCHMARK_THRESHOLD
+# (default 0.2) against them.
+import json
+import os
+import pytest
+from capacity_benchmark import compare, make_cases
+from synthetic_workbook import make_workbook, pi_names, team_names
+
+SCALE = {"teams": 6, "pis": 3, "members": 5, "capabilities": 300}
+# Fewer rounds than the command line runs, enough for a stable median at this scale
+MAX_ROUNDS = 5
+CASE_NAMES = [
+    "read_sheet after refresh (sheet cache)",
+    "get_team_members (uncached)",
+    "get_team_members (cached)",
+    "get_team_members as_table (uncached)",
+    "calculate_team_capacity",
+    "calculate_avg_velocity",
+    "prepare_capability_data (uncached)",
+    "capabilities rows_for PI and area",
+    "apply_capability_edits",
+    "budget_status",
+    "validate_capabilities",
+    "save_role_relevance",
+    "save_data (team_data)",
+]
+
+def load_baseline():
+    path = os.environ.get("BENCHMARK_BASELINE")
+    if not path:
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+@pytest.fixture(scope="module")
+def baseline():
+    return load_baseline()
+
+@pytest.fixture(scope="module")
+def cases(tmp_path_factory, baseline):
+    scale = baseline["scale"] if baseline is not None else SCALE
+    path = str(tmp_path_factory.mktemp("benchmark") / "workbook.xlsx")
+    make_workbook(path, scale["teams"], scale["pis"], scale["members"], scale["capabilities"])
+    team_name = team_names(scale["teams"])[0]
+    pi = pi_names(scale["pis"])[min(2, scale["pis"] - 1)]
+    return {case.name: case for case in make_cases(path, team_name, pi)}
+
+def test_case_names_match(cases):
+    assert list(cases) == CASE_NAMES
+
+@pytest.mark.parametrize("name", CASE_NAMES)
+def test_benchmark(cases, baseline, name):
+    case = cases[name]
+    if baseline is None:
+        case.rounds = min(case.rounds, MAX_ROUNDS)
+    result = case.run()
+    assert result["min"] <= result["median"] <= result["max"]
+    if baseline is not None:
+        regressions = compare({name: result}, baseline["results"], float(os.environ.get("BENCHMARK_THRESHOLD", 0.2)))
+        assert regressions == {}
@@ -0,0 +1,68 @@
+# Loading the workbook cold through openpyxl vs. warm from the Parquet sheet cache, with the
+# team member sheet of test_data.xlsx scaled to 100k rows.
+#
+#   python benchmarks/workbook_cache_benchmark.py
+import os
+import shutil
+import sys
+import tempfile
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from capacity_core.storage import ExcelBackend
+from capacity_core.columnar_cache import cache_directory, pyarrow
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MEMBER_ROWS = 100_000
+# Parsing the xlsx takes tens of seconds at this size, so only the warm loads are repeated
+REPEATS = 3
+
+# test_data.xlsx with the team member sheet repeated under new team names up to rows rows
+def make_workbook(path, rows):
+    sheets = pd.read_excel(os.path.join(ROOT, "test_data.xlsx"), sheet_name=None)
+    members = sheets["team_member_data"]
+    copies = -(-rows // len(members))
+    scaled = pd.concat([members.assign(**{"Team Name": members["Team Name"] + f" {copy}"}) for copy in range(copies)], ignore_index=True)
+    sheets["team_member_data"] = scaled.iloc[:rows]
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for sheet_name, data in sheets.items():
+            data.to_excel(writer, sheet_name=sheet_name, index=False)
+
+def time_load(path, use_columnar_cache):
+    backend = ExcelBackend(path)
+    backend.use_columnar_cache = use_columnar_cache
+    start = time.perf_counter()
+    sheets = backend.load_snapshot()
+    return time.perf_counter() - start, sheets
+
+def main():
+    if pyarrow is None:
+        print("pyarrow is not installed, the sheet cache is disabled")
+        return
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "workbook.xlsx")
+        start = time.perf_counter()
+        make_workbook(path, MEMBER_ROWS)
+        print(f"Wrote a workbook with {MEMBER_ROWS:,} member rows ({os.path.getsize(path) / 1e6:.1f} MB) in {time.perf_counter() - start:.1f} s")
+
+        cold = time_load(path, False)[0]
+        first, parsed = time_load(path, True)
+        warm_times = []
+        for _ in range(REPEATS):
+            warm, cached = time_load(path, True)
+            warm_times.append(warm)
+        cache_size = sum(os.path.getsize(os.path.join(cache_directory(path), name)) for name in os.listdir(cache_directory(path)))
+
+        assert all(cached[name].equals(parsed[name]) for name in parsed)
+        print(f"{'load':<28}{'time (s)':>10}")
+        print(f"{'cold xlsx (openpyxl)':<28}{cold:>10.3f}")
+        print(f"{'xlsx + writing the cache':<28}{first:>10.3f}")
+        print(f"{'warm Parquet cache':<28}{min(warm_times):>10.3f}")
+        print(f"Speed-up {cold / min(warm_times):.0f}x, cache size {cache_size / 1e6:.1f} MB")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
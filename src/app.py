@@ -1,3 +1,4 @@
+import logging
 import streamlit as st
 import pandas as pd
 import yaml
@@ -6,10 +7,19 @@ from team_data_ui import manage_team_data_ui
 from team_member_data_ui import manage_team_member_ui
 from capability_data_ui import capability_data_ui
 from pi_dashboard_ui import pi_dashboard_ui
-from data_management import load_team_names, load_pi_options, load_portfolio_options, load_role_relevance, save_role_relevance
+from portfolio_capacity_ui import portfolio_capacity_ui
+from data_management import load_team_names, load_pi_options, load_portfolio_options, load_role_relevance, save_role_relevance, read_sheet, show_save_status
 from auth import load_auth_config, create_authenticator, save_auth_config
+from instrumentation_ui import instrumentation_panel, start_metrics_server
+from capacity_core.instrumentation import begin_run, end_run
 
 st.set_page_config(layout="wide")
+# Saves, journal folds and cache problems of capacity_core are logged to the console
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+# Time the loads, calculations and saves of this rerun for the performance panel
+begin_run()
+start_metrics_server()
 
 # File path for the data
 file_path = r"C:\Coding Projects\streamlit_capa_planning\test_data.xlsx"
@@ -52,6 +62,9 @@ if authentication_status:
     # Title of the app
     st.title("Agile Capacity Planning")
 
+    # Outcome of the saves still running in the background or finished since the last rerun
+    show_save_status()
+
     # Toggle to show help texts
     if 'show_help_texts' not in st.session_state:
         st.session_state['show_help_texts'] = False
@@ -82,7 +95,7 @@ if authentication_status:
             with st.sidebar.expander("Role Relevance"):
                 st.info("Select the Story Point relevant roles, that impact the capacity. If a role is not SP-relevant, the availabilities do not influence the team capacity.")
                 role_relevance = load_role_relevance(file_path, role_relevance_sheet_name, selected_team, selected_pi)
-                role_data = pd.read_excel(file_path, role_sheet_name)
+                role_data = read_sheet(file_path, role_sheet_name)
                 role_emoji_dict = pd.Series(role_data.Emoji.values, index=role_data.Role).to_dict()
                 # Display checkboxes for each role
                 role_relevance_dict = {}
@@ -114,9 +127,11 @@ if authentication_status:
         # Tabs for navigation under Portfolio Planning
         tabs = st.tabs(["Portfolio Overview", "Portfolio Capacity"])
         with tabs[0]:
-            capability_data_ui(file_path, capability_sheet_name, selected_area, pi_options, selected_pi)
+            capability_data_ui(file_path, capability_sheet_name, selected_area, pi_options, selected_pi, pi_sheet_name)
         with tabs[1]:
-            st.write("Portfolio Analysis Content")
+            portfolio_capacity_ui(file_path, team_member_sheet_name, team_data_sheet_name, role_relevance_sheet_name, team_sheet_name, selected_area, pi_options, capability_sheet_name, enabler_blocker, uncertainty_buffer)
+
+    instrumentation_panel(end_run())
 
 elif authentication_status == False:
     st.error('Username/password is incorrect')
@@ -1,49 +1,27 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 import re
-from data_management import load_capability_data, save_data
+from data_management import read_sheet, RowChanges, write_queue, queue_save
+from capacity_core.capabilities import prepare_capability_data, get_capability_violations, apply_capability_edits
+from capacity_core.validation import budget_status, validate_capabilities
 
-def capability_data_ui(file_path, capability_sheet_name, area, pi_options, selected_pi):
+def capability_data_ui(file_path, capability_sheet_name, area, pi_options, selected_pi, pi_sheet_name):
     st.header("Capability Data")
     
-    # Load the data
-    capability_data = load_capability_data(file_path, capability_sheet_name)
-    if capability_data is None:
+    # Load the normalised data, built once per version of the capability sheet
+    try:
+        prepared = prepare_capability_data(file_path, capability_sheet_name)
+        pi_calendar = read_sheet(file_path, pi_sheet_name)
+    except Exception as e:
+        print(f"Error loading data: {e}")
         st.error("Failed to load capability data.")
         return
-    
-    # Rename specific columns
-    column_mapping = {
-        "OD Business Priority": "Bus. Priority",
-        "OD Actual Story Points": "Act. SP",
-        "OD Planned Story Points": "Planned SP",
-        "OD Budget Story Points": "Budget SP",
-        "t_shirt_size": "T-Shirt",
-        "Time Criticality WSJF": "WSJF Time",
-        "Risk Reduction Opp. Enablement WSJF": "WSJF Risk",
-        "Business Value WSJF": "WSJF Value",
-        "Effort WSJF": "WSJF Effort"
-    }
-    capability_data.rename(columns=column_mapping, inplace=True)
-
-    # Format columns
-    capability_data["Start Date"] = pd.to_datetime(capability_data["Start Date"], errors="coerce").dt.date
-    capability_data["Target Date"] = pd.to_datetime(capability_data["Target Date"], errors="coerce").dt.date
-    capability_data["ID"] = capability_data["ID"].astype(str).str.split('.').str[0]
-    capability_data["Link"] = capability_data["ID"].apply(lambda x: f"https://agco-dcx.visualstudio.com/ONE%20Digital/_workitems/edit/{x}")
-    capability_data["Tags"] = capability_data["Tags"].str.replace(";", ",")
-    capability_data["To be aligned"] = capability_data["To be aligned"].fillna(False).astype(bool)
-    pi_columns = capability_data.columns[capability_data.columns.str.match(r"^PI \d{2}-0\d$")]
-    capability_data[pi_columns] = capability_data[pi_columns].apply(pd.to_numeric, errors='coerce').fillna(0)
+    capability_data = prepared.data
+    pi_columns = prepared.pi_columns
     
     # Filter data based on the selected pi & area
-    capability_data_filtered = capability_data[(capability_data["Tags"].str.contains(selected_pi)) & (capability_data["Area Path"].str.contains(area))].copy()
-    capability_data_filtered["State"] = capability_data_filtered["State"].apply(state_to_emoji)
-
-    # Convert PI columns to numeric, replacing non-numeric with NaN
-    pi_columns = capability_data_filtered.columns[capability_data_filtered.columns.str.startswith('PI ')]
-    capability_data_filtered[pi_columns] = capability_data_filtered[pi_columns].apply(pd.to_numeric, errors='coerce')
+    capability_data_filtered = capability_data.loc[prepared.rows_for(selected_pi, area)].copy()
+    capability_data_filtered["State"] = prepared.state_labels.loc[capability_data_filtered.index]
 
     # Display the data
     selected_capabilities = st.dataframe(
@@ -159,22 +137,24 @@ def capability_data_ui(file_path, capability_sheet_name, area, pi_options, selec
     # Ensure PI columns are numeric
     edited_timeline[pi_columns] = edited_timeline[pi_columns].apply(pd.to_numeric, errors='coerce')
 
+    # Validate the edited rows together with their dates and budget from the capability sheet
+    timeline_check = capability_data.loc[edited_timeline.index].copy()
+    timeline_check[edited_timeline.columns] = edited_timeline
+    edited_timeline[["Total PI SP", "Status"]] = budget_status(timeline_check, pi_columns)
+    violations = validate_capabilities(timeline_check, pi_columns, pi_calendar)
+
     # If the sum of the edited PI columns is greater than the Budget SP for each ID, there should be a warning callout
-    if edited_timeline is not None:
-        edited_timeline["Total PI SP"] = edited_timeline.filter(regex=r"^PI \d{2}-0\d$").sum(axis=1)
-        edited_timeline["Budget SP"] = capability_data["Budget SP"]
-        edited_timeline["Status"] = np.where(edited_timeline["Total PI SP"] > edited_timeline["Budget SP"], "Over Budget", "Within Budget")
-        over_budget_ids = edited_timeline[edited_timeline["Status"] == "Over Budget"]["ID"].tolist()
-        if over_budget_ids:
-            st.error(f"The sum of the PI columns exceeds the Budget SP for the following IDs: {', '.join(over_budget_ids)}")
-        elif edited_timeline["Total PI SP"].sum() == 0:
-            st.warning("You have not yet distributed any SP to the PI columns.")
-        else:
-            over_budget_ids = edited_timeline[edited_timeline["Status"] == "Over Budget"]["ID"].tolist()
-            if over_budget_ids:
-                st.error(f"The sum of the PI columns exceeds the Budget SP for the following IDs: {', '.join(over_budget_ids)}")
-            else:
-                st.success("The sum of the PI columns is within the Budget SP for all IDs.")
+    over_budget_ids = edited_timeline.loc[edited_timeline["Status"] == "Over Budget", "ID"].tolist()
+    if over_budget_ids:
+        st.error(f"The sum of the PI columns exceeds the Budget SP for the following IDs: {', '.join(over_budget_ids)}")
+    elif edited_timeline["Total PI SP"].sum() == 0:
+        st.warning("You have not yet distributed any SP to the PI columns.")
+    else:
+        st.success("The sum of the PI columns is within the Budget SP for all IDs.")
+    timeline_violations = violations[violations["Check"] != "Over Budget"]
+    if not timeline_violations.empty:
+        st.warning("The PI distribution does not match the dates or the Discovery / Fit-Scope PIs of these capabilities:")
+        st.dataframe(timeline_violations, hide_index=True, use_container_width=True)
 
     # Show the selected rows in a separate table for Comments
     st.subheader("🗣️ Comments")
@@ -200,18 +180,44 @@ def capability_data_ui(file_path, capability_sheet_name, area, pi_options, selec
 
     # Save Button
     if st.button("Save Changes"):
-        # Merge the changes back into the original DataFrame
-        for index, row in edited_timeline.iterrows():
-            capability_data.loc[capability_data["ID"] == row["ID"], pi_columns] = row[pi_columns]
-            capability_data.loc[capability_data["ID"] == row["ID"], "Total PI SP"] = row["Total PI SP"]
-            capability_data.loc[capability_data["ID"] == row["ID"], "Status"] = row["Status"]
-        
-        for index, row in edited_comments.iterrows():
-            capability_data.loc[capability_data["ID"] == row["ID"], comment_columns] = row[comment_columns]
-        
-        # Save the updated DataFrame to an Excel file while preserving other sheets
-        save_data(file_path, capability_sheet_name, capability_data)
-        st.success("Changes have been saved.")
+        # Merge the changes back into a copy of the cached DataFrame by ID
+        capability_data = capability_data.copy()
+        changed_timeline = apply_capability_edits(capability_data, edited_timeline, list(pi_columns) + ["Total PI SP", "Status"])
+        changed_comments = apply_capability_edits(capability_data, edited_comments, comment_columns)
+        # The budget columns follow from the PI columns; only write them where those were edited
+        pi_edited = changed_timeline[pi_columns].any(axis=1)
+        changed_timeline.loc[~pi_edited, ["Total PI SP", "Status"]] = False
+        changed_cells = pd.concat([changed_timeline, changed_comments], axis=1)
+        changed_rows = changed_cells.index[changed_cells.any(axis=1)]
+
+        if len(changed_rows) == 0:
+            st.info("No changes to save.")
+        else:
+            # Record only the edited cells, against the rows as read for the prepared data, so an
+            # edit conflicts if someone else changed the same cell since; the edited columns have
+            # the same names in the sheet
+            changes = RowChanges(capability_sheet_name)
+            for index in changed_rows:
+                columns = changed_cells.columns[changed_cells.loc[index].to_numpy()]
+                changes.update(prepared.raw.loc[index], capability_data.loc[index, columns].to_dict())
+            queue_save(write_queue.submit_rows(file_path, changes), f"Changes have been saved ({len(changed_rows)} capabilities changed).", "Failed to save the capabilities")
+            st.rerun()
+
+    # Validation of the entire portfolio, not just the selected capabilities
+    with st.expander("Portfolio Validation"):
+        portfolio_violations = get_capability_violations(file_path, capability_sheet_name, pi_sheet_name)
+        if portfolio_violations.empty:
+            st.success("No violations found in the capability data.")
+        else:
+            st.write(portfolio_violations.groupby(["Check", "Severity"]).size().rename("Violations"))
+            if (portfolio_violations["Severity"] == "Warning").any():
+                st.caption("Warnings compare the capability dates with approximate PI dates, as the PI sheet has no Start Date and End Date for these PIs.")
+            st.dataframe(portfolio_violations, hide_index=True, use_container_width=True)
+            st.download_button(
+                "Download Violations (CSV)",
+                portfolio_violations.to_csv(index=False),
+                file_name="capability_violations.csv",
+                mime="text/csv")
 
 # Function to create column configurations for PI columns on the timeline section
 def create_pi_column_config(df, pi_options):
@@ -248,17 +254,3 @@ def create_pi_column_config(df, pi_options):
 def extract_last_segment(url):
     match = re.search(r'[^/]+$', url)
     return match.group(0) if match else None
-
-# Function to map state values to emojis
-def state_to_emoji(state):
-    emoji_map = {
-        "1 - New": "🆕",
-        "2 - Solution Backlog": "📜",
-        "3 - Refinement": "🔍",
-        "4 - Implementing": "⚙️",
-        "5 - Validating": "📏",
-        "6 - Done": "✅",
-    }
-    # Remove the "Number -" part
-    state_text = re.sub(r"^\d+ - ", "", state)
-    return f"{emoji_map.get(state, '')} {state_text}"
\ No newline at end of file
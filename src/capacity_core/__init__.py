@@ -0,0 +1,4 @@
+# Calculation core of the capacity planning app: storage, loaders, capacity, velocity and
+# capability checks. Nothing in this package imports Streamlit; errors are raised as exceptions
+# and the UI modules report them. Import the submodules directly, e.g.
+#   from capacity_core.loaders import read_sheet
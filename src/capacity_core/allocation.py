@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+from capacity_core.instrumentation import instrumented
+
+try:
+    from scipy.optimize import Bounds, LinearConstraint, milp
+except ImportError:
+    milp = None
+
+ALLOCATION_MODES = ["Greedy", "ILP"]
+CLOSED_STATES = ["6 - Done"]
+
+# SP of every PI that is left for capabilities once the blocker for dependencies and the
+# uncertainty buffer are reserved
+def available_capacity(pi_capacity, enabler_blocker, uncertainty_buffer):
+    return (pi_capacity * (1 - enabler_blocker - uncertainty_buffer)).clip(lower=0)
+
+# Open SP of every capability: its budget (or the planned SP if it has no budget) minus the SP
+# already delivered
+def capability_demand(capabilities):
+    budget = capabilities["Budget SP"] if "Budget SP" in capabilities else pd.Series(np.nan, index=capabilities.index)
+    if "Planned SP" in capabilities:
+        budget = budget.fillna(capabilities["Planned SP"])
+    delivered = capabilities["Act. SP"].fillna(0) if "Act. SP" in capabilities else 0
+    return (pd.to_numeric(budget, errors="coerce").fillna(0) - delivered).clip(lower=0)
+
+# Greedy allocation: capabilities in descending WSJF order take the earliest capacity left,
+# splitting across PIs where needed. This is the overlap of every capability's interval on the
+# cumulative demand with every PI's interval on the cumulative capacity, so it is computed for
+# all capabilities x PIs at once.
+def allocate_greedy(wsjf, demand, capacity):
+    order = np.argsort(-wsjf, kind="stable")
+    demand_end = np.cumsum(demand[order])
+    capacity_end = np.cumsum(capacity)
+    overlap = (
+        np.minimum(demand_end[:, np.newaxis], capacity_end[np.newaxis, :])
+        - np.maximum((demand_end - demand[order])[:, np.newaxis], (capacity_end - capacity)[np.newaxis, :])
+    )
+    allocation = np.empty((len(demand), len(capacity)))
+    allocation[order] = np.clip(overlap, 0, None)
+    return allocation
+
+# Whole-capability allocation: choose the capabilities that maximise the cost of delay delivered
+# (WSJF x SP) when a capability only counts if it is delivered in full, then place them greedily.
+# As capabilities may span PIs, the choice only depends on the total capacity, so this is a 0/1
+# knapsack solved as an ILP with SciPy's HiGHS solver. (Its LP relaxation is the greedy pass.)
+def allocate_whole(wsjf, demand, capacity, time_limit=10):
+    if milp is None:
+        raise ImportError("The ILP allocation mode requires SciPy (pip install scipy).")
+    value = np.maximum(wsjf, 0) * demand
+    result = milp(
+        -value,
+        constraints=[LinearConstraint(demand[np.newaxis, :], -np.inf, capacity.sum())],
+        integrality=np.ones(len(demand)),
+        bounds=Bounds(0, 1),
+        options={"time_limit": time_limit},
+    )
+    if result.x is None:
+        raise RuntimeError(f"The allocation could not be solved: {result.message}")
+    return allocate_greedy(wsjf, np.where(result.x > 0.5, demand, 0.0), capacity)
+
+# Allocate the open SP of the capabilities to the capacity of the PIs (a Series of SP indexed by
+# PI, in chronological order). SP the capability sheet already plans in these PIs (its "PI YY-0X"
+# columns) take up that capacity and count towards their capability, so only the rest of the
+# capacity and of the open SP are allocated. Returns the allocation per capability, including the
+# planned SP, and the usage per PI.
+@instrumented("compute")
+def allocate_capabilities(capabilities, capacity, mode="Greedy", time_limit=10):
+    pi_columns = [f"PI {pi}" for pi in capacity.index]
+    planned = capabilities.reindex(columns=pi_columns).apply(pd.to_numeric, errors="coerce").fillna(0)
+    # Closed capabilities used their planned SP too
+    planned_per_pi = planned.sum(axis=0).to_numpy(dtype=float)
+    if "State" in capabilities:
+        open_capabilities = ~capabilities["State"].isin(CLOSED_STATES)
+        capabilities, planned = capabilities[open_capabilities], planned[open_capabilities]
+    wsjf = pd.to_numeric(capabilities["WSJF"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    demand = capability_demand(capabilities).to_numpy(dtype=float)
+    planned = planned.to_numpy(dtype=float)
+    available = capacity.to_numpy(dtype=float)
+
+    unplanned_demand = np.clip(demand - planned.sum(axis=1), 0, None)
+    unplanned_capacity = np.clip(available - planned_per_pi, 0, None)
+    if mode == "Greedy":
+        allocation = allocate_greedy(wsjf, unplanned_demand, unplanned_capacity)
+    else:
+        allocation = allocate_whole(wsjf, unplanned_demand, unplanned_capacity, time_limit=time_limit)
+    allocation = planned + allocation
+
+    allocated = allocation.sum(axis=1)
+    result = pd.DataFrame({
+        "ID": capabilities["ID"].to_numpy(),
+        "Title": capabilities["Title"].to_numpy() if "Title" in capabilities else "",
+        "WSJF": wsjf,
+        "Open SP": demand,
+        "Already Planned SP": planned.sum(axis=1),
+    })
+    result[pi_columns] = allocation
+    result["Allocated SP"] = allocated
+    result["Allocation"] = np.select(
+        [demand == 0, (allocated >= demand) | np.isclose(allocated, demand), allocated > 0],
+        ["No open SP", "Fully allocated", "Partially allocated"],
+        "Not allocated"
+    )
+    result = result.sort_values("WSJF", ascending=False, kind="stable").reset_index(drop=True)
+
+    pi_usage = pd.DataFrame({
+        "PI": list(capacity.index),
+        "Available SP": available,
+        "Already Planned SP": planned_per_pi,
+        "Allocated SP": planned_per_pi + allocation.sum(axis=0) - planned.sum(axis=0),
+    })
+    pi_usage["Remaining SP"] = pi_usage["Available SP"] - pi_usage["Allocated SP"]
+    return result, pi_usage
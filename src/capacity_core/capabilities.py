@@ -0,0 +1,113 @@
+import re
+import numpy as np
+import pandas as pd
+from capacity_core.loaders import read_sheet, read_sheet_at_version
+from capacity_core.sheet_cache import sheet_cache
+from capacity_core.capability_index import CapabilityIndex
+from capacity_core.validation import validate_capabilities
+from capacity_core.allocation import allocate_capabilities
+from capacity_core.instrumentation import instrumented
+
+CAPABILITY_LINK_URL = "https://agco-dcx.visualstudio.com/ONE%20Digital/_workitems/edit/"
+
+# Rename specific columns
+CAPABILITY_COLUMN_MAPPING = {
+    "OD Business Priority": "Bus. Priority",
+    "OD Actual Story Points": "Act. SP",
+    "OD Planned Story Points": "Planned SP",
+    "OD Budget Story Points": "Budget SP",
+    "t_shirt_size": "T-Shirt",
+    "Time Criticality WSJF": "WSJF Time",
+    "Risk Reduction Opp. Enablement WSJF": "WSJF Risk",
+    "Business Value WSJF": "WSJF Value",
+    "Effort WSJF": "WSJF Effort"
+}
+
+# The capability sheet after all per-load transforms, plus lookups derived from it
+class PreparedCapabilities:
+    # raw: the sheet as read, version: its version stamp; the rows edits are recorded against
+    def __init__(self, data, raw, version):
+        self.data = data
+        self.raw = raw
+        self.version = version
+        self.pi_columns = data.columns[data.columns.str.match(r"^PI \d{2}-0\d$")]
+
+        # State shown with its emoji, mapped once per distinct state through a categorical
+        states = data["State"].astype("category")
+        self.state_labels = states.map({state: state_to_emoji(state) for state in states.cat.categories})
+
+        # Inverted PI tag and area path indexes, so switching PI or area is a set intersection
+        self.index = CapabilityIndex(data)
+
+    def rows_for(self, pi, area):
+        return self.index.rows_for(pi, area)
+
+# Shared by every caller without a copy; copy prepared.data before modifying it
+@instrumented("load", "capability_sheet_name")
+@sheet_cache("capability_sheet_name", maxsize=8, copy_results=False)
+def prepare_capability_data(file_path, capability_sheet_name):
+    raw, version = read_sheet_at_version(file_path, capability_sheet_name)
+    capability_data = raw.rename(columns=CAPABILITY_COLUMN_MAPPING)
+
+    # Format columns
+    capability_data["Start Date"] = pd.to_datetime(capability_data["Start Date"], errors="coerce").dt.date
+    capability_data["Target Date"] = pd.to_datetime(capability_data["Target Date"], errors="coerce").dt.date
+    capability_data["ID"] = capability_data["ID"].astype(str).str.split('.').str[0]
+    capability_data["Link"] = CAPABILITY_LINK_URL + capability_data["ID"]
+    capability_data["Tags"] = capability_data["Tags"].str.replace(";", ",")
+    capability_data["To be aligned"] = capability_data["To be aligned"].fillna(False).astype(bool)
+    pi_columns = capability_data.columns[capability_data.columns.str.match(r"^PI \d{2}-0\d$")]
+    capability_data[pi_columns] = capability_data[pi_columns].apply(pd.to_numeric, errors='coerce').fillna(0)
+    return PreparedCapabilities(capability_data, raw, version)
+
+# Violations of the whole capability sheet, checked once per version of the sheet and of the PI
+# sheet, whose "Start Date" and "End Date" columns (if any) give the PIs' dates
+@instrumented("compute")
+@sheet_cache("capability_sheet_name", "pi_sheet_name", maxsize=8)
+def get_capability_violations(file_path, capability_sheet_name, pi_sheet_name=None):
+    prepared = prepare_capability_data(file_path, capability_sheet_name)
+    pi_calendar = read_sheet(file_path, pi_sheet_name) if pi_sheet_name else None
+    return validate_capabilities(prepared.data, prepared.pi_columns, pi_calendar)
+
+# Allocation of the area's capabilities to the capacity left per PI, given as (PI, SP) pairs
+@instrumented("compute")
+@sheet_cache("capability_sheet_name", maxsize=16)
+def get_capability_allocation(file_path, capability_sheet_name, area, pi_capacity, mode):
+    prepared = prepare_capability_data(file_path, capability_sheet_name)
+    capabilities = prepared.data.loc[prepared.index.area_rows(area)]
+    return allocate_capabilities(capabilities, pd.Series(dict(pi_capacity), dtype=float), mode)
+
+# Function to write edited capability rows back into the full capability data. Edits are
+# aligned to the capabilities by ID and only cells whose value changed are assigned.
+# Returns the mask of the changed cells, a frame of the columns over all capability rows.
+def apply_capability_edits(capability_data, edited_data, columns):
+    for column in columns:
+        if column not in capability_data.columns:
+            capability_data[column] = np.nan
+    edits = edited_data.drop_duplicates("ID", keep="last").set_index("ID")[columns]
+
+    matched = capability_data["ID"].isin(edits.index)
+    current = capability_data.loc[matched, columns]
+    updated = edits.reindex(capability_data.loc[matched, "ID"]).set_axis(current.index)
+
+    changed_cells = ~((current == updated) | (current.isna() & updated.isna()))
+    changed_cells = changed_cells.reindex(capability_data.index, fill_value=False)
+    updated = updated.reindex(capability_data.index)
+    for column in columns:
+        if changed_cells[column].any():
+            capability_data[column] = capability_data[column].mask(changed_cells[column], updated[column])
+    return changed_cells
+
+# Function to map state values to emojis
+def state_to_emoji(state):
+    emoji_map = {
+        "1 - New": "🆕",
+        "2 - Solution Backlog": "📜",
+        "3 - Refinement": "🔍",
+        "4 - Implementing": "⚙️",
+        "5 - Validating": "📏",
+        "6 - Done": "✅",
+    }
+    # Remove the "Number -" part
+    state_text = re.sub(r"^\d+ - ", "", state)
+    return f"{emoji_map.get(state, '')} {state_text}"
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+# Inverted indexes over the capability sheet: PI tag -> capabilities and area path key ->
+# capabilities. Capabilities are kept as their row positions in the sheet, so selecting the
+# capabilities of a PI and area is an intersection of two integer sets instead of two
+# substring scans over the whole sheet.
+#
+# A tag is indexed as a whole and by its first word ("24-03 uncommitted" belongs to 24-03).
+# An area path is indexed by every prefix ("ONE Digital\CRM and MA art"), every segment
+# ("CRM and MA art") and every word of a segment ("CRM", "MA").
+class CapabilityIndex:
+    def __init__(self, data):
+        self.index = data.index
+        self.ids = data["ID"].astype(str).to_numpy()
+        positions = pd.Series(np.arange(len(data)), index=data.index)
+
+        tags = explode_tokens(data["Tags"], r"\s*[,;]\s*")
+        self.pi_positions = group_positions(positions, [tags, tags.str.split(" ").str[0]])
+
+        # A sheet only has a handful of distinct area paths, so tokenise those and expand
+        # the result to the rows afterwards
+        path_codes, area_paths = pd.factorize(data["Area Path"].fillna("").astype(str))
+        path_tokens = pd.Series([area_path_keys(area_path) for area_path in area_paths], dtype=object).explode().dropna()
+        rows_per_path = pd.Series(np.arange(len(data))).groupby(path_codes).agg(list)
+        self.area_positions = {
+            token: frozenset(position for code in codes for position in rows_per_path.get(code, []))
+            for token, codes in path_tokens.index.to_series().groupby(path_tokens.to_numpy()).agg(list).items()
+        }
+
+    def positions_for(self, pi, area):
+        positions = self.pi_positions.get(pi, frozenset()) & self.area_positions.get(area, frozenset())
+        return np.sort(np.fromiter(positions, dtype=int, count=len(positions)))
+
+    def ids_for(self, pi, area):
+        return set(self.ids[self.positions_for(pi, area)])
+
+    def rows_for(self, pi, area):
+        # Row labels of the matching capabilities, in sheet order
+        return self.index[self.positions_for(pi, area)]
+
+    def area_rows(self, area):
+        # Row labels of all capabilities of an area, in sheet order
+        positions = self.area_positions.get(area, frozenset())
+        return self.index[np.sort(np.fromiter(positions, dtype=int, count=len(positions)))]
+
+# Prefixes, segments and segment words of one area path
+def area_path_keys(area_path):
+    segments = [segment.strip() for segment in area_path.split("\\") if segment.strip()]
+    prefixes = ["\\".join(segments[:i + 1]) for i in range(len(segments))]
+    words = [word for segment in segments for word in segment.split()]
+    return list(dict.fromkeys(prefixes + segments + words))
+
+# Split each value into tokens and return them as a Series indexed by row
+def explode_tokens(values, pattern):
+    tokens = values.fillna("").astype(str).str.split(pattern, regex=True).explode()
+    return tokens[tokens != ""]
+
+# Map every token to the set of row positions it occurs in
+def group_positions(positions, token_series):
+    tokens = pd.concat(token_series)
+    token_positions = pd.Series(positions.loc[tokens.index].to_numpy(), index=tokens.to_numpy())
+    return token_positions.groupby(level=0).agg(frozenset).to_dict()
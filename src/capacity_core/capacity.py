@@ -0,0 +1,288 @@
+import threading
+import numpy as np
+import pandas as pd
+from capacity_core.instrumentation import instrumented
+
+DAYS_OFF_COLUMNS = [f"Days Off Sprint {i}" for i in range(1, 6)]
+
+# Approaches compute_capacity knows; members of any other approach have no capacity
+APPROACHES = ("Velocity", "Percentages")
+
+# Roles that count towards the capacity when no role relevance was saved for a team and PI
+DEFAULT_RELEVANT_ROLES = ["Developer", "Tester"]
+
+# Vectorized capacity calculation. Member attributes are 1-D arrays (one entry per member),
+# days off is a members x sprints matrix and relevant is a boolean mask of the members whose
+# role counts towards the story point capacity. Approach, SP conversion and sprint duration
+# are either scalars or per-member arrays, so members of different teams can be mixed.
+def compute_capacity(fte, hours, sp_focus_factor, multiplier, days_off, relevant, approach, sp_conversion, sprint_duration):
+    fte = np.asarray(fte, dtype=float)
+    hours = np.asarray(hours, dtype=float)
+    sp_focus_factor = np.asarray(sp_focus_factor, dtype=float)
+    multiplier = np.asarray(multiplier, dtype=float)
+    days_off = np.asarray(days_off, dtype=float)
+    relevant = np.asarray(relevant, dtype=bool)
+    approach = np.asarray(approach)
+    sp_conversion = np.asarray(sp_conversion, dtype=float)
+    sprint_duration = np.asarray(sprint_duration, dtype=float)
+    if sprint_duration.ndim == 1:
+        sprint_duration = sprint_duration[:, np.newaxis]
+
+    sp_per_day = compute_sp_per_day(fte, hours, sp_focus_factor, multiplier, relevant, approach, sp_conversion)
+    capacity = (sprint_duration - days_off) * sp_per_day[:, np.newaxis]
+    capacity_per_sprint = capacity.sum(axis=0)
+    return capacity, capacity_per_sprint, capacity_per_sprint.sum()
+
+# Story points a member contributes per available day. The member arrays broadcast, so focus
+# factor and multiplier can also be trials x members samples.
+def compute_sp_per_day(fte, hours, sp_focus_factor, multiplier, relevant, approach, sp_conversion):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sp_per_day = np.select(
+            [approach == "Velocity", approach == "Percentages"],
+            [fte * sp_focus_factor * multiplier, (hours * fte / sp_conversion) * sp_focus_factor * multiplier],
+            0.0
+        )
+    return np.where(relevant, sp_per_day, 0.0)
+
+# Capacity of every team in every PI in one pass over the whole team member sheet. Approach,
+# SP conversion and sprint duration come from team_data (falling back to the given defaults),
+# role relevance from role_relevance (falling back to DEFAULT_RELEVANT_ROLES).
+@instrumented("compute")
+def compute_portfolio_capacity(team_member_data, team_data, role_relevance, sprint_duration=10, sp_conversion=8, pi_buffer=0.0):
+    keys = ["Team Name", "PI"]
+    sprint_columns = [f"Sprint {i + 1} Capacity (SP)" for i in range(len(DAYS_OFF_COLUMNS))]
+    if team_member_data.empty:
+        return pd.DataFrame(columns=keys + ["Team Members"] + sprint_columns + ["PI Capacity (SP)", "PI Capacity with Buffer (SP)"])
+
+    team_settings = team_data.drop_duplicates(keys, keep="first").set_index(keys)
+    settings_columns = [column for column in ["Approach", "SP Conversion", "Average Duration"] if column in team_settings.columns]
+    members = team_member_data.join(team_settings[settings_columns], on=keys)
+
+    relevance = role_relevance.drop_duplicates(keys + ["Role"], keep="last").set_index(keys + ["Role"])["Relevant"]
+    members = members.join(relevance, on=keys + ["Role"])
+    default_relevant = members["Role"].isin(DEFAULT_RELEVANT_ROLES)
+    relevant = members["Relevant"].where(members["Relevant"].notna(), default_relevant).astype(bool)
+
+    approach = members["Approach"].fillna("Velocity") if "Approach" in members else "Velocity"
+    conversion = members["SP Conversion"].fillna(sp_conversion) if "SP Conversion" in members else sp_conversion
+    duration = members["Average Duration"].fillna(sprint_duration) if "Average Duration" in members else sprint_duration
+
+    capacity, _, _ = compute_capacity(
+        members["FTE"].to_numpy(dtype=float),
+        members["Hours"].to_numpy(dtype=float),
+        members.get("SP Focus Factor (%)", pd.Series(0.0, index=members.index)).fillna(0.0).to_numpy(dtype=float),
+        members.get("Multiplier", pd.Series(1.0, index=members.index)).fillna(1.0).to_numpy(dtype=float),
+        members[DAYS_OFF_COLUMNS].fillna(0).to_numpy(dtype=float),
+        relevant.to_numpy(),
+        np.asarray(approach, dtype=object),
+        np.asarray(conversion, dtype=float),
+        np.asarray(duration, dtype=float)
+    )
+
+    # Sum the member rows of every (Team Name, PI) group
+    capacity_frame = pd.DataFrame(capacity, columns=sprint_columns, index=members.index)
+    capacity_frame[keys] = members[keys]
+    rollup = capacity_frame.groupby(keys, sort=True).sum()
+    rollup.insert(0, "Team Members", members.groupby(keys, sort=True).size())
+    rollup["PI Capacity (SP)"] = rollup[sprint_columns].sum(axis=1)
+    rollup["PI Capacity with Buffer (SP)"] = rollup["PI Capacity (SP)"] * (1 - pi_buffer)
+    return rollup.reset_index()
+
+# Team members of one team and PI as a struct of arrays: one array per attribute plus a
+# members x sprints days-off matrix. "rows" holds the row positions in the team member sheet.
+class MemberTable:
+    FIELDS = ["rows", "names", "roles", "hours", "fte", "sp_focus_factor", "multiplier", "days_off"]
+
+    def __init__(self, rows, names, roles, hours, fte, sp_focus_factor, multiplier, days_off):
+        self.rows = np.asarray(rows, dtype=int)
+        self.names = np.asarray(names, dtype=object)
+        self.roles = np.asarray(roles, dtype=object)
+        self.hours = np.asarray(hours, dtype=float)
+        self.fte = np.asarray(fte, dtype=float)
+        self.sp_focus_factor = np.asarray(sp_focus_factor, dtype=float)
+        self.multiplier = np.asarray(multiplier, dtype=float)
+        # Keep the sprint axis of an empty days-off matrix, -1 can't be inferred from zero rows
+        days_off = np.asarray(days_off, dtype=float)
+        self.days_off = days_off.reshape(len(self.rows), days_off.shape[1] if days_off.ndim == 2 else -1)
+
+    @classmethod
+    def from_frame(cls, data):
+        # Focus factor and multiplier default to 0.0 and 1.0 if the sheet has no such column
+        return cls(
+            data.index.to_numpy(),
+            data["Name"].to_numpy(dtype=object),
+            data["Role"].to_numpy(dtype=object),
+            data["Hours"].to_numpy(dtype=float),
+            data["FTE"].to_numpy(dtype=float),
+            data["SP Focus Factor (%)"].to_numpy(dtype=float) if "SP Focus Factor (%)" in data else np.zeros(len(data)),
+            data["Multiplier"].to_numpy(dtype=float) if "Multiplier" in data else np.ones(len(data)),
+            data[DAYS_OFF_COLUMNS].to_numpy(dtype=float)
+        )
+
+    @classmethod
+    def concat(cls, tables):
+        return cls(*[np.concatenate([getattr(table, field) for table in tables]) for field in cls.FIELDS])
+
+    def take(self, positions):
+        return MemberTable(*[getattr(self, field)[positions] for field in self.FIELDS])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def relevance_mask(self, role_relevance_dict):
+        return np.array([bool(role_relevance_dict.get(role, False)) for role in self.roles], dtype=bool)
+
+    # Compatibility accessor for code that still works with one dict per member
+    def to_dicts(self):
+        return [
+            {
+                "row": row,
+                "name": name,
+                "role": role,
+                "hours": hours,
+                "fte": fte,
+                "days_off": days_off,
+                "sp_focus_factor": sp_focus_factor,
+                "multiplier": multiplier
+            }
+            for row, name, role, hours, fte, sp_focus_factor, multiplier, days_off in zip(
+                self.rows.tolist(), self.names.tolist(), self.roles.tolist(), self.hours.tolist(), self.fte.tolist(),
+                self.sp_focus_factor.tolist(), self.multiplier.tolist(), self.days_off.tolist()
+            )
+        ]
+
+# Arrays compute_capacity takes, from a MemberTable or the member dicts of get_team_members
+def members_to_arrays(team_members, num_sprints, role_relevance_dict):
+    if isinstance(team_members, MemberTable):
+        return (team_members.fte, team_members.hours, team_members.sp_focus_factor, team_members.multiplier,
+                team_members.days_off[:, :num_sprints], team_members.relevance_mask(role_relevance_dict))
+    fte = np.array([member["fte"] for member in team_members], dtype=float)
+    hours = np.array([member["hours"] for member in team_members], dtype=float)
+    sp_focus_factor = np.array([member["sp_focus_factor"] for member in team_members], dtype=float)
+    multiplier = np.array([member.get("multiplier", 1.0) for member in team_members], dtype=float)
+    days_off = np.array([member["days_off"][:num_sprints] for member in team_members], dtype=float).reshape(len(team_members), num_sprints)
+    relevant = np.array([bool(role_relevance_dict.get(member["role"], False)) for member in team_members], dtype=bool)
+    return fte, hours, sp_focus_factor, multiplier, days_off, relevant
+
+# Member capacities as nested lists. With an unknown approach relevant members get no sprint
+# capacities at all, an empty list, as they always did.
+def capacity_lists(capacity, relevant, approach):
+    if approach in APPROACHES:
+        return capacity.tolist()
+    return [[] if member_relevant else member_capacity for member_capacity, member_relevant in zip(capacity.tolist(), relevant)]
+
+# Capacity matrix of a team as nested lists (members x sprints)
+@instrumented("compute")
+def calculate_capacity(team_members, approach, sp_conversion, sprint_duration, num_sprints, role_relevance_dict):
+    arrays = members_to_arrays(team_members, num_sprints, role_relevance_dict)
+    capacity, _, _ = compute_capacity(*arrays, approach, sp_conversion, sprint_duration)
+    return capacity_lists(capacity, arrays[-1], approach)
+
+# Member capacities plus sprint and PI totals of a team, without and with the PI buffer
+@instrumented("compute")
+def calculate_team_capacity(team_members, pi_buffer, approach, sp_conversion, sprint_duration=10, num_sprints=5, role_relevance_dict={}):
+    if not team_members:
+        return [], [], [], 0, 0
+    arrays = members_to_arrays(team_members, num_sprints, role_relevance_dict)
+    capacity, capacity_per_sprint, capacity_pi = compute_capacity(*arrays, approach, sp_conversion, sprint_duration)
+    member_capacities = capacity_lists(capacity, arrays[-1], approach)
+    if any(len(member_capacity) == 0 for member_capacity in member_capacities):
+        # A member without sprint capacities leaves no sprint to total up
+        return member_capacities, [], [], 0, 0
+    total_capacity_per_sprint_without_buffer = capacity_per_sprint.tolist()
+    total_capacity_per_sprint_with_buffer = (capacity_per_sprint * (1 - pi_buffer)).tolist()
+    total_capacity_pi_without_buffer = float(capacity_pi)
+    total_capacity_pi_with_buffer = float(capacity_pi * (1 - pi_buffer))
+    return member_capacities, total_capacity_per_sprint_without_buffer, total_capacity_per_sprint_with_buffer, total_capacity_pi_without_buffer, total_capacity_pi_with_buffer
+
+# Capacities of one team in one PI: the members, their capacity matrix (aligned with the
+# member rows) and the sprint totals, so single edits can be applied as deltas
+class LedgerGroup:
+    def __init__(self, settings, version, members):
+        self.settings = settings
+        self.version = version
+        self.members = members
+        self.capacity = self.member_capacity(members)
+        self.totals = self.capacity.sum(axis=0)
+
+    def member_capacity(self, members):
+        approach, sp_conversion, sprint_duration, num_sprints, relevance = self.settings
+        arrays = members_to_arrays(members, num_sprints, dict(relevance))
+        capacity, _, _ = compute_capacity(*arrays, approach, sp_conversion, sprint_duration)
+        return capacity
+
+    # Insert or replace the member in the given one-row table
+    def set_member(self, member):
+        new_capacity = self.member_capacity(member)
+        keep = self.members.rows != member.rows[0]
+        old_capacity = self.capacity[~keep].sum(axis=0)
+
+        members = MemberTable.concat([self.members.take(keep), member])
+        capacity = np.vstack([self.capacity[keep], new_capacity])
+        order = np.argsort(members.rows, kind="stable")
+        self.members = members.take(order)
+        self.capacity = capacity[order]
+        self.totals = self.totals + new_capacity[0] - old_capacity
+
+    def remove_member(self, row):
+        keep = self.members.rows != row
+        self.totals = self.totals - self.capacity[~keep].sum(axis=0)
+        self.members = self.members.take(keep)
+        self.capacity = self.capacity[keep]
+
+# Per-member contributions to the sprint totals, keyed by (file, team, PI) and member row.
+# Every group remembers the storage version it matches. Edits made through the team member UI
+# move a group to the new version by applying only the edited member's delta; any other write
+# leaves the group behind and it is rebuilt from the sheet on the next read.
+class CapacityLedger:
+    def __init__(self):
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    # settings: (approach, sp_conversion, sprint_duration, num_sprints, role relevance items)
+    def get(self, file_path, team_name, pi, settings, version):
+        with self._lock:
+            group = self._groups.get((file_path, team_name, pi))
+            if group is None or group.settings != settings or group.version != version:
+                return None
+            return group
+
+    def load(self, file_path, team_name, pi, settings, version, members):
+        group = LedgerGroup(settings, version, members)
+        with self._lock:
+            self._groups[(file_path, team_name, pi)] = group
+        return group
+
+    def discard(self, file_path, team_name, pi):
+        with self._lock:
+            self._groups.pop((file_path, team_name, pi), None)
+
+    # member is a one-row MemberTable
+    def update_member(self, file_path, team_name, pi, member, version_before, version_after):
+        with self._lock:
+            group = self._advance(file_path, team_name, pi, version_before, version_after)
+            if group is not None:
+                group.set_member(member)
+
+    def remove_member(self, file_path, team_name, pi, row, version_before, version_after):
+        with self._lock:
+            group = self._advance(file_path, team_name, pi, version_before, version_after)
+            if group is not None:
+                group.remove_member(row)
+            # Rows after the deleted one move up by one in the sheet
+            for (group_file, _, _), other_group in self._groups.items():
+                if group_file == file_path:
+                    other_group.members.rows = np.where(other_group.members.rows > row, other_group.members.rows - 1, other_group.members.rows)
+
+    def _advance(self, file_path, team_name, pi, version_before, version_after):
+        # Groups that were up to date stay valid for the new version; stale ones are dropped
+        for key in list(self._groups):
+            if key[0] != file_path:
+                continue
+            if self._groups[key].version == version_before:
+                self._groups[key].version = version_after
+            else:
+                del self._groups[key]
+        return self._groups.get((file_path, team_name, pi))
+
+capacity_ledger = CapacityLedger()
@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import tempfile
+import pandas as pd
+from capacity_core.write_coordinator import file_hash
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow  # noqa: F401 - only needed by pandas' Parquet reader and writer
+except ImportError:
+    pyarrow = None
+
+# Sidecar cache of a workbook's parsed sheets, one Parquet file per sheet next to the workbook:
+#
+#   test_data.xlsx
+#   .test_data.xlsx.cache/manifest.json
+#   .test_data.xlsx.cache/000-<hash>.parquet ...
+#
+# The manifest records the mtime, size and SHA-256 of the workbook the sheets were parsed from.
+# The cache is used while mtime and size match; if only the mtime changed (a copy or a touch)
+# the hash decides. Sheets Parquet can't hold, e.g. object columns mixing numbers and text, are
+# not cached; they are parsed from the workbook on their own. Without pyarrow the cache is
+# skipped and the workbook is always parsed.
+
+MANIFEST_NAME = "manifest.json"
+# Version 1 caches could hold pickled sheets, which are never loaded
+MANIFEST_VERSION = 2
+
+def cache_directory(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{name}.cache")
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+def write_atomic(path, write):
+    # Write through a temp file in the same directory and rename it over the target, so
+    # readers in other processes never see a half-written file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def write_manifest(directory, manifest):
+    def write(temp_path):
+        with open(temp_path, "w") as file:
+            json.dump(manifest, file, indent=1)
+    write_atomic(os.path.join(directory, MANIFEST_NAME), write)
+
+# Parsed sheets of the workbook from the cache, or None if there is no cache of this version of it.
+# verify compares the hash even if mtime and size match, for when two writes may have landed
+# within the file system's timestamp granularity.
+def load_cached_sheets(path, verify=False):
+    if pyarrow is None:
+        return None
+    directory = cache_directory(path)
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+
+    stat = os.stat(path)
+    source = manifest["source"]
+    if verify:
+        if source["size"] != stat.st_size or source["sha256"] != file_hash(path):
+            return None
+    elif (source["mtime_ns"], source["size"]) != (stat.st_mtime_ns, stat.st_size):
+        if source["size"] != stat.st_size or source["sha256"] != file_hash(path):
+            return None
+        # Same contents under a new mtime: keep the cache and skip the hash next time
+        source["mtime_ns"] = stat.st_mtime_ns
+        try:
+            write_manifest(directory, manifest)
+        except OSError:
+            pass
+
+    sheets = {}
+    try:
+        for entry in manifest["sheets"]:
+            sheets[entry["name"]] = pd.read_parquet(os.path.join(directory, entry["file"])) if entry["format"] == "parquet" else None
+        uncached = [sheet_name for sheet_name, data in sheets.items() if data is None]
+        if uncached:
+            sheets.update(pd.read_excel(path, sheet_name=uncached))
+    except Exception as e:
+        # Files replaced by a concurrent writer or damaged; parse the workbook instead
+        logger.warning("Ignoring the sheet cache of %s: %s", path, e)
+        return None
+    return sheets
+
+# Returns the format and file the sheet was stored in, or ("excel", None) if Parquet can't hold it
+def store_sheet(sheet_path, data):
+    try:
+        write_atomic(sheet_path + ".parquet", lambda temp_path: data.to_parquet(temp_path))
+        return "parquet", sheet_path + ".parquet"
+    except (TypeError, ValueError, pyarrow.ArrowException):
+        return "excel", None
+
+# Write the sheets parsed from the workbook to the cache, replacing the cache of older versions.
+# signature is the (mtime, size) of the workbook when it was parsed; if it changed since, the
+# sheets are already stale and nothing is written.
+def store_cached_sheets(path, signature, sheets):
+    if pyarrow is None:
+        return
+    directory = cache_directory(path)
+    try:
+        source_hash = file_hash(path)
+        stat = os.stat(path)
+        if (stat.st_mtime_ns, stat.st_size) != tuple(signature):
+            return
+        os.makedirs(directory, exist_ok=True)
+
+        # File names carry the workbook hash, so files of another version are never overwritten
+        # while a reader may still be loading them
+        entries = []
+        for position, (sheet_name, data) in enumerate(sheets.items()):
+            sheet_format, sheet_path = store_sheet(os.path.join(directory, f"{position:03d}-{source_hash[:16]}"), data)
+            entries.append({"name": sheet_name, "file": sheet_path and os.path.basename(sheet_path), "format": sheet_format})
+        write_manifest(directory, {
+            "version": MANIFEST_VERSION,
+            "source": {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": source_hash},
+            "sheets": entries,
+        })
+
+        current = {entry["file"] for entry in entries} | {MANIFEST_NAME}
+        for file_name in os.listdir(directory):
+            if file_name not in current and not file_name.endswith(".tmp"):
+                os.remove(os.path.join(directory, file_name))
+    except OSError as e:
+        # A read-only directory only costs the speed-up
+        logger.warning("Failed to write the sheet cache of %s: %s", path, e)
@@ -0,0 +1,108 @@
+import warnings
+import numpy as np
+import pandas as pd
+from capacity_core.instrumentation import instrumented
+
+# Forecast methods offered in the Velocity approach, mapped to the column holding their value
+FORECAST_METHODS = {
+    "Average": "Mean",
+    "Rolling Median": "Median",
+    "EWMA": "EWMA",
+    "Bootstrap P50": "P50",
+    "Bootstrap P85": "P85",
+}
+FORECAST_COLUMNS = ["Sprints Used", "Mean", "Median", "EWMA", "P50", "P85"]
+# Upper bound on the resampled values held in memory at once (trials x sprints x windows)
+BOOTSTRAP_CHUNK_VALUES = 1_000_000
+
+# Velocity forecasts over the same sprint windows as VelocityIndex.average: the num_sprints
+# sprints before the latest sprint of a PI, or of the team's latest sprint. Every window of every
+# team is computed in one batch. P85 is the velocity reached with 85% confidence, i.e. the 15th
+# percentile of the bootstrapped average velocities.
+class VelocityForecast:
+    def __init__(self, index, num_sprints, trials=500, span=None, seed=0):
+        self.index = index
+        self.num_sprints = num_sprints
+
+        # One window per distinct end row: the last sprint of every team and PI, and of every team
+        ends = np.unique(np.array(list(index.pi_last.values()) + [end - 1 for end in index.team_end.values()], dtype=int))
+        team_starts = np.array([index.team_start[team] for team in index.teams[ends]], dtype=int)
+        starts = np.maximum(team_starts, ends - num_sprints)
+        windows = window_matrix(index.velocities, starts, ends, num_sprints)
+
+        p50, p85 = bootstrap_percentiles(windows, [50, 15], trials, np.random.default_rng(seed))
+        with warnings.catch_warnings(), np.errstate(divide="ignore", invalid="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)
+            self.windows = pd.DataFrame({
+                "Start": starts,
+                "Sprints Used": ends - starts,
+                "Mean": np.nanmean(windows, axis=1),
+                "Median": np.nanmedian(windows, axis=1),
+                "EWMA": ewma(windows, ends - starts, span or num_sprints),
+                "P50": p50,
+                "P85": p85,
+            }, index=ends)
+
+    @instrumented("compute")
+    def forecast(self, team_name, pi, method):
+        # Forecast of one team and PI, with a warning and an info message like VelocityIndex.average
+        window = self.index.window(team_name, f"PI {pi}", self.num_sprints)
+        if window is None:
+            return 0, "No data available for the selected team.", ""
+        start, end = window
+        if end <= start:
+            return 0, "Insufficient sprints data available for the selected PI.", ""
+
+        row = self.windows.loc[end]
+        info_message = (
+            f"{method} velocity calculated from {self.index.sprints[start]} to {self.index.sprints[end - 1]} over {end - start} sprints "
+            f"(Bootstrap P50: {row['P50']:.1f}, P85: {row['P85']:.1f})."
+        )
+        return row[FORECAST_METHODS[method]], "", info_message
+
+    @instrumented("compute")
+    def table(self):
+        # Forecasts for every team and PI of the velocity sheet
+        keys = list(self.index.pi_last)
+        forecasts = self.windows.loc[[self.index.pi_last[key] for key in keys], FORECAST_COLUMNS].reset_index(drop=True)
+        forecasts.insert(0, "Team", [team for team, _ in keys])
+        forecasts.insert(1, "PI", [pi for _, pi in keys])
+        return forecasts
+
+# Velocities of each window as a row, padded with NaN up to num_sprints columns
+def window_matrix(velocities, starts, ends, num_sprints):
+    positions = starts[:, np.newaxis] + np.arange(num_sprints)[np.newaxis, :]
+    in_window = positions < ends[:, np.newaxis]
+    return np.where(in_window, velocities[np.minimum(positions, len(velocities) - 1)], np.nan)
+
+# Exponentially weighted mean of each window, the most recent sprint weighted highest
+def ewma(windows, lengths, span):
+    alpha = 2 / (span + 1)
+    ages = lengths[:, np.newaxis] - 1 - np.arange(windows.shape[1])[np.newaxis, :]
+    weights = np.where(np.isnan(windows) | (ages < 0), 0.0, (1 - alpha) ** np.maximum(ages, 0))
+    return (weights * np.nan_to_num(windows)).sum(axis=1) / weights.sum(axis=1)
+
+# Percentiles of the mean velocity of each window, resampling its sprints with replacement.
+# All windows share one trials x sprints draw, so a window's bands only depend on its own
+# velocities and the seed, not on which other teams are in the batch. Windows are processed
+# in chunks to bound the size of the windows x trials x sprints sample array.
+def bootstrap_percentiles(windows, percentiles, trials, rng):
+    counts = (~np.isnan(windows)).sum(axis=1)
+    # Move the non-missing velocities of each window to the front
+    packed = np.take_along_axis(windows, np.argsort(np.isnan(windows), axis=1, kind="stable"), axis=1)
+    results = np.full((len(percentiles), len(windows)), np.nan)
+    if windows.size == 0:
+        return results
+
+    draws = rng.random((trials, windows.shape[1]))
+    chunk = max(1, BOOTSTRAP_CHUNK_VALUES // (trials * windows.shape[1]))
+    for first in range(0, len(windows), chunk):
+        rows = slice(first, first + chunk)
+        chunk_counts = counts[rows]
+        picks = (draws[np.newaxis, :, :] * chunk_counts[:, np.newaxis, np.newaxis]).astype(int)
+        samples = packed[rows][np.arange(len(chunk_counts))[:, np.newaxis, np.newaxis], picks]
+        in_sample = np.arange(windows.shape[1])[np.newaxis, np.newaxis, :] < chunk_counts[:, np.newaxis, np.newaxis]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = np.where(in_sample, samples, 0.0).sum(axis=2) / chunk_counts[:, np.newaxis]
+        results[:, rows] = np.percentile(means, percentiles, axis=1)
+    return results
@@ -0,0 +1,248 @@
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+
+# Lightweight timing of the hot paths: the loaders, the capacity and velocity calculations and the
+# saves are wrapped in spans (instrumented / measure) that record their wall time, the rows a
+# loader returned and the bytes a save wrote to disk.
+#
+# Spans are collected per Streamlit rerun: app.py calls begin_run at the top of the script and
+# end_run at the bottom. Spans outside a run, e.g. saves on the write queue's worker thread, go to
+# a bounded list of background spans. Process-wide totals per operation are kept for monitoring
+# and can be exported as JSON or in the Prometheus text format.
+
+KINDS = ("load", "compute", "save")
+
+# Finished reruns and background spans kept for the sidebar panel and the JSON export
+HISTORY_SIZE = 20
+BACKGROUND_SIZE = 200
+
+class Span:
+    __slots__ = ("name", "kind", "depth", "started", "seconds", "rows", "bytes_written")
+
+    def __init__(self, name, kind, depth):
+        self.name = name
+        self.kind = kind
+        self.depth = depth
+        self.started = time.time()
+        self.seconds = 0.0
+        self.rows = None
+        self.bytes_written = 0
+
+    def to_dict(self):
+        return {
+            "name": self.name, "kind": self.kind, "depth": self.depth, "started": self.started,
+            "seconds": self.seconds, "rows": self.rows, "bytes_written": self.bytes_written,
+        }
+
+# The spans of one rerun. Span times are inclusive, so the totals only add up the outermost spans.
+class Run:
+    def __init__(self, label):
+        self.label = label
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.seconds = None
+        self.spans = []
+        self.bytes_written = 0
+
+    def totals(self):
+        top_level = [span for span in self.spans if span.depth == 0]
+        totals = {f"{kind}_seconds": sum(span.seconds for span in top_level if span.kind == kind) for kind in KINDS}
+        totals["rows_read"] = sum(span.rows or 0 for span in top_level if span.kind == "load")
+        totals["bytes_written"] = self.bytes_written
+        totals["seconds"] = self.seconds if self.seconds is not None else time.perf_counter() - self._start
+        return totals
+
+    # One line per operation: calls, total time, rows and bytes, slowest first
+    def breakdown(self):
+        return summarize(self.spans)
+
+    def to_dict(self):
+        return {"label": self.label, "started": self.started, **self.totals(), "spans": [span.to_dict() for span in self.spans]}
+
+def summarize(spans):
+    operations = {}
+    for span in spans:
+        operation = operations.setdefault((span.name, span.kind), {"name": span.name, "kind": span.kind, "calls": 0, "seconds": 0.0, "rows": 0, "bytes_written": 0})
+        operation["calls"] += 1
+        operation["seconds"] += span.seconds
+        operation["rows"] += span.rows or 0
+        operation["bytes_written"] += span.bytes_written
+    return sorted(operations.values(), key=lambda operation: operation["seconds"], reverse=True)
+
+_local = threading.local()
+_lock = threading.Lock()
+_history = deque(maxlen=HISTORY_SIZE)
+_background = deque(maxlen=BACKGROUND_SIZE)
+# (name, kind) -> [calls, seconds, rows, bytes written] since the process started
+_totals = {}
+_reruns = [0, 0.0]
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+def current_run():
+    return getattr(_local, "run", None)
+
+def begin_run(label="rerun"):
+    _local.run = Run(label)
+    _local.stack = []
+    return _local.run
+
+def end_run():
+    run = current_run()
+    if run is None:
+        return None
+    run.seconds = time.perf_counter() - run._start
+    _local.run = None
+    with _lock:
+        _history.append(run)
+        _reruns[0] += 1
+        _reruns[1] += run.seconds
+    return run
+
+def _record(span):
+    run = current_run()
+    if run is not None:
+        run.spans.append(span)
+    with _lock:
+        if run is None:
+            _background.append(span)
+        totals = _totals.setdefault((span.name, span.kind), [0, 0.0, 0, 0])
+        totals[0] += 1
+        totals[1] += span.seconds
+        totals[2] += span.rows or 0
+        totals[3] += span.bytes_written
+
+@contextmanager
+def measure(name, kind):
+    stack = _stack()
+    span = Span(name, kind, len(stack))
+    stack.append(span)
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        span.seconds = time.perf_counter() - start
+        stack.pop()
+        _record(span)
+
+# Called by the storage layer for every file it writes; counted for all open spans
+def add_bytes_written(count):
+    for span in _stack():
+        span.bytes_written += count
+    run = current_run()
+    if run is not None:
+        run.bytes_written += count
+
+def count_rows(result):
+    # A Series returned by a loader is a single row of a sheet
+    if isinstance(result, pd.Series):
+        return 1
+    if isinstance(result, (dict, str)) or not hasattr(result, "__len__"):
+        return None
+    return len(result)
+
+# Time every call of the decorated function as an operation of the given kind. detail names a
+# parameter whose value is added to the operation name, e.g. read_sheet[team_member_data].
+def instrumented(kind, detail=None, name=None):
+    def decorator(func):
+        label = name or func.__qualname__
+        position = list(inspect.signature(func).parameters).index(detail) if detail else None
+
+        @functools.wraps(func, updated=())
+        def wrapper(*args, **kwargs):
+            span_name = label
+            if detail:
+                value = args[position] if position < len(args) else kwargs.get(detail)
+                if value is not None:
+                    span_name = f"{label}[{value}]"
+            with measure(span_name, kind) as span:
+                result = func(*args, **kwargs)
+                if kind == "load":
+                    span.rows = count_rows(result)
+                return result
+        return wrapper
+    return decorator
+
+def recent_runs():
+    with _lock:
+        return list(_history)
+
+def background_spans():
+    with _lock:
+        return list(_background)
+
+def export_json(run=None):
+    if run is not None:
+        return json.dumps(run.to_dict(), indent=1)
+    with _lock:
+        runs = [run.to_dict() for run in _history]
+        background = [span.to_dict() for span in _background]
+        totals = [{"name": name, "kind": kind, "calls": calls, "seconds": seconds, "rows": rows, "bytes_written": bytes_written}
+                  for (name, kind), (calls, seconds, rows, bytes_written) in _totals.items()]
+    return json.dumps({"runs": runs, "background": background, "totals": totals}, indent=1)
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+PROMETHEUS_METRICS = [
+    ("capacity_operation_calls_total", "Calls of instrumented operations.", 0),
+    ("capacity_operation_seconds_total", "Wall time spent in instrumented operations, including nested ones.", 1),
+    ("capacity_operation_rows_total", "Rows returned by instrumented loaders.", 2),
+    ("capacity_operation_bytes_written_total", "Bytes written to disk by instrumented operations, including nested ones.", 3),
+]
+
+def prometheus_text():
+    with _lock:
+        totals = sorted(_totals.items())
+        reruns, rerun_seconds = _reruns
+    lines = []
+    for metric, help_text, field in PROMETHEUS_METRICS:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for (name, kind), values in totals:
+            lines.append(f'{metric}{{operation="{_label_value(name)}",kind="{kind}"}} {values[field]}')
+    lines += [
+        "# HELP capacity_reruns_total Instrumented Streamlit reruns.", "# TYPE capacity_reruns_total counter", f"capacity_reruns_total {reruns}",
+        "# HELP capacity_rerun_seconds_total Wall time of the instrumented reruns.", "# TYPE capacity_rerun_seconds_total counter", f"capacity_rerun_seconds_total {rerun_seconds}",
+    ]
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = prometheus_text(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = export_json(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+
+# Serve /metrics (Prometheus) and /metrics.json on the given port from a daemon thread, once per
+# process. Only local clients can connect unless host is set, e.g. "0.0.0.0" for all interfaces.
+def serve_metrics(port, host="127.0.0.1"):
+    global _server
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _server
@@ -0,0 +1,317 @@
+import bisect
+import datetime
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from capacity_core.write_coordinator import RowChanges, file_hash, same_value, sidecar_path
+from capacity_core.instrumentation import add_bytes_written
+
+logger = logging.getLogger(__name__)
+
+# Append-only journal of row-level changes next to the workbook (.<workbook>.journal.jsonl).
+# A save appends one JSON line with the RowChanges operations instead of rewriting the sheet;
+# readers apply the journal to the last stored sheets, and a background compactor folds the
+# journal into the workbook in batches. Folded entries move to .<workbook>.journal-archive.jsonl,
+# which keeps the full history of edits.
+#
+# Besides the operations, an entry records their effect on the rows: the sheet's length before,
+# the row positions removed and the rows added or changed. Queries apply these effects to the
+# rows the storage returns for their filters (JournalDelta), so they don't need the whole sheet.
+#
+# Folding the entries into the workbook and removing them from the journal are two steps. An
+# intent file written before the workbook records the entries and the hash of the workbook
+# before the write; after a crash in between, the entries are only removed if the workbook was
+# actually written, so no change is lost or applied twice.
+
+# Fold the journal once it holds this many entries, or after COMPACT_INTERVAL seconds
+COMPACT_BATCH = 200
+COMPACT_INTERVAL = 60
+
+def encode_value(value):
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, datetime.datetime):
+        return None if pd.isna(value) else {"__datetime__": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, dict):
+        return {str(key): encode_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    return str(value)
+
+def decode_value(value):
+    if isinstance(value, dict):
+        if "__datetime__" in value:
+            return pd.Timestamp(value["__datetime__"])
+        if "__date__" in value:
+            return datetime.date.fromisoformat(value["__date__"])
+        return {key: decode_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    return value
+
+def apply_entries(sheet_name, data, entries):
+    changes = RowChanges(sheet_name)
+    changes.operations = [operation for entry in entries for operation in entry["operations"]]
+    return changes.apply(data)
+
+# Marks every row with its position before the changes, to tell which rows they removed or changed
+ORIGIN_COLUMN = "__origin__"
+
+# Apply row changes to the whole sheet. Returns the new sheet, the positions the changes touched
+# and their effect on the rows (see JournalDelta), or None if they added columns.
+def apply_with_effects(changes, data):
+    marked = data.assign(**{ORIGIN_COLUMN: np.arange(len(data))})
+    changed_data, positions = changes.apply(marked)
+    origin = changed_data.pop(ORIGIN_COLUMN)
+    if list(changed_data.columns) != list(data.columns):
+        return changed_data, positions, None
+
+    kept = origin.notna().to_numpy()
+    kept_origin = origin[kept].to_numpy(dtype=int)
+    after = changed_data[kept].reset_index(drop=True)
+    before = data.iloc[kept_origin].reset_index(drop=True)
+    unchanged = ((after == before) | (after.isna() & before.isna())).all(axis=1).to_numpy()
+
+    touched = np.ones(len(changed_data), dtype=bool)
+    touched[np.flatnonzero(kept)[unchanged]] = False
+    effects = {
+        "length": len(data),
+        "removed": np.setdiff1d(np.arange(len(data)), kept_origin).tolist(),
+        "rows": [[int(position), row] for position, row in zip(np.flatnonzero(touched), changed_data[touched].to_dict("records"))],
+    }
+    return changed_data, positions, effects
+
+# Net effect of a sheet's journal entries on the stored rows: the stored row positions removed,
+# stored rows replaced and rows added after them. Applied to some of the stored rows, e.g. those of
+# one team and PI, it gives the same rows as applying the entries to the whole sheet and filtering.
+class JournalDelta:
+    def __init__(self, length):
+        self.length = length
+        self.removed = []
+        self.replaced = {}
+        self.added = []
+
+    # None if an entry doesn't record its effects or wasn't made on the rows the others leave
+    @classmethod
+    def from_entries(cls, entries):
+        if not entries or any(entry.get("effects") is None for entry in entries):
+            return None
+        delta = cls(entries[0]["effects"]["length"])
+        for entry in entries:
+            if not delta.add(entry["effects"]):
+                return None
+        return delta
+
+    def current_length(self):
+        return self.length - len(self.removed) + len(self.added)
+
+    # Position of the stored row at the given current position
+    def _stored_position(self, position):
+        stored = position
+        while True:
+            candidate = position + bisect.bisect_right(self.removed, stored)
+            if candidate == stored:
+                return stored
+            stored = candidate
+
+    def add(self, effects):
+        if effects["length"] != self.current_length():
+            return False
+        for position in sorted(effects["removed"], reverse=True):
+            kept = self.length - len(self.removed)
+            if position < kept:
+                stored = self._stored_position(position)
+                bisect.insort(self.removed, stored)
+                self.replaced.pop(stored, None)
+            else:
+                del self.added[position - kept]
+        for position, row in sorted(effects["rows"], key=lambda item: item[0]):
+            kept = self.length - len(self.removed)
+            if position < kept:
+                self.replaced[self._stored_position(position)] = row
+            elif position - kept < len(self.added):
+                self.added[position - kept] = row
+            else:
+                self.added.append(row)
+        return True
+
+    # Apply to stored rows indexed by their position, all rows of the sheet matching filters
+    def apply(self, data, filters):
+        def matches(row):
+            return all(column in row and same_value(row[column], value) for column, value in filters.items())
+
+        removed = np.asarray(self.removed, dtype=int)
+        data = data[~data.index.isin(removed) & ~data.index.isin(list(self.replaced))]
+        positions = [position for position, row in self.replaced.items() if matches(row)]
+        rows = [self.replaced[position] for position in positions]
+        kept = self.length - len(self.removed)
+        for offset, row in enumerate(self.added):
+            if matches(row):
+                # After the stored rows; the shift by the removed rows below makes it kept + offset
+                positions.append(kept + offset + len(removed))
+                rows.append(row)
+        if rows:
+            data = pd.concat([data, pd.DataFrame(rows, index=positions, columns=data.columns)])
+        index = data.index.to_numpy()
+        data.index = index - np.searchsorted(removed, index, side="left")
+        return data.sort_index()
+
+class ChangeJournal:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.path = sidecar_path(file_path, "journal.jsonl")
+        self.archive_path = sidecar_path(file_path, "journal-archive.jsonl")
+        self.intent_path = sidecar_path(file_path, "journal-intent.json")
+        self._entries = []
+        self._offset = 0
+        self._identity = None
+        self._lock = threading.Lock()
+
+    def signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    # Whether there may be entries to apply, without reading the journal
+    def may_have_entries(self):
+        signature = self.signature()
+        return (signature is not None and signature[1] > 0) or os.path.exists(self.intent_path)
+
+    def reset(self):
+        with self._lock:
+            self._entries, self._offset, self._identity = [], 0, None
+
+    # Read the lines appended since the last call; start over if the journal was replaced
+    def refresh(self):
+        with self._lock:
+            signature = self.signature()
+            if signature is None:
+                self._entries, self._offset, self._identity = [], 0, None
+                return
+            if signature[0] != self._identity or signature[1] < self._offset:
+                self._entries, self._offset, self._identity = [], 0, signature[0]
+            with open(self.path, "rb") as file:
+                file.seek(self._offset)
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break  # Partly written by another process, read it next time
+                    self._offset += len(line)
+                    entry = json.loads(line)
+                    entry["operations"] = decode_value(entry["operations"])
+                    entry["effects"] = decode_value(entry.get("effects"))
+                    self._entries.append(entry)
+
+    def entries(self, sheet_name=None):
+        with self._lock:
+            return [entry for entry in self._entries if sheet_name is None or entry["sheet"] == sheet_name]
+
+    # Append the operations of one save and their effects (see apply_with_effects); call with the
+    # workbook lock held. version is the sheet's version stamp once the save is done, so a writer
+    # knows which entries it read.
+    def append(self, sheet_name, operations, version=None, effects=None):
+        entry = {
+            "id": uuid.uuid4().hex,
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "sheet": sheet_name,
+            "version": version,
+            "operations": encode_value(operations),
+            "effects": encode_value(effects),
+        }
+        line = json.dumps(entry).encode() + b"\n"
+        with open(self.path, "ab") as file:
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+        add_bytes_written(len(line))
+        self.refresh()
+        return entry
+
+    # Around a write of the workbook that contains the given entries: record the intent, and
+    # once the workbook is written move the entries from the journal to the archive
+    @contextmanager
+    def folding(self, entry_ids):
+        intent = {"ids": list(entry_ids), "workbook_sha256": file_hash(self.file_path) if os.path.exists(self.file_path) else None}
+        self._write_json(self.intent_path, intent)
+        try:
+            yield
+        except BaseException:
+            os.remove(self.intent_path)
+            raise
+        self._remove(set(intent["ids"]))
+        os.remove(self.intent_path)
+
+    # Finish a fold interrupted by a crash; call with the workbook lock held
+    def recover(self):
+        try:
+            with open(self.intent_path) as file:
+                intent = json.load(file)
+        except (OSError, ValueError):
+            return
+        if os.path.exists(self.file_path) and file_hash(self.file_path) != intent["workbook_sha256"]:
+            self.refresh()
+            self._remove(set(intent["ids"]))
+        os.remove(self.intent_path)
+
+    def _remove(self, entry_ids):
+        self.refresh()
+        with self._lock:
+            folded = [entry for entry in self._entries if entry["id"] in entry_ids]
+            kept = [entry for entry in self._entries if entry["id"] not in entry_ids]
+        if folded:
+            with open(self.archive_path, "ab") as file:
+                file.writelines(self._line(entry) for entry in folded)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.writelines(self._line(entry) for entry in kept)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+        self.reset()
+        self.refresh()
+
+    def _line(self, entry):
+        return json.dumps({**entry, "operations": encode_value(entry["operations"]), "effects": encode_value(entry.get("effects"))}).encode() + b"\n"
+
+    def _write_json(self, path, value):
+        with open(path + ".tmp", "w") as file:
+            json.dump(value, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+
+# Background thread folding the journal into the workbook every COMPACT_INTERVAL seconds, or
+# as soon as COMPACT_BATCH entries piled up
+class JournalCompactor(threading.Thread):
+    def __init__(self, backend):
+        super().__init__(name=f"journal-compactor-{os.path.basename(backend.path)}", daemon=True)
+        self.backend = backend
+        self._wake = threading.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    def run(self):
+        while True:
+            self._wake.wait(COMPACT_INTERVAL)
+            self._wake.clear()
+            try:
+                self.backend.compact()
+            except Exception:
+                logger.exception("Failed to fold the journal into %s", self.backend.path)
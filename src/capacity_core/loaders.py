@@ -0,0 +1,303 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+import pandas as pd
+from capacity_core.storage import filter_rows, get_backend
+from capacity_core.sheet_cache import sheet_cache, sheets_written, invalidate_sheets
+from capacity_core.capacity import MemberTable, capacity_ledger
+from capacity_core.velocity import VelocityIndex
+from capacity_core.forecast import VelocityForecast
+from capacity_core.write_coordinator import RowChanges, workbook_lock, get_sheet_version, bump_sheet_versions, sync_with_writers
+from capacity_core.instrumentation import instrumented
+
+logger = logging.getLogger(__name__)
+
+# Raised when a sheet can't be used, e.g. because required columns are missing. Errors of the
+# storage itself (missing file or sheet) propagate unchanged.
+class CapacityDataError(Exception):
+    pass
+
+@instrumented("load", "sheet_name")
+def read_sheet(file_path, sheet_name):
+    # Sheets staged in an open write transaction take precedence over the stored contents
+    transaction = get_active_transaction(file_path)
+    if transaction is not None and sheet_name in transaction.dirty_sheets:
+        return transaction.dirty_sheets[sheet_name].copy()
+    return get_backend(file_path).read_sheet(sheet_name)
+
+@instrumented("load", "sheet_name")
+def query_sheet(file_path, sheet_name, filters):
+    # Rows matching all column == value filters; the SQLite backend pushes these down into SQL
+    transaction = get_active_transaction(file_path)
+    if transaction is not None and sheet_name in transaction.dirty_sheets:
+        return filter_rows(transaction.dirty_sheets[sheet_name], filters)
+    return get_backend(file_path).query(sheet_name, filters)
+
+# Rows of one team in one PI, keeping their row positions in the sheet as index
+@instrumented("load", "sheet_name")
+def get_team_pi_rows(file_path, sheet_name, team_name, pi):
+    return query_sheet(file_path, sheet_name, {"Team Name": team_name, "PI": pi})
+
+# First row of one team in one PI, or None
+@instrumented("load", "sheet_name")
+def get_team_pi_data(file_path, sheet_name, team_name, pi):
+    team_pi_data = get_team_pi_rows(file_path, sheet_name, team_name, pi)
+    if not team_pi_data.empty:
+        return team_pi_data.iloc[0]
+    else:
+        return None
+
+# Write whole sheets. base_versions maps a sheet to the version stamp it was read at; row changes
+# saved since are kept, other changes since raise WriteConflictError. A sheet written without a
+# base version conflicts while it has row changes that aren't folded into the workbook yet.
+@instrumented("save")
+def write_sheets(file_path, sheets, base_versions=None):
+    with workbook_lock(file_path):
+        get_backend(file_path).write_sheets(sheets, base_versions)
+        bump_sheet_versions(file_path, list(sheets))
+    sheets_written(file_path, list(sheets))
+
+def get_storage_version(file_path):
+    return get_backend(file_path).version()
+
+# A sheet and its version stamp, read under the workbook lock so the data is exactly the version
+# to pass as base_version when the sheet is written back
+@instrumented("load", "sheet_name")
+def read_sheet_at_version(file_path, sheet_name):
+    transaction = get_active_transaction(file_path)
+    if transaction is not None and sheet_name in transaction.dirty_sheets:
+        return transaction.dirty_sheets[sheet_name].copy(), transaction.base_versions.get(sheet_name)
+    with workbook_lock(file_path):
+        sync_with_writers(file_path, get_backend(file_path))
+        return get_backend(file_path).read_sheet(sheet_name), get_sheet_version(file_path, sheet_name)
+
+# Collects the sheets written during a rerun and flushes them to the workbook in one go.
+# Row changes are kept next to the staged sheets and recorded in the change journal when the
+# transaction is flushed, applied to the sheet's rows as they are then.
+class WorkbookTransaction:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.dirty_sheets = {}
+        self.base_versions = {}
+        self.whole_sheets = set()
+        self.row_changes = {}
+
+    def stage(self, sheet_name, data, base_version):
+        self.dirty_sheets[sheet_name] = data.copy()
+        self.whole_sheets.add(sheet_name)
+        if base_version is not None:
+            self.base_versions.setdefault(sheet_name, base_version)
+
+    def stage_rows(self, changes):
+        sheet_name = changes.sheet_name
+        if sheet_name not in self.dirty_sheets:
+            current = get_backend(self.file_path).read_sheet(sheet_name)
+        else:
+            current = self.dirty_sheets[sheet_name]
+        self.dirty_sheets[sheet_name], positions = changes.apply(current)
+        self.row_changes.setdefault(sheet_name, []).append(changes)
+        return positions
+
+    @instrumented("save")
+    def flush(self):
+        if self.dirty_sheets:
+            with workbook_lock(self.file_path):
+                whole_sheets = {sheet_name: self.dirty_sheets[sheet_name] for sheet_name in self.whole_sheets}
+                if whole_sheets:
+                    write_sheets(self.file_path, whole_sheets, self.base_versions)
+                # Sheets only changed row by row go to the journal, applied to their current rows
+                row_sheets = [sheet_name for sheet_name in self.row_changes if sheet_name not in self.whole_sheets]
+                if row_sheets:
+                    backend = get_backend(self.file_path)
+                    sync_with_writers(self.file_path, backend)
+                    for sheet_name in row_sheets:
+                        version = get_sheet_version(self.file_path, sheet_name) + 1
+                        for changes in self.row_changes[sheet_name]:
+                            backend.append_rows(changes, version)
+                    bump_sheet_versions(self.file_path, row_sheets)
+                    sheets_written(self.file_path, row_sheets)
+            logger.info("Data saved to %s in sheets %s", self.file_path, ", ".join(self.dirty_sheets))
+        self.dirty_sheets = {}
+
+# Open transactions per thread, so concurrent Streamlit sessions don't share staged sheets
+_active_transactions = threading.local()
+
+def get_active_transaction(file_path):
+    transactions = getattr(_active_transactions, "by_file", {})
+    return transactions.get(os.path.abspath(file_path))
+
+@contextmanager
+def workbook_transaction(file_path):
+    # Nested transactions on the same file join the outer one and flush with it
+    transaction = get_active_transaction(file_path)
+    if transaction is not None:
+        yield transaction
+        return
+
+    if not hasattr(_active_transactions, "by_file"):
+        _active_transactions.by_file = {}
+    key = os.path.abspath(file_path)
+    transaction = WorkbookTransaction(file_path)
+    _active_transactions.by_file[key] = transaction
+    try:
+        yield transaction
+        transaction.flush()
+    finally:
+        del _active_transactions.by_file[key]
+        # Cached results computed from staged sheets must not outlive a failed transaction
+        if transaction.dirty_sheets:
+            invalidate_sheets(file_path, list(transaction.dirty_sheets))
+
+@instrumented("load", "sheet_name")
+def load_team_data(file_path, sheet_name):
+    data = read_sheet(file_path, sheet_name)
+
+    # Check for required columns
+    required_columns = ["Team Name", "PI", "Approach"]
+    missing_columns = [col for col in required_columns if col not in data.columns]
+    if missing_columns:
+        raise CapacityDataError(f"Missing columns in data: {missing_columns}")
+    return data
+
+# Write a whole sheet. base_version is the sheet's version stamp when data was read (see
+# read_sheet_at_version): row changes saved since are applied to data, any other change since
+# fails the write with WriteConflictError instead of being overwritten.
+@instrumented("save", "sheet_name")
+def save_data(file_path, sheet_name, data, base_version):
+    # Ensure data is a DataFrame
+    if not isinstance(data, pd.DataFrame):
+        raise ValueError("Data must be a pandas DataFrame")
+
+    # Inside a write transaction only stage the sheet, it is written when the transaction ends
+    transaction = get_active_transaction(file_path)
+    if transaction is not None:
+        transaction.stage(sheet_name, data, base_version)
+        invalidate_sheets(file_path, [sheet_name])
+        return
+
+    write_sheets(file_path, {sheet_name: data}, {sheet_name: base_version})
+    logger.info("Data saved to %s in sheet %s", file_path, sheet_name)
+
+# Result of save_rows: the written sheet, the row position each change touched and the storage
+# version just before and after the write
+class RowSave:
+    def __init__(self, data, positions, version_before, version_after):
+        self.data = data
+        self.positions = positions
+        self.version_before = version_before
+        self.version_after = version_after
+
+# Apply row-level changes to the sheet as it currently is and record them in the change journal,
+# holding the workbook lock so no other writer can come in between
+@instrumented("save")
+def save_rows(file_path, changes):
+    transaction = get_active_transaction(file_path)
+    if transaction is not None:
+        positions = transaction.stage_rows(changes)
+        invalidate_sheets(file_path, [changes.sheet_name])
+        data = transaction.dirty_sheets[changes.sheet_name]
+        return RowSave(data, positions, None, None)
+
+    with workbook_lock(file_path):
+        backend = get_backend(file_path)
+        sync_with_writers(file_path, backend)
+        version_before = get_storage_version(file_path)
+        data, positions = backend.append_rows(changes, get_sheet_version(file_path, changes.sheet_name) + 1)
+        bump_sheet_versions(file_path, [changes.sheet_name])
+        version_after = get_storage_version(file_path)
+    sheets_written(file_path, [changes.sheet_name])
+    logger.info("Data saved to %s in sheet %s (journal)", file_path, changes.sheet_name)
+    return RowSave(data, positions, version_before, version_after)
+
+@instrumented("load", "sheet_name")
+def get_latest_team_data(file_path, team_name, sheet_name):
+    data = load_team_data(file_path, sheet_name)
+    team_data = data[data["Team Name"] == team_name]
+    if not team_data.empty:
+        latest_pi = team_data["PI"].max()
+        latest_data = team_data[team_data["PI"] == latest_pi].iloc[0]
+        return latest_data
+    else:
+        return None
+
+@instrumented("save", "sheet_name")
+def update_team_data(file_path, new_data, sheet_name):
+    # Explicitly cast the new data to the expected types
+    column_types = {
+        "Average Velocity": float,
+        "Average Duration": float,
+        "Average Team Members": int,
+        "SP Focus Factor": float,
+        "Approach": str
+    }
+    new_data = {key: column_types[key](value) if key in column_types else value for key, value in new_data.items()}
+
+    # Update the team's row of the PI, or add it if the team has none yet
+    changes = RowChanges(sheet_name)
+    changes.upsert(new_data)
+    save_rows(file_path, changes)
+
+# Values of the first column of a dropdown sheet
+@instrumented("load", "sheet_name")
+def load_options(file_path, sheet_name):
+    return read_sheet(file_path, sheet_name).iloc[:, 0].tolist()
+
+@instrumented("load", "sheet_name")
+@sheet_cache("sheet_name")
+def get_team_members(file_path, sheet_name, team_name, pi, as_table=False):
+    # as_table returns a columnar MemberTable, otherwise one dict per member
+    team_members = MemberTable.from_frame(get_team_pi_rows(file_path, sheet_name, team_name, pi))
+    return team_members if as_table else team_members.to_dicts()
+
+# Sorted velocity sheet with prefix sums, built once per version of the velocity sheet
+@instrumented("load", "velocity_sheet_name")
+@sheet_cache("velocity_sheet_name", maxsize=8, copy_results=False)
+def get_velocity_index(file_path, velocity_sheet_name):
+    return VelocityIndex(read_sheet(file_path, velocity_sheet_name))
+
+# Velocity forecasts of every team over windows of num_sprints sprints, per velocity sheet version
+@instrumented("compute", "velocity_sheet_name")
+@sheet_cache("velocity_sheet_name", maxsize=32, copy_results=False)
+def get_velocity_forecast(file_path, velocity_sheet_name, num_sprints):
+    return VelocityForecast(get_velocity_index(file_path, velocity_sheet_name), num_sprints)
+
+@instrumented("compute")
+def calculate_average_team_members(file_path, team_name, pi, sheet_name):
+    filtered_data = get_team_pi_rows(file_path, sheet_name, team_name, f"PI {pi}")
+    if not filtered_data.empty:
+        return filtered_data['Team Members'].mean()
+    return 0  # Return 0 if no data available
+
+@instrumented("load", "sheet_name")
+@sheet_cache("sheet_name")
+def load_role_relevance(file_path, sheet_name, team_name, pi):
+    relevance_data = get_team_pi_rows(file_path, sheet_name, team_name, pi)
+    return relevance_data.set_index("Role")["Relevant"].to_dict()
+
+@instrumented("save", "sheet_name")
+def save_role_relevance(file_path, sheet_name, team_name, pi, role_relevance_dict):
+    changes = RowChanges(sheet_name)
+    changes.replace({"Team Name": team_name, "PI": pi}, [
+        {"Team Name": team_name, "PI": pi, "Role": role, "Relevant": relevant}
+        for role, relevant in role_relevance_dict.items()
+    ])
+    save_rows(file_path, changes)
+
+# Member capacities of a team from the capacity ledger; only rebuilt from the sheet when the
+# stored data changed other than through the team member UI, or the settings changed
+@instrumented("compute")
+def get_team_capacity(file_path, team_member_sheet_name, team_name, pi, approach, sp_conversion, role_relevance_dict, sprint_duration=10, num_sprints=5):
+    settings = (approach, sp_conversion, sprint_duration, num_sprints, tuple(sorted(role_relevance_dict.items())))
+    version = get_storage_version(file_path)
+    group = capacity_ledger.get(file_path, team_name, pi, settings, version)
+    if group is None:
+        team_members = get_team_members(file_path, team_member_sheet_name, team_name, pi, as_table=True)
+        group = capacity_ledger.load(file_path, team_name, pi, settings, version, team_members)
+    return group
+
+# Drop the capacity ledger entry of one team and PI, so its capacity is rebuilt from the team
+# members. The sheet caches are left alone: they already reload a sheet once its version or the
+# stored workbook changed, and evicting them would drop the sheets for every team and user.
+def refresh_team_data(file_path, team_name, pi):
+    capacity_ledger.discard(file_path, team_name, pi)
@@ -0,0 +1,125 @@
+import copy
+import functools
+import inspect
+import threading
+from collections import OrderedDict
+from capacity_core.storage import get_backend
+
+# Version counter per (file, sheet). Every write to a sheet bumps its counter, which evicts
+# exactly the cache entries that were computed from that sheet.
+_sheet_versions = {}
+# Storage version last seen per file, to notice writes made outside this process
+_storage_versions = {}
+_cached_functions = []
+_lock = threading.RLock()
+
+def get_sheet_version(file_path, sheet_name):
+    return _sheet_versions.get((file_path, sheet_name), 0)
+
+def invalidate_sheets(file_path, sheet_names):
+    with _lock:
+        for sheet_name in sheet_names:
+            _sheet_versions[(file_path, sheet_name)] = get_sheet_version(file_path, sheet_name) + 1
+        for cached_function in _cached_functions:
+            cached_function.evict(file_path, sheet_names)
+
+def sheets_written(file_path, sheet_names):
+    # Called by the write path after the sheets were stored
+    with _lock:
+        invalidate_sheets(file_path, sheet_names)
+        _storage_versions[file_path] = get_backend(file_path).version()
+
+def _check_storage_version(file_path):
+    # If the file changed without going through sheets_written, every sheet of it may be stale
+    version = get_backend(file_path).version()
+    with _lock:
+        known_version = _storage_versions.get(file_path)
+        _storage_versions[file_path] = version
+        if known_version is not None and known_version != version:
+            stale_sheets = [sheet for (path, sheet) in _sheet_versions if path == file_path]
+            for cached_function in _cached_functions:
+                stale_sheets += [sheet for (path, sheet) in cached_function.dependencies() if path == file_path]
+            invalidate_sheets(file_path, set(stale_sheets))
+
+def _freeze(value):
+    # Hashable stand-in for argument values such as the role relevance dict
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+class SheetCache:
+    def __init__(self, func, sheet_params, maxsize, copy_results=True):
+        self.func = func
+        self.sheet_params = sheet_params
+        self.maxsize = maxsize
+        self.copy_results = copy_results
+        self.signature = inspect.signature(func)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        functools.update_wrapper(self, func)
+
+    def __call__(self, *args, **kwargs):
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        file_path = bound.arguments["file_path"]
+        _check_storage_version(file_path)
+
+        dependencies = tuple((file_path, bound.arguments[param]) for param in self.sheet_params)
+        versions = tuple(get_sheet_version(*dependency) for dependency in dependencies)
+        key = (_freeze(tuple(bound.arguments.items())), versions)
+
+        with _lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self._result(self.entries[key][1])
+            self.misses += 1
+
+        value = self.func(*args, **kwargs)
+
+        with _lock:
+            # Only store the result if none of its sheets were written while computing it
+            if versions == tuple(get_sheet_version(*dependency) for dependency in dependencies):
+                self.entries[key] = (dependencies, value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return self._result(value)
+
+    def _result(self, value):
+        # Callers get their own copy unless the cached value is never modified after it is built
+        return copy.deepcopy(value) if self.copy_results else value
+
+    def dependencies(self):
+        return {dependency for dependencies, _ in self.entries.values() for dependency in dependencies}
+
+    def evict(self, file_path, sheet_names):
+        stale_keys = [
+            key for key, (dependencies, _) in self.entries.items()
+            if any(path == file_path and sheet in sheet_names for path, sheet in dependencies)
+        ]
+        for key in stale_keys:
+            del self.entries[key]
+
+    def clear(self):
+        with _lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.maxsize}
+
+# Cache a loader on its arguments and the versions of the sheets it reads. sheet_params names
+# the parameters holding sheet names; the function must also take a file_path parameter.
+# copy_results=False hands out the cached object itself, for read-only results such as indexes.
+def sheet_cache(*sheet_params, maxsize=128, copy_results=True):
+    def decorator(func):
+        cached_function = SheetCache(func, sheet_params, maxsize, copy_results)
+        _cached_functions.append(cached_function)
+        return cached_function
+    return decorator
+
+def cache_stats():
+    return {cached_function.__qualname__: cached_function.stats() for cached_function in _cached_functions}
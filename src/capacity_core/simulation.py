@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+from capacity_core.capacity import compute_sp_per_day
+from capacity_core.instrumentation import instrumented
+
+# Upper bound on the trials x members x sprints values held in memory at once
+SIMULATION_CHUNK_VALUES = 1_000_000
+DEFAULT_PERCENTILES = (10, 50, 90)
+
+# Monte Carlo simulation of the capacity of one team. Every trial perturbs the plan:
+# - unplanned days off per member and sprint, Poisson distributed with absence_rate days per
+#   working day, never more than the days left in the sprint;
+# - the focus factor of every member for the whole PI, lognormal around the planned value
+#   with focus_factor_spread as sigma;
+# - the multiplier of every member for the whole PI, lognormal with multiplier_spread as sigma
+#   and capped at max(planned multiplier, 1), so onboarding members can ramp up but not beyond
+#   a full member.
+# Trials are computed in chunks as trials x members x sprints arrays. Returns the capacity
+# percentiles as a DataFrame with one row per percentile ("P10", ...) and one column per
+# sprint plus "PI". A percentile is the capacity that is not reached in that share of trials.
+@instrumented("compute")
+def simulate_capacity(fte, hours, sp_focus_factor, multiplier, days_off, relevant, approach, sp_conversion, sprint_duration,
+                      trials=10000, absence_rate=0.03, focus_factor_spread=0.15, multiplier_spread=0.1,
+                      percentiles=DEFAULT_PERCENTILES, seed=0):
+    fte = np.asarray(fte, dtype=float)
+    hours = np.asarray(hours, dtype=float)
+    sp_focus_factor = np.asarray(sp_focus_factor, dtype=float)
+    multiplier = np.asarray(multiplier, dtype=float)
+    days_off = np.asarray(days_off, dtype=float)
+    relevant = np.asarray(relevant, dtype=bool)
+    approach = np.asarray(approach)
+    sprint_duration = float(sprint_duration)
+    num_members, num_sprints = days_off.shape
+    rng = np.random.default_rng(seed)
+
+    # Days that can still be lost per member and sprint
+    days_available = np.maximum(sprint_duration - days_off, 0.0)
+    multiplier_cap = np.maximum(multiplier, 1.0)
+
+    capacity_per_sprint = np.empty((trials, num_sprints))
+    chunk = max(1, SIMULATION_CHUNK_VALUES // max(1, num_members * num_sprints))
+    for first in range(0, trials, chunk):
+        chunk_trials = min(chunk, trials - first)
+        focus_factor = sp_focus_factor * rng.lognormal(0.0, focus_factor_spread, (chunk_trials, num_members))
+        member_multiplier = np.minimum(multiplier * rng.lognormal(0.0, multiplier_spread, (chunk_trials, num_members)), multiplier_cap)
+        sp_per_day = compute_sp_per_day(fte, hours, focus_factor, member_multiplier, relevant, approach, sp_conversion)
+
+        unplanned_days_off = np.minimum(rng.poisson(absence_rate * sprint_duration, (chunk_trials, num_members, num_sprints)), days_available)
+        capacity = (sprint_duration - days_off - unplanned_days_off) * sp_per_day[:, :, np.newaxis]
+        capacity_per_sprint[first:first + chunk_trials] = capacity.sum(axis=1)
+
+    sprint_percentiles = np.percentile(capacity_per_sprint, percentiles, axis=0)
+    pi_percentiles = np.percentile(capacity_per_sprint.sum(axis=1), percentiles)
+    result = pd.DataFrame(sprint_percentiles, index=[f"P{p}" for p in percentiles], columns=[f"Sprint {i + 1}" for i in range(num_sprints)])
+    result["PI"] = pi_percentiles
+    return result
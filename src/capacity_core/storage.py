@@ -0,0 +1,496 @@
+import argparse
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
+import pandas as pd
+from capacity_core.columnar_cache import load_cached_sheets, store_cached_sheets
+from capacity_core.journal import COMPACT_BATCH, ChangeJournal, JournalCompactor, JournalDelta, apply_entries, apply_with_effects
+from capacity_core.write_coordinator import WriteConflictError, get_sheet_version, workbook_lock
+from capacity_core.instrumentation import add_bytes_written
+
+logger = logging.getLogger(__name__)
+
+# Columns each sheet is typically filtered on. The SQLite backend indexes them, so lookups
+# for one team and PI don't have to scan the whole table.
+INDEXED_COLUMNS = {
+    "team_member_data": ["Team Name", "PI"],
+    "team_data": ["Team Name", "PI"],
+    "role_relevance": ["Team Name", "PI"],
+    "team_velocity": ["Team", "Year", "PI", "Sprint"],
+}
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+# Columns the UIs select a team's rows for one PI by
+TEAM_PI_COLUMNS = ("Team Name", "PI")
+
+# A sheet frame plus the row positions of every (Team Name, PI) pair, built once per snapshot,
+# so selecting one team and PI is a lookup instead of a boolean mask over the whole sheet
+class TeamPIIndex:
+    def __init__(self, data):
+        self.data = data
+        self.positions = data.groupby(list(TEAM_PI_COLUMNS), sort=False, dropna=True).indices
+
+    def rows(self, team_name, pi):
+        positions = self.positions.get((team_name, pi), [])
+        return self.data.iloc[positions]
+
+# Rows of the frame where every column in filters equals the given value
+def filter_rows(data, filters):
+    mask = pd.Series(True, index=data.index)
+    for column, value in filters.items():
+        mask &= data[column] == value
+    return data[mask]
+
+# Common interface of the storage engines behind the capacity_core loaders.
+# Every sheet is exposed as a DataFrame whose index is the row position in the sheet.
+class StorageBackend:
+    def __init__(self, path):
+        self.path = path
+
+    def sheet_names(self):
+        raise NotImplementedError
+
+    def read_sheet(self, sheet_name):
+        raise NotImplementedError
+
+    def query(self, sheet_name, filters):
+        return filter_rows(self.read_sheet(sheet_name), filters)
+
+    def write_sheets(self, sheets):
+        raise NotImplementedError
+
+    def invalidate(self):
+        pass
+
+    def refresh(self):
+        # Drop everything held in memory, even if the file looks unchanged; used when another
+        # process wrote the storage, possibly within the same mtime tick
+        self.invalidate()
+
+    def version(self):
+        # Changes whenever the stored data changes; used to tell whether derived data is stale
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+class ExcelBackend(StorageBackend):
+    # Keep a Parquet copy of the parsed sheets next to the workbook (see columnar_cache)
+    use_columnar_cache = True
+
+    def __init__(self, path):
+        super().__init__(path)
+        # Parsed sheets plus the (mtime, size) signature of the file they were parsed from,
+        # so a changed file is picked up on the next read
+        self._snapshot = None
+        self._indexes = {}
+        self._verify_cache = False
+        self._lock = threading.Lock()
+
+    def load_snapshot(self):
+        signature = self.version()
+        with self._lock:
+            if self._snapshot is None or self._snapshot[0] != signature:
+                # Load the sheets from the columnar cache if it matches the file, otherwise parse
+                # every sheet in one go instead of reopening the file per loader
+                sheets = load_cached_sheets(self.path, self._verify_cache) if self.use_columnar_cache else None
+                self._verify_cache = False
+                if sheets is None:
+                    sheets = pd.read_excel(self.path, sheet_name=None)
+                    if self.use_columnar_cache:
+                        store_cached_sheets(self.path, signature, sheets)
+                self._snapshot = (signature, sheets)
+                self._indexes = {}
+            return self._snapshot[1]
+
+    def team_pi_index(self, sheet_name):
+        sheets = self.load_snapshot()
+        with self._lock:
+            index = self._indexes.get(sheet_name)
+            if index is None or index.data is not sheets[sheet_name]:
+                index = TeamPIIndex(sheets[sheet_name])
+                self._indexes[sheet_name] = index
+            return index
+
+    def sheet_names(self):
+        return list(self.load_snapshot())
+
+    def read_sheet(self, sheet_name):
+        sheets = self.load_snapshot()
+        if sheet_name not in sheets:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+        # Hand out a copy so callers can modify their frame without touching the snapshot
+        return sheets[sheet_name].copy()
+
+    def query(self, sheet_name, filters):
+        sheets = self.load_snapshot()
+        if sheet_name not in sheets:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+        if set(filters) == set(TEAM_PI_COLUMNS) and set(TEAM_PI_COLUMNS) <= set(sheets[sheet_name].columns):
+            return self.team_pi_index(sheet_name).rows(filters["Team Name"], filters["PI"])
+        return filter_rows(sheets[sheet_name], filters).copy()
+
+    def write_sheets(self, sheets):
+        # Write all given sheets in a single open/write/close of the workbook. The new workbook
+        # is built in a temp file next to the original and then renamed over it, so a crash
+        # mid-write never leaves a half-written file behind.
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(suffix=".xlsx", dir=directory)
+        os.close(fd)
+        try:
+            if os.path.exists(self.path):
+                shutil.copyfile(self.path, temp_path)
+                # mkstemp creates the file readable by its owner only; keep the workbook's mode
+                shutil.copymode(self.path, temp_path)
+                writer = pd.ExcelWriter(temp_path, engine="openpyxl", mode="a", if_sheet_exists="replace")
+            else:
+                writer = pd.ExcelWriter(temp_path, engine="openpyxl")
+            with writer:
+                for sheet_name, data in sheets.items():
+                    data.to_excel(writer, sheet_name=sheet_name, index=False)
+            add_bytes_written(os.path.getsize(temp_path))
+            os.replace(temp_path, self.path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+            self._indexes = {}
+
+    def refresh(self):
+        with self._lock:
+            self._snapshot = None
+            self._indexes = {}
+            self._verify_cache = True
+
+class SQLiteBackend(StorageBackend):
+    # Bookkeeping tables: sheet order (including empty separator sheets) and the pandas
+    # dtype of every column, so frames read back look like the ones parsed from Excel
+    SHEETS_TABLE = "_sheets"
+    COLUMNS_TABLE = "_columns"
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute(f'CREATE TABLE IF NOT EXISTS "{self.SHEETS_TABLE}" (name TEXT PRIMARY KEY, position INTEGER)')
+        connection.execute(f'CREATE TABLE IF NOT EXISTS "{self.COLUMNS_TABLE}" (sheet TEXT, name TEXT, position INTEGER, dtype TEXT)')
+        return connection
+
+    def sheet_names(self):
+        with closing(self._connect()) as connection:
+            rows = connection.execute(f'SELECT name FROM "{self.SHEETS_TABLE}" ORDER BY position').fetchall()
+        return [row[0] for row in rows]
+
+    def _columns(self, connection, sheet_name):
+        rows = connection.execute(
+            f'SELECT name, dtype FROM "{self.COLUMNS_TABLE}" WHERE sheet = ? ORDER BY position', (sheet_name,)
+        ).fetchall()
+        return dict(rows)
+
+    def _select(self, sheet_name, filters):
+        with closing(self._connect()) as connection:
+            if connection.execute(f'SELECT 1 FROM "{self.SHEETS_TABLE}" WHERE name = ?', (sheet_name,)).fetchone() is None:
+                raise ValueError(f"Worksheet named '{sheet_name}' not found")
+            columns = self._columns(connection, sheet_name)
+            if not columns:
+                return pd.DataFrame()
+
+            # rowid - 1 is the row position in the sheet, the same index pandas gives the Excel frame
+            sql = f'SELECT rowid - 1 AS "__row__", * FROM {_quote(sheet_name)}'
+            if filters:
+                sql += " WHERE " + " AND ".join(f"{_quote(column)} = ?" for column in filters)
+            sql += " ORDER BY rowid"
+            data = pd.read_sql_query(sql, connection, params=[_to_sql_value(value) for value in filters.values()])
+
+        data = data.set_index("__row__")
+        data.index.name = None
+        for column, dtype in columns.items():
+            if dtype == "bool" and not data[column].isna().any():
+                data[column] = data[column].astype(bool)
+            elif dtype.startswith("datetime"):
+                data[column] = pd.to_datetime(data[column])
+        return data
+
+    def read_sheet(self, sheet_name):
+        return self._select(sheet_name, {})
+
+    def query(self, sheet_name, filters):
+        # Filters are pushed down into the WHERE clause and served by the (Team Name, PI) indexes
+        return self._select(sheet_name, filters)
+
+    def write_sheets(self, sheets):
+        # All sheets are replaced in one SQLite transaction
+        with closing(self._connect()) as connection, connection:
+            for sheet_name, data in sheets.items():
+                self._write_sheet(connection, sheet_name, data)
+
+    def _write_sheet(self, connection, sheet_name, data):
+        table = _quote(sheet_name)
+        connection.execute(f"DROP TABLE IF EXISTS {table}")
+        connection.execute(f'DELETE FROM "{self.COLUMNS_TABLE}" WHERE sheet = ?', (sheet_name,))
+        if connection.execute(f'SELECT 1 FROM "{self.SHEETS_TABLE}" WHERE name = ?', (sheet_name,)).fetchone() is None:
+            position = connection.execute(f'SELECT COUNT(*) FROM "{self.SHEETS_TABLE}"').fetchone()[0]
+            connection.execute(f'INSERT INTO "{self.SHEETS_TABLE}" VALUES (?, ?)', (sheet_name, position))
+
+        # Sheets without columns (e.g. the "TEAM DATA ->" separators) only keep their position
+        if len(data.columns) == 0:
+            return
+
+        column_definitions = ", ".join(f"{_quote(column)} {_sql_type(data[column])}" for column in data.columns)
+        connection.execute(f"CREATE TABLE {table} ({column_definitions})")
+        connection.executemany(
+            f'INSERT INTO "{self.COLUMNS_TABLE}" VALUES (?, ?, ?, ?)',
+            [(sheet_name, str(column), position, str(data[column].dtype)) for position, column in enumerate(data.columns)]
+        )
+        placeholders = ", ".join("?" for _ in data.columns)
+        rows = ([_to_sql_value(value) for value in row] for row in data.itertuples(index=False, name=None))
+        connection.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+
+        index_columns = [column for column in INDEXED_COLUMNS.get(sheet_name, []) if column in data.columns]
+        if index_columns:
+            connection.execute(
+                f"CREATE INDEX {_quote(f'idx_{sheet_name}')} ON {table} ({', '.join(_quote(column) for column in index_columns)})"
+            )
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _sql_type(series):
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(series):
+        return "REAL"
+    return "TEXT"
+
+def _to_sql_value(value):
+    if value is None or (not isinstance(value, (list, dict)) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+# A sheet with the journal entries applied, for one version of the stored sheets and journal
+class Overlay:
+    def __init__(self, version, data, applied, last_id=None):
+        self.version = version
+        self.data = data
+        self.applied = applied
+        self.last_id = last_id
+
+# Storage backend with the change journal applied on top; get_backend hands these out, so every
+# reader sees the journaled changes
+class JournaledBackend:
+    def __init__(self, backend):
+        self.backend = backend
+        self.path = backend.path
+        self.journal = ChangeJournal(backend.path)
+        self._overlays = {}
+        self._deltas = {}
+        self._lock = threading.Lock()
+        self._compactor = None
+
+    def version(self):
+        return (self.backend.version(), self.journal.signature())
+
+    def sheet_names(self):
+        return self.backend.sheet_names()
+
+    def _overlay(self, sheet_name):
+        # None if the sheet has no journal entries, so reads go to the backend directly
+        if not self.journal.may_have_entries():
+            return None
+        with self._lock:
+            overlay = self._overlays.get(sheet_name)
+        if overlay is not None and overlay.version == self.version():
+            return overlay if overlay.data is not None else None
+
+        # Read the stored sheet and the journal under the workbook lock, so a fold can't move
+        # entries from the journal into the workbook in between
+        with workbook_lock(self.path):
+            self.journal.recover()
+            self.journal.refresh()
+            version = self.version()
+            entries = self.journal.entries(sheet_name)
+            if not entries:
+                overlay = Overlay(version, None, 0)
+            elif overlay is not None and overlay.data is not None and overlay.version[0] == version[0] and 0 < overlay.applied <= len(entries) and entries[overlay.applied - 1]["id"] == overlay.last_id:
+                # Same stored sheet, the journal only grew: apply just the new entries
+                data, _ = apply_entries(sheet_name, overlay.data, entries[overlay.applied:])
+                overlay = Overlay(version, data, len(entries), entries[-1]["id"])
+            else:
+                data, _ = apply_entries(sheet_name, self.backend.read_sheet(sheet_name), entries)
+                overlay = Overlay(version, data, len(entries), entries[-1]["id"])
+            with self._lock:
+                self._overlays[sheet_name] = overlay
+        return overlay if overlay.data is not None else None
+
+    def read_sheet(self, sheet_name):
+        overlay = self._overlay(sheet_name)
+        if overlay is None:
+            return self.backend.read_sheet(sheet_name)
+        return overlay.data.copy()
+
+    # Whether the sheet has journal entries and their net effect (a JournalDelta, None if they
+    # don't record their effects), for the current version of the stored sheets and journal
+    def _delta(self, sheet_name):
+        version = self.version()
+        with self._lock:
+            cached = self._deltas.get(sheet_name)
+        if cached is None or cached[0] != version:
+            with workbook_lock(self.path):
+                self.journal.recover()
+                self.journal.refresh()
+                entries = self.journal.entries(sheet_name)
+                cached = (self.version(), bool(entries), JournalDelta.from_entries(entries))
+            with self._lock:
+                self._deltas[sheet_name] = cached
+        return cached
+
+    def query(self, sheet_name, filters):
+        if not self.journal.may_have_entries():
+            return self.backend.query(sheet_name, filters)
+        version, has_entries, delta = self._delta(sheet_name)
+        if not has_entries or delta is not None:
+            # Filter the stored rows first, so the SQLite backend keeps its indexed lookup, and
+            # apply the effects of the journal entries to just those rows
+            data = self.backend.query(sheet_name, filters)
+            if self.version() == version:
+                return delta.apply(data, filters) if has_entries else data
+        overlay = self._overlay(sheet_name)
+        if overlay is None:
+            return self.backend.query(sheet_name, filters)
+        return filter_rows(overlay.data, filters).copy()
+
+    # Apply row changes to the current sheet and record them in the journal. version is the sheet's
+    # version stamp after the save. Returns the changed sheet and the positions the changes touched.
+    def append_rows(self, changes, version=None):
+        with workbook_lock(self.path):
+            data, positions, effects = apply_with_effects(changes, self.read_sheet(changes.sheet_name))
+            entry = self.journal.append(changes.sheet_name, changes.operations, version, effects)
+            overlay = Overlay(self.version(), data, len(self.journal.entries(changes.sheet_name)), entry["id"])
+            with self._lock:
+                self._overlays[changes.sheet_name] = overlay
+            if len(self.journal.entries()) >= COMPACT_BATCH:
+                self.start_compactor().wake()
+            else:
+                self.start_compactor()
+        return data.copy(), positions
+
+    # A whole sheet written replaces its journal entries. base_versions holds the version stamp
+    # each sheet was read at (see loaders.read_sheet_at_version): entries saved since are applied
+    # to the data before it is written, so only entries the written data holds are folded.
+    def write_sheets(self, sheets, base_versions=None):
+        base_versions = base_versions or {}
+        with workbook_lock(self.path):
+            self.journal.recover()
+            self.journal.refresh()
+            sheets = dict(sheets)
+            entry_ids = []
+            for sheet_name in sheets:
+                entries = self.journal.entries(sheet_name)
+                base_version = base_versions.get(sheet_name)
+                if base_version is not None:
+                    sheets[sheet_name] = self._catch_up(sheet_name, sheets[sheet_name], entries, base_version)
+                elif entries:
+                    raise WriteConflictError(f"Sheet '{sheet_name}' has row changes the data may not hold, reload and try again")
+                entry_ids += [entry["id"] for entry in entries]
+            if entry_ids:
+                with self.journal.folding(entry_ids):
+                    self.backend.write_sheets(sheets)
+            else:
+                self.backend.write_sheets(sheets)
+            with self._lock:
+                for sheet_name in sheets:
+                    self._overlays.pop(sheet_name, None)
+
+    # Apply the entries saved after base_version to data read at that version. Every version stamp
+    # since must come from such an entry; otherwise the sheet was also written whole or the entries
+    # were folded in the meantime, and the write conflicts.
+    def _catch_up(self, sheet_name, data, entries, base_version):
+        newer = [entry for entry in entries if (entry.get("version") or 0) > base_version]
+        if get_sheet_version(self.path, sheet_name) - base_version != len({entry["version"] for entry in newer}):
+            raise WriteConflictError(f"Sheet '{sheet_name}' was changed by someone else, reload and try again")
+        if newer:
+            data, _ = apply_entries(sheet_name, data, newer)
+        return data
+
+    # Fold every journal entry into the stored sheets in one write. Returns the number of entries.
+    def compact(self):
+        with workbook_lock(self.path):
+            self.journal.recover()
+            self.journal.refresh()
+            entries = self.journal.entries()
+            if not entries:
+                return 0
+            sheet_names = list(dict.fromkeys(entry["sheet"] for entry in entries))
+            sheets = {sheet_name: self.read_sheet(sheet_name) for sheet_name in sheet_names}
+            with self.journal.folding([entry["id"] for entry in entries]):
+                self.backend.write_sheets(sheets)
+            with self._lock:
+                self._overlays = {}
+        logger.info("Folded %d journal entries into %s (sheets %s)", len(entries), self.path, ", ".join(sheet_names))
+        return len(entries)
+
+    def invalidate(self):
+        self.backend.invalidate()
+        with self._lock:
+            self._overlays = {}
+            self._deltas = {}
+
+    def refresh(self):
+        self.backend.refresh()
+        self.journal.reset()
+        with self._lock:
+            self._overlays = {}
+            self._deltas = {}
+
+    def start_compactor(self):
+        with self._lock:
+            if self._compactor is None:
+                self._compactor = JournalCompactor(self)
+                self._compactor.start()
+            return self._compactor
+
+# One backend instance per path, so the Excel snapshot is shared by all loaders
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_backend(path):
+    key = os.path.abspath(path)
+    with _backends_lock:
+        if key not in _backends:
+            backend_class = SQLiteBackend if key.lower().endswith(SQLITE_EXTENSIONS) else ExcelBackend
+            _backends[key] = JournaledBackend(backend_class(path))
+        return _backends[key]
+
+def convert_workbook(source_path, target_path):
+    # Copy every sheet from one storage to the other, e.g. test_data.xlsx -> capacity.db
+    source = get_backend(source_path)
+    sheets = {sheet_name: source.read_sheet(sheet_name) for sheet_name in source.sheet_names()}
+    get_backend(target_path).write_sheets(sheets)
+    return list(sheets)
+
+# Command line of src/convert_workbook.py, which runs it with src/ on the import path
+def main():
+    parser = argparse.ArgumentParser(description="Convert the capacity planning workbook between Excel and SQLite.")
+    parser.add_argument("command", choices=["import", "export"], help="'import' loads the workbook into the database, 'export' writes the database back to a workbook")
+    parser.add_argument("workbook", help="Path of the Excel workbook, e.g. test_data.xlsx")
+    parser.add_argument("database", help="Path of the SQLite database, e.g. capacity.db")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        sheet_names = convert_workbook(args.workbook, args.database)
+        print(f"Imported {len(sheet_names)} sheets from {args.workbook} into {args.database}")
+    else:
+        sheet_names = convert_workbook(args.database, args.workbook)
+        print(f"Exported {len(sheet_names)} sheets from {args.database} to {args.workbook}")
+
+if __name__ == "__main__":
+    main()
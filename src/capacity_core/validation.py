@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+PI_COLUMN_PATTERN = r"^PI \d{2}-0\d$"
+# PIs missing from the PI calendar are taken as five equal parts of the calendar year
+PIS_PER_YEAR = 5
+VIOLATION_COLUMNS = ["ID", "Title", "Check", "Severity", "PI", "Detail"]
+
+def get_pi_columns(data):
+    return data.columns[data.columns.str.match(PI_COLUMN_PATTERN)]
+
+# Position of "YY-0N" / "PI YY-0N" values on a running PI count, NaN if not a PI. Parsed once
+# per distinct value.
+def pi_ordinal(values):
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=False)
+    parts = pd.Series(uniques, dtype=object).str.extract(r"(\d{2})-0?(\d)$").astype(float)
+    ordinals = (parts[0] * PIS_PER_YEAR + parts[1] - 1).to_numpy()
+    return ordinals[codes]
+
+# Text of every value, formatted once per distinct value
+def format_values(values, formatter):
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return np.array([formatter(value) for value in uniques], dtype=object)[codes]
+
+# Approximate first and last day of every PI in values
+def pi_date_range(values):
+    parts = pd.Series(values, dtype=object).astype(str).str.extract(r"(\d{2})-0?(\d)$").astype(float)
+    year_start = pd.to_datetime((2000 + parts[0]).astype("Int64").astype(str), format="%Y", errors="coerce")
+    year_end = year_start + pd.offsets.YearBegin(1)
+    pi_length = (year_end - year_start) / PIS_PER_YEAR
+    starts = year_start + pi_length * (parts[1] - 1)
+    return starts.dt.normalize().to_numpy(), (starts + pi_length - pd.Timedelta(days=1)).dt.normalize().to_numpy()
+
+# First and last day of every PI in values from the PI sheet's "Start Date" and "End Date"
+# columns, falling back to pi_date_range for PIs the sheet has no dates for. Also returns which
+# PIs have their dates from the sheet.
+def pi_dates(values, pi_calendar=None):
+    starts, ends = pi_date_range(values)
+    exact = np.zeros(len(starts), dtype=bool)
+    if pi_calendar is None or not {"PI", "Start Date", "End Date"}.issubset(pi_calendar.columns):
+        return starts, ends, exact
+    names = pi_calendar["PI"].astype(str).str.replace(r"^PI ", "", regex=True)
+    calendar = pd.DataFrame({
+        "Start Date": pd.to_datetime(pi_calendar["Start Date"], errors="coerce").to_numpy(),
+        "End Date": pd.to_datetime(pi_calendar["End Date"], errors="coerce").to_numpy(),
+    }, index=names.to_numpy()).dropna()
+    calendar = calendar[~calendar.index.duplicated()].reindex(pd.Series(values, dtype=object).astype(str))
+    exact = calendar["Start Date"].notna().to_numpy()
+    starts = np.where(exact, calendar["Start Date"].to_numpy(), starts)
+    ends = np.where(exact, calendar["End Date"].to_numpy(), ends)
+    return starts, ends, exact
+
+# Total SP distributed to the PI columns of every capability and whether it exceeds the budget
+def budget_status(data, pi_columns=None):
+    pi_columns = get_pi_columns(data) if pi_columns is None else pi_columns
+    total = data[pi_columns].apply(pd.to_numeric, errors="coerce").sum(axis=1)
+    budget = pd.to_numeric(data["Budget SP"], errors="coerce")
+    return pd.DataFrame({
+        "Total PI SP": total,
+        "Status": np.where(total > budget, "Over Budget", "Within Budget"),
+    }, index=data.index)
+
+# Check all capabilities at once and return one row per violation:
+# - Over Budget: the SP distributed to the PI columns exceed the Budget SP
+# - PI Outside Dates: SP planned in a PI that ends before the Start Date or starts after the
+#   Target Date. Only an error for PIs with dates in pi_calendar (the PI sheet); for the others
+#   the PI's dates are approximated and the violation is a warning.
+# - Discovery After Fit-Scope: the Discovery PI comes after the Fit-Scope PI
+# - Planned Before Fit-Scope: SP planned in a PI before the Fit-Scope PI
+def validate_capabilities(data, pi_columns=None, pi_calendar=None):
+    pi_columns = get_pi_columns(data) if pi_columns is None else pi_columns
+    ids = data["ID"].astype(str).to_numpy()
+    titles = data["Title"].to_numpy() if "Title" in data else np.full(len(data), "")
+    sp = data[pi_columns].apply(pd.to_numeric, errors="coerce").fillna(0).to_numpy(dtype=float)
+    planned = sp > 0
+    pi_names = np.array([column[3:] for column in pi_columns], dtype=object)
+    violations = []
+
+    status = budget_status(data, pi_columns)
+    over_budget = np.flatnonzero(status["Status"].to_numpy() == "Over Budget")
+    budget = pd.to_numeric(data["Budget SP"], errors="coerce").to_numpy()
+    violations.append(pd.DataFrame({
+        "ID": ids[over_budget],
+        "Title": titles[over_budget],
+        "Check": "Over Budget",
+        "Severity": "Error",
+        "PI": "",
+        "Detail": format_values(status["Total PI SP"].to_numpy()[over_budget], "{:g} SP distributed to the PIs, budget is ".format) + format_values(budget[over_budget], "{:g} SP".format),
+    }))
+
+    # Capabilities x PI columns: SP planned in a PI that does not overlap the capability's dates
+    pi_starts, pi_ends, exact_dates = pi_dates(pi_names, pi_calendar)
+    start_dates = pd.to_datetime(data["Start Date"], errors="coerce") if "Start Date" in data else pd.Series(pd.NaT, index=data.index)
+    target_dates = pd.to_datetime(data["Target Date"], errors="coerce") if "Target Date" in data else pd.Series(pd.NaT, index=data.index)
+    outside = planned & (
+        (pi_ends[np.newaxis, :] < start_dates.to_numpy()[:, np.newaxis])
+        | (pi_starts[np.newaxis, :] > target_dates.to_numpy()[:, np.newaxis])
+    )
+    rows, columns = np.nonzero(outside)
+    violations.append(pd.DataFrame({
+        "ID": ids[rows],
+        "Title": titles[rows],
+        "Check": "PI Outside Dates",
+        "Severity": np.where(exact_dates[columns], "Error", "Warning"),
+        "PI": pi_names[columns],
+        "Detail": (
+            format_values(sp[rows, columns], "{:g} SP planned outside ".format)
+            + start_dates.dt.strftime("%Y-%m-%d").fillna("?").to_numpy(dtype=object)[rows] + " - "
+            + target_dates.dt.strftime("%Y-%m-%d").fillna("?").to_numpy(dtype=object)[rows]
+        ),
+    }))
+
+    discovery = data["Discovery PI"].to_numpy(dtype=object) if "Discovery PI" in data else np.full(len(data), np.nan, dtype=object)
+    fit_scope = data["Fit-Scope PI"].to_numpy(dtype=object) if "Fit-Scope PI" in data else np.full(len(data), np.nan, dtype=object)
+    discovery_ordinal = pi_ordinal(discovery)
+    fit_scope_ordinal = pi_ordinal(fit_scope)
+    late_discovery = np.flatnonzero(discovery_ordinal > fit_scope_ordinal)
+    violations.append(pd.DataFrame({
+        "ID": ids[late_discovery],
+        "Title": titles[late_discovery],
+        "Check": "Discovery After Fit-Scope",
+        "Severity": "Error",
+        "PI": discovery[late_discovery],
+        "Detail": format_values(discovery[late_discovery], "Discovery PI {} is after Fit-Scope PI ".format) + format_values(fit_scope[late_discovery], str),
+    }))
+
+    early_plan = planned & (pi_ordinal(pi_names)[np.newaxis, :] < fit_scope_ordinal[:, np.newaxis])
+    rows, columns = np.nonzero(early_plan)
+    violations.append(pd.DataFrame({
+        "ID": ids[rows],
+        "Title": titles[rows],
+        "Check": "Planned Before Fit-Scope",
+        "Severity": "Error",
+        "PI": pi_names[columns],
+        "Detail": format_values(sp[rows, columns], "{:g} SP planned before Fit-Scope PI ".format) + format_values(fit_scope[rows], str),
+    }))
+
+    return pd.concat(violations, ignore_index=True)[VIOLATION_COLUMNS]
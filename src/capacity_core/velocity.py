@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+from capacity_core.instrumentation import instrumented
+
+SORT_COLUMNS = ["Team", "Year", "PI", "Sprint"]
+
+# The team velocity sheet sorted once by Team/Year/PI/Sprint, with prefix sums of the sprint
+# velocities. The average of any window of sprints is then two lookups and a division,
+# whatever the window size.
+class VelocityIndex:
+    def __init__(self, velocity_data):
+        data = velocity_data.sort_values(SORT_COLUMNS, kind="stable").reset_index(drop=True)
+        data = data[data["Team"].notna()].reset_index(drop=True)
+        self.teams = data["Team"].to_numpy(dtype=object)
+        self.pis = data["PI"].to_numpy(dtype=object)
+        self.sprints = data["Sprint"].to_numpy(dtype=object)
+
+        # Prefix sums skip missing velocities, like DataFrame.mean does
+        self.velocities = data["SprintVelocity"].to_numpy(dtype=float)
+        self.velocity_sums = np.concatenate([[0.0], np.cumsum(np.nan_to_num(self.velocities))])
+        self.velocity_counts = np.concatenate([[0], np.cumsum(~np.isnan(self.velocities))])
+
+        # First and one-past-last row of every team, and the last row of every team and PI
+        positions = pd.Series(np.arange(len(data)))
+        team_groups = positions.groupby(data["Team"].to_numpy())
+        self.team_start = team_groups.min().to_dict()
+        self.team_end = (team_groups.max() + 1).to_dict()
+        self.pi_last = positions.groupby([data["Team"], data["PI"]]).max().to_dict()
+
+    def window(self, team_name, formatted_pi, num_sprints):
+        # Rows [start, end) of the num_sprints sprints before the latest sprint of the PI; if
+        # the team has no data for the PI, before the team's latest sprint. None if no data.
+        if team_name not in self.team_start:
+            return None
+        end = self.pi_last.get((team_name, formatted_pi), self.team_end[team_name] - 1)
+        start = max(self.team_start[team_name], end - num_sprints)
+        return start, end
+
+    def window_average(self, start, end):
+        count = self.velocity_counts[end] - self.velocity_counts[start]
+        return (self.velocity_sums[end] - self.velocity_sums[start]) / count if count else np.nan
+
+    def average(self, team_name, pi, num_sprints):
+        # Same result and messages the team data tab has always shown
+        window = self.window(team_name, f"PI {pi}", num_sprints)
+        if window is None:
+            return 0, "No data available for the selected team.", ""
+        start, end = window
+        if end <= start:
+            return 0, "Insufficient sprints data available for the selected PI.", ""
+
+        avg_velocity = self.window_average(start, end)
+        info_message = f"Average velocity calculated from {self.sprints[start]} to {self.sprints[end - 1]} over {end - start} sprints."
+        return avg_velocity, "", info_message
+
+    @instrumented("compute")
+    def table(self, sprint_counts=range(1, 21)):
+        # Average velocity for every team x PI x number of sprints, in one vectorized pass
+        keys = list(self.pi_last)
+        if not keys:
+            return pd.DataFrame(columns=["Team", "PI", "Number of Sprints", "Sprints Used", "Average Velocity"])
+        ends = np.array([self.pi_last[key] for key in keys])
+        team_starts = np.array([self.team_start[team] for team, _ in keys])
+        sprint_counts = np.asarray(list(sprint_counts))
+
+        starts = np.maximum(team_starts[:, np.newaxis], ends[:, np.newaxis] - sprint_counts[np.newaxis, :])
+        ends = np.broadcast_to(ends[:, np.newaxis], starts.shape)
+        sums = self.velocity_sums[ends] - self.velocity_sums[starts]
+        counts = self.velocity_counts[ends] - self.velocity_counts[starts]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            averages = np.where(counts > 0, sums / counts, np.nan)
+
+        return pd.DataFrame({
+            "Team": np.repeat([team for team, _ in keys], len(sprint_counts)),
+            "PI": np.repeat([pi for _, pi in keys], len(sprint_counts)),
+            "Number of Sprints": np.tile(sprint_counts, len(keys)),
+            "Sprints Used": (ends - starts).ravel(),
+            "Average Velocity": averages.ravel(),
+        })
+
+# Average velocity of the num_sprints sprints before the latest sprint of the PI (or of the
+# team's latest PI if the selected one has no data), with a warning and an info message
+@instrumented("compute")
+def calculate_avg_velocity(velocity_data, team_name, pi, num_sprints):
+    return VelocityIndex(velocity_data).average(team_name, pi, num_sprints)
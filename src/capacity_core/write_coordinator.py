@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Coordinates the writes of every session and process to one workbook:
+#
+# - A lock file next to the workbook (.<workbook>.lock) serializes the writers across threads
+#   and processes; it is reentrant within a thread.
+# - Every sheet has a version stamp in .<workbook>.versions.json that each write through the
+#   coordinator increments, so a writer can tell whether a sheet changed since it read it.
+# - Edits are described as row-level changes (RowChanges) that are applied to the sheet as it is
+#   when the lock is held, instead of writing back a frame that may have been read long before.
+
+# Writers queue for the lock; every workbook rewrite holds it for a fraction of a second
+LOCK_TIMEOUT = 120
+LOCK_POLL_SECONDS = 0.01
+
+# Columns identifying a row of a sheet, used to find an edited row again if other writers moved it
+ROW_KEYS = {
+    "team_member_data": ["Team Name", "PI", "Name"],
+    "team_data": ["Team Name", "PI"],
+    "role_relevance": ["Team Name", "PI", "Role"],
+    "capability_data": ["ID"],
+}
+
+# Raised when a change can't be applied because another writer changed the same data
+class WriteConflictError(Exception):
+    pass
+
+def sidecar_path(file_path, suffix):
+    directory, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(directory, f".{name}.{suffix}")
+
+# SHA-256 of a file, read in 1 MiB chunks
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class WorkbookLock:
+    def __init__(self, file_path):
+        self.lock_path = sidecar_path(file_path, "lock")
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self, timeout=LOCK_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        if not self._thread_lock.acquire(timeout=timeout):
+            raise TimeoutError(f"Timed out waiting for the write lock {self.lock_path}")
+        if self._depth == 0:
+            try:
+                self._file = open(self.lock_path, "a+b")
+                while not self._try_lock():
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Timed out waiting for the write lock {self.lock_path}")
+                    time.sleep(LOCK_POLL_SECONDS)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def _try_lock(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+@contextmanager
+def workbook_lock(file_path, timeout=LOCK_TIMEOUT):
+    key = os.path.abspath(file_path)
+    with _locks_guard:
+        lock = _locks.setdefault(key, WorkbookLock(file_path))
+    lock.acquire(timeout)
+    try:
+        yield
+    finally:
+        lock.release()
+
+def read_sheet_versions(file_path):
+    try:
+        with open(sidecar_path(file_path, "versions.json")) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def get_sheet_version(file_path, sheet_name):
+    return read_sheet_versions(file_path).get(sheet_name, 0)
+
+# Version stamps this process last wrote or read the workbook at, per workbook
+_seen_versions = {}
+
+# Increment the version stamps of the written sheets; call with the workbook lock held
+def bump_sheet_versions(file_path, sheet_names):
+    versions = read_sheet_versions(file_path)
+    for sheet_name in sheet_names:
+        versions[sheet_name] = versions.get(sheet_name, 0) + 1
+    path = sidecar_path(file_path, "versions.json")
+    with open(path + ".tmp", "w") as file:
+        json.dump(versions, file, indent=1)
+    os.replace(path + ".tmp", path)
+    _seen_versions[os.path.abspath(file_path)] = versions
+    return versions
+
+# Make the backend drop its snapshot if another process wrote the workbook since this process
+# last saw it. The (mtime, size) check of the backend misses a write of the same size within
+# one mtime tick, which would make a writer apply its changes to stale rows. Call with the lock held.
+def sync_with_writers(file_path, backend):
+    key = os.path.abspath(file_path)
+    versions = read_sheet_versions(file_path)
+    if _seen_versions.get(key) != versions:
+        backend.refresh()
+        _seen_versions[key] = versions
+
+def same_value(a, b):
+    if pd.api.types.is_scalar(a) and pd.api.types.is_scalar(b) and pd.isna(a) and pd.isna(b):
+        return True
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return False
+
+def set_value(data, index, column, value):
+    if column not in data.columns:
+        data[column] = np.nan
+    try:
+        data.at[index, column] = value
+    except (TypeError, ValueError):
+        # The value doesn't fit the column's dtype, e.g. text in a numeric column
+        data[column] = data[column].astype(object)
+        data.at[index, column] = value
+
+def match_rows(data, match):
+    mask = pd.Series(True, index=data.index)
+    for column, value in match.items():
+        mask &= data[column].isna() if pd.isna(value) else data[column] == value
+    return data.index[mask]
+
+# Row-level changes to one sheet. Updates and deletes carry the row as it was read ("before"),
+# so they can be applied to a sheet other writers changed in the meantime: the row is found again
+# by its key columns, and an update only conflicts if another writer changed the same cells.
+class RowChanges:
+    def __init__(self, sheet_name):
+        self.sheet_name = sheet_name
+        self.operations = []
+
+    def __len__(self):
+        return len(self.operations)
+
+    def insert(self, values):
+        self.operations.append({"op": "insert", "values": dict(values)})
+
+    # before: the row as read, a Series named by its position in the sheet
+    def update(self, before, values):
+        self.operations.append({"op": "update", "row": before.name, "before": before.to_dict(), "values": dict(values)})
+
+    def delete(self, before):
+        self.operations.append({"op": "delete", "row": before.name, "before": before.to_dict()})
+
+    # Update the row with the key columns of values, or insert it if there is none
+    def upsert(self, values):
+        self.operations.append({"op": "upsert", "values": dict(values)})
+
+    # Set values on every row whose columns equal match
+    def update_matching(self, match, values):
+        self.operations.append({"op": "update_matching", "match": dict(match), "values": dict(values)})
+
+    # Replace every row whose columns equal match by rows
+    def replace(self, match, rows):
+        self.operations.append({"op": "replace", "match": dict(match), "rows": [dict(row) for row in rows]})
+
+    def key_columns(self, data, values):
+        keys = [column for column in ROW_KEYS.get(self.sheet_name, []) if column in data.columns and column in values]
+        return keys or [column for column in values if column in data.columns]
+
+    def locate(self, data, operation):
+        before = operation["before"]
+        keys = self.key_columns(data, before)
+        row = operation["row"]
+        if row in data.index and all(same_value(data.at[row, column], before[column]) for column in keys):
+            return row
+        candidates = match_rows(data, {column: before[column] for column in keys})
+        if len(candidates) > 1:
+            # The key isn't unique, e.g. two members of the same name; require the whole row to match
+            candidates = [index for index in candidates if all(same_value(data.at[index, column], value) for column, value in before.items() if column in data.columns)]
+        if len(candidates) != 1:
+            raise WriteConflictError(f"Row {row} of sheet '{self.sheet_name}' was changed or deleted by someone else")
+        return candidates[0]
+
+    # Apply the changes to a copy of the sheet. Returns the new sheet and, per operation, the row
+    # position it touched (for a delete the position the row had before it was removed).
+    def apply(self, data):
+        data = data.copy()
+        positions = []
+        for operation in self.operations:
+            kind = operation["op"]
+            if kind == "insert":
+                data = pd.concat([data, pd.DataFrame([operation["values"]])], ignore_index=True)
+                positions.append(data.index[-1])
+            elif kind == "update":
+                index = self.locate(data, operation)
+                for column, value in operation["values"].items():
+                    if column in data.columns and column in operation["before"]:
+                        current, original = data.at[index, column], operation["before"][column]
+                        if not same_value(current, original) and not same_value(current, value):
+                            raise WriteConflictError(f"'{column}' of row {index} of sheet '{self.sheet_name}' was changed by someone else")
+                    set_value(data, index, column, value)
+                positions.append(index)
+            elif kind == "delete":
+                index = self.locate(data, operation)
+                data = data.drop(index).reset_index(drop=True)
+                positions.append(index)
+            elif kind == "upsert":
+                values = operation["values"]
+                keys = self.key_columns(data, values)
+                rows = match_rows(data, {column: values[column] for column in keys})
+                if len(rows) == 0:
+                    data = pd.concat([data, pd.DataFrame([values])], ignore_index=True)
+                    rows = data.index[-1:]
+                else:
+                    for index in rows:
+                        for column, value in values.items():
+                            set_value(data, index, column, value)
+                positions.append(rows[0])
+            elif kind == "update_matching":
+                rows = match_rows(data, operation["match"])
+                for column, value in operation["values"].items():
+                    if column not in data.columns:
+                        data[column] = np.nan
+                    for index in rows:
+                        set_value(data, index, column, value)
+                positions.append(rows[0] if len(rows) else None)
+            elif kind == "replace":
+                rows = match_rows(data, operation["match"])
+                data = pd.concat([data.drop(rows), pd.DataFrame(operation["rows"])], ignore_index=True)
+                positions.append(len(data) - len(operation["rows"]) if operation["rows"] else None)
+            else:
+                raise ValueError(f"Unknown row operation '{kind}'")
+        return data, positions
@@ -0,0 +1,147 @@
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+from capacity_core.loaders import RowSave, get_active_transaction, save_rows
+from capacity_core.write_coordinator import RowChanges, WriteConflictError
+
+logger = logging.getLogger(__name__)
+
+# In-process queue of workbook writes, served by one worker thread so a save doesn't block the
+# script thread that submitted it. Writes run one at a time in the order they were submitted,
+# and every submit returns a Future with the result of the write.
+#
+# Row changes are coalesced with the ones queued right before them if both target the same
+# sheet: they are applied and journaled together. Pending writes are flushed when the process
+# exits.
+
+class WriteJob:
+    def __init__(self, file_path, kind, sheet_name=None, function=None):
+        self.file_path = os.path.abspath(file_path)
+        self.kind = kind
+        self.sheet_name = sheet_name
+        self.function = function
+        # Per submitter: its future and its row changes
+        self.parts = []
+
+    def accepts(self, other):
+        return self.kind == other.kind == "rows" and (self.file_path, self.sheet_name) == (other.file_path, other.sheet_name)
+
+    def merge(self, other):
+        self.parts += other.parts
+
+    def run(self):
+        if self.kind == "call":
+            future, _ = self.parts[0]
+            self._resolve(future, self.function)
+        else:
+            self._run_rows()
+
+    def _run_rows(self):
+        if len(self.parts) == 1:
+            future, changes = self.parts[0]
+            self._resolve(future, lambda: save_rows(self.file_path, changes))
+            return
+
+        combined = RowChanges(self.sheet_name)
+        for _, changes in self.parts:
+            combined.operations += changes.operations
+        try:
+            result = save_rows(self.file_path, combined)
+        except WriteConflictError:
+            # One of the coalesced saves conflicts; save them one by one so only that one fails
+            for future, changes in self.parts:
+                self._resolve(future, lambda changes=changes: save_rows(self.file_path, changes))
+            return
+        except Exception as e:
+            for future, _ in self.parts:
+                future.set_exception(e)
+            return
+
+        # Every submitter gets the positions of its own changes
+        start = 0
+        for future, changes in self.parts:
+            positions = result.positions[start:start + len(changes)]
+            start += len(changes)
+            future.set_result(RowSave(result.data, positions, result.version_before, result.version_after))
+
+    def _resolve(self, future, function):
+        try:
+            future.set_result(function())
+        except Exception as e:
+            future.set_exception(e)
+
+class WriteQueue:
+    def __init__(self):
+        self._jobs = deque()
+        self._running = None
+        self._condition = threading.Condition()
+        self._worker = None
+
+    # Save row changes; inside a workbook transaction they are staged right away instead
+    def submit_rows(self, file_path, changes):
+        if get_active_transaction(file_path) is not None:
+            return self._done(lambda: save_rows(file_path, changes))
+        job = WriteJob(file_path, "rows", changes.sheet_name)
+        job.parts.append((Future(), changes))
+        return self._submit(job)
+
+    # Run any function writing the workbook, e.g. one that opens a workbook transaction
+    def submit(self, file_path, function):
+        job = WriteJob(file_path, "call", function=function)
+        job.parts.append((Future(), None))
+        return self._submit(job)
+
+    # Number of writes queued or running, for one workbook or all of them
+    def pending(self, file_path=None):
+        key = os.path.abspath(file_path) if file_path is not None else None
+        with self._condition:
+            jobs = list(self._jobs) + ([self._running] if self._running is not None else [])
+            return sum(len(job.parts) for job in jobs if key is None or job.file_path == key)
+
+    # Wait until every submitted write is done. Returns False on timeout.
+    def flush(self, timeout=None):
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._jobs and self._running is None, timeout)
+
+    def _submit(self, job):
+        future = job.parts[-1][0]
+        with self._condition:
+            if self._jobs and self._jobs[-1].accepts(job):
+                self._jobs[-1].merge(job)
+            else:
+                self._jobs.append(job)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="workbook-writer", daemon=True)
+                self._worker.start()
+            self._condition.notify_all()
+        return future
+
+    def _done(self, function):
+        future = Future()
+        try:
+            future.set_result(function())
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._jobs)
+                self._running = self._jobs.popleft()
+            try:
+                self._running.run()
+            except Exception:
+                logger.exception("Failed to write %s", self._running.file_path)
+            finally:
+                with self._condition:
+                    self._running = None
+                    self._condition.notify_all()
+
+write_queue = WriteQueue()
+
+# The worker is a daemon thread, so wait for the queued writes before the interpreter exits
+atexit.register(write_queue.flush)
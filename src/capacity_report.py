@@ -0,0 +1,130 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from capacity_core.storage import get_backend
+from capacity_core.capacity import compute_portfolio_capacity
+from capacity_core.validation import validate_capabilities
+from capacity_core.velocity import VelocityIndex
+from capacity_core.forecast import VelocityForecast
+
+# Capacity report of every team and PI for the planning pack, computed from the workbook
+# without the web app:
+#
+#   python src/capacity_report.py test_data.xlsx report.xlsx --workers 4
+#
+# The workbook is read once; the teams are split into one chunk per worker process.
+
+TEAM_DATA_SHEET = "team_data"
+TEAM_MEMBER_SHEET = "team_member_data"
+TEAM_VELOCITY_SHEET = "team_velocity"
+ROLE_RELEVANCE_SHEET = "role_relevance"
+CAPABILITY_SHEET = "capability_data"
+PI_SHEET = "pi_dropdown"
+KEYS = ["Team Name", "PI"]
+
+def load_sheets(file_path, sheet_names):
+    backend = get_backend(file_path)
+    return {sheet_name: backend.read_sheet(sheet_name) for sheet_name in sheet_names}
+
+# Report rows of the given teams: capacity per sprint and PI, the average velocity and
+# forecasts of the num_sprints sprints before the PI, and the focus factor they imply
+def build_team_report(team_data, team_member_data, role_relevance, velocity_data, num_sprints, sprint_duration, sp_conversion, pi_buffer):
+    capacity = compute_portfolio_capacity(team_member_data, team_data, role_relevance, sprint_duration, sp_conversion, pi_buffer)
+    saved = team_data.drop_duplicates(KEYS, keep="first").rename(columns={
+        "Average Velocity": "Saved Average Velocity",
+        "SP Focus Factor": "Saved SP Focus Factor",
+    })
+    report = saved.merge(capacity, on=KEYS, how="outer")
+
+    velocity_index = VelocityIndex(velocity_data)
+    forecast = VelocityForecast(velocity_index, num_sprints)
+    velocities = [velocity_index.average(team_name, pi, num_sprints)[0] for team_name, pi in zip(report["Team Name"], report["PI"])]
+    report[f"Average Velocity ({num_sprints} Sprints)"] = velocities
+    report["Velocity P50"] = [forecast.forecast(team_name, pi, "Bootstrap P50")[0] for team_name, pi in zip(report["Team Name"], report["PI"])]
+    report["Velocity P85"] = [forecast.forecast(team_name, pi, "Bootstrap P85")[0] for team_name, pi in zip(report["Team Name"], report["PI"])]
+
+    # Focus factor as manage_team_data_ui derives it: velocity / sprint duration / team members
+    duration = report["Average Duration"].fillna(sprint_duration) if "Average Duration" in report else sprint_duration
+    members = report["Average Team Members"].where(report["Average Team Members"] > 0) if "Average Team Members" in report else np.nan
+    members = pd.Series(members, index=report.index).fillna(report["Team Members"]).replace(0, np.nan)
+    report["Velocity SP Focus Factor"] = (pd.Series(velocities, index=report.index, dtype=float) / duration / members).fillna(0.0)
+    return report
+
+def build_team_report_chunk(arguments):
+    return build_team_report(*arguments)
+
+# Split the sheets by team into chunks and build the report of every chunk in a process pool
+def build_report(sheets, num_sprints=6, sprint_duration=10, sp_conversion=8, pi_buffer=0.1, workers=None):
+    team_data = sheets[TEAM_DATA_SHEET]
+    team_member_data = sheets[TEAM_MEMBER_SHEET]
+    role_relevance = sheets[ROLE_RELEVANCE_SHEET]
+    velocity_data = sheets[TEAM_VELOCITY_SHEET]
+
+    teams = pd.unique(pd.concat([team_data["Team Name"], team_member_data["Team Name"]]).dropna())
+    workers = max(1, min(workers or os.cpu_count() or 1, len(teams)))
+    chunks = [
+        (
+            team_data[team_data["Team Name"].isin(chunk)],
+            team_member_data[team_member_data["Team Name"].isin(chunk)],
+            role_relevance[role_relevance["Team Name"].isin(chunk)],
+            velocity_data[velocity_data["Team"].isin(chunk)],
+            num_sprints, sprint_duration, sp_conversion, pi_buffer,
+        )
+        for chunk in np.array_split(teams, workers)
+    ]
+
+    if workers == 1:
+        reports = [build_team_report_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            reports = list(executor.map(build_team_report_chunk, chunks))
+    return pd.concat(reports, ignore_index=True).sort_values(KEYS, kind="stable").reset_index(drop=True)
+
+# Write a table as CSV, Parquet or Excel, depending on the file extension
+def write_table(data, path, sheet_name):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        data.to_csv(path, index=False)
+    elif extension == ".parquet":
+        data.to_parquet(path, index=False)
+    elif extension in (".xlsx", ".xlsm"):
+        with pd.ExcelWriter(path, engine="openpyxl") as writer:
+            data.to_excel(writer, sheet_name=sheet_name, index=False)
+    else:
+        raise ValueError(f"Unsupported output format '{extension}', use .csv, .parquet or .xlsx")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the capacity report of every team and PI without the web app.")
+    parser.add_argument("workbook", help="Path of the workbook or SQLite database, e.g. test_data.xlsx")
+    parser.add_argument("output", help="Report file: .csv, .parquet or .xlsx")
+    parser.add_argument("--violations", help="Also write the capability validation violations to this file (.csv, .parquet or .xlsx)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: one per CPU, 1 runs in-process)")
+    parser.add_argument("--num-sprints", type=int, default=6, help="Number of sprints before the PI for the average velocity")
+    parser.add_argument("--sprint-duration", type=float, default=10, help="Sprint duration in days where the team data has none")
+    parser.add_argument("--sp-conversion", type=float, default=8, help="Hours per story point where the team data has none")
+    parser.add_argument("--pi-buffer", type=float, default=0.1, help="PI buffer for the capacity with buffer")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    sheet_names = [TEAM_DATA_SHEET, TEAM_MEMBER_SHEET, TEAM_VELOCITY_SHEET, ROLE_RELEVANCE_SHEET]
+    if args.violations:
+        sheet_names += [CAPABILITY_SHEET, PI_SHEET]
+    sheets = load_sheets(args.workbook, sheet_names)
+    loaded = time.perf_counter()
+
+    report = build_report(sheets, args.num_sprints, args.sprint_duration, args.sp_conversion, args.pi_buffer, args.workers)
+    write_table(report, args.output, "Capacity Report")
+    print(f"Wrote the capacity report of {report['Team Name'].nunique()} teams and {len(report)} team PIs to {args.output}")
+
+    if args.violations:
+        violations = validate_capabilities(sheets[CAPABILITY_SHEET], pi_calendar=sheets[PI_SHEET])
+        write_table(violations, args.violations, "Capability Violations")
+        print(f"Wrote {len(violations)} capability violations to {args.violations}")
+
+    print(f"Loaded the workbook in {loaded - start:.2f} s, computed and wrote the report in {time.perf_counter() - loaded:.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+from capacity_core.storage import main
+
+# Converts the capacity planning workbook between Excel and SQLite without the web app:
+#
+#   python src/convert_workbook.py import test_data.xlsx capacity.db
+#   python src/convert_workbook.py export test_data.xlsx capacity.db
+#
+# 'import' loads the workbook into the database, 'export' writes the database back to a workbook.
+
+if __name__ == "__main__":
+    main()
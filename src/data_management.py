@@ -1,190 +1,109 @@
 import pandas as pd
 import streamlit as st
+from capacity_core import loaders
+from capacity_core.capacity import MemberTable, DAYS_OFF_COLUMNS
+from capacity_core.loaders import (
+    CapacityDataError, read_sheet, read_sheet_at_version, query_sheet, get_team_pi_rows, get_team_pi_data, write_sheets,
+    get_storage_version, WorkbookTransaction, get_active_transaction, workbook_transaction,
+    get_velocity_index, get_velocity_forecast, load_role_relevance, save_role_relevance,
+    get_team_capacity, refresh_team_data, save_rows,
+)
+from capacity_core.write_coordinator import RowChanges, WriteConflictError
+from capacity_core.write_queue import write_queue
+
+# Streamlit side of the loaders in capacity_core: errors of the core are reported here, the
+# way the UI modules expect them (printed or shown with st.error, with an empty result)
 
 def load_team_data(file_path, sheet_name):
     try:
-        # Load the data from the specified sheet
-        data = pd.read_excel(file_path, sheet_name=sheet_name)
-        
-        # Check for required columns
-        required_columns = ["Team Name", "PI", "Approach"]
-        missing_columns = [col for col in required_columns if col not in data.columns]
-        if missing_columns:
-            raise ValueError(f"Missing columns in data: {missing_columns}")
-        
-        return data
+        return loaders.load_team_data(file_path, sheet_name)
     except Exception as e:
         print(f"Failed to load team data: {e}")
         return None
 
 def load_team_member_data(file_path, sheet_name):
     try:
-        return pd.read_excel(file_path, sheet_name=sheet_name)
+        return read_sheet(file_path, sheet_name)
     except Exception as e:
         print(f"Error loading data: {e}")
         return None
 
 def load_capability_data(file_path, sheet_name):
     try:
-        return pd.read_excel(file_path, sheet_name=sheet_name)
+        return read_sheet(file_path, sheet_name)
     except Exception as e:
         print(f"Error loading data: {e}")
         return None
 
-def save_data(file_path, sheet_name, data):
+def get_latest_team_data(file_path, team_name, sheet_name):
     try:
-        # Ensure data is a DataFrame
-        if not isinstance(data, pd.DataFrame):
-            raise ValueError("Data must be a pandas DataFrame")
-        
-        # Load the existing Excel file
-        with pd.ExcelWriter(file_path, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
-            # Write the DataFrame to the specified sheet
-            data.to_excel(writer, sheet_name=sheet_name, index=False)
-        print(f"Data saved to {file_path} in sheet {sheet_name}")
+        return loaders.get_latest_team_data(file_path, team_name, sheet_name)
     except Exception as e:
-        print(f"Error saving data: {e}")
-        raise e
-
-def get_latest_team_data(file_path, team_name, sheet_name):
-    data = load_team_data(file_path, sheet_name)
-    if data is None:
-        return None
-    team_data = data[data["Team Name"] == team_name]
-    if not team_data.empty:
-        latest_pi = team_data["PI"].max()
-        latest_data = team_data[team_data["PI"] == latest_pi].iloc[0]
-        return latest_data
-    else:
+        print(f"Failed to load team data: {e}")
         return None
 
-import pandas as pd
-
 def update_team_data(file_path, new_data, sheet_name):
     try:
-        with pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
-            existing_data = pd.read_excel(writer, sheet_name=sheet_name)
-
-            # Ensure the DataFrame columns are of the correct type
-            column_types = {
-                "Average Velocity": float,
-                "Average Duration": float,
-                "Average Team Members": int,
-                "SP Focus Factor": float,
-                "Approach": str
-            }
-            for column, dtype in column_types.items():
-                if column in existing_data.columns:
-                    existing_data[column] = existing_data[column].astype(dtype)
-            
-            # Check if the entry already exists
-            mask = (existing_data['PI'] == new_data['PI']) & (existing_data['Team Name'] == new_data['Team Name'])
-            if not existing_data.loc[mask].empty:
-                # Explicitly cast the new data to match expected types
-                for key, value in new_data.items():
-                    new_data[key] = dtype(value) if (key in column_types and (dtype := column_types[key])) else value
-                
-                existing_data.loc[mask, list(new_data.keys())] = list(new_data.values())
-            else:
-                # Convert new_data to DataFrame ensuring the types
-                new_df = pd.DataFrame([new_data])
-                for column, dtype in column_types.items():
-                    new_df[column] = new_df[column].astype(dtype)
-
-                existing_data = pd.concat([existing_data, new_df], ignore_index=True)
-
-            # Save the updated DataFrame back to the same sheet in Excel
-            existing_data.to_excel(writer, sheet_name=sheet_name, index=False)
-
+        loaders.update_team_data(file_path, new_data, sheet_name)
     except Exception as e:
         print(f"Error updating data: {e}")
 
-
-
 def load_team_names(file_path, sheet_name):
-    try:
-        df = pd.read_excel(file_path, sheet_name=sheet_name)
-        team_names = df.iloc[:, 0].tolist()
-        return team_names
-    except Exception as e:
-        raise e
+    return loaders.load_options(file_path, sheet_name)
 
 def load_pi_options(file_path, sheet_name):
-    try:
-        df = pd.read_excel(file_path, sheet_name=sheet_name)
-        pi_options = df.iloc[:, 0].tolist()
-        return pi_options
-    except Exception as e:
-        raise e
+    return loaders.load_options(file_path, sheet_name)
 
 def load_portfolio_options(file_path, sheet_name):
+    return loaders.load_options(file_path, sheet_name)
+
+def get_team_members(file_path, sheet_name, team_name, pi, as_table=False):
+    # as_table returns a columnar MemberTable, otherwise one dict per member
     try:
-        df = pd.read_excel(file_path, sheet_name=sheet_name)
-        portfolio_options = df.iloc[:, 0].tolist()
-        return portfolio_options
+        return loaders.get_team_members(file_path, sheet_name, team_name, pi, as_table)
     except Exception as e:
-        raise e
-
-def get_team_members(file_path, sheet_name, team_name, pi):
-    data = load_team_member_data(file_path, sheet_name)
-    if data is None:
+        print(f"Error loading data: {e}")
         st.error("Failed to load team members data.")
-        return []
-    
-    team_data = data[(data["Team Name"] == team_name) & (data["PI"] == pi)]
-    if team_data.empty:
-        return []
-    
-    team_members = []
-    for _, row in team_data.iterrows():
-        team_members.append({
-            "name": row["Name"],
-            "role": row["Role"],
-            "hours": row["Hours"],
-            "fte": row["FTE"],
-            "days_off": [
-                row["Days Off Sprint 1"],
-                row["Days Off Sprint 2"],
-                row["Days Off Sprint 3"],
-                row["Days Off Sprint 4"],
-                row["Days Off Sprint 5"]
-            ],
-            "sp_focus_factor": row.get("SP Focus Factor (%)", 0.0),  # Default to 0.0 if not present
-            "multiplier": row.get("Multiplier", 1.0)  # Default to 1.0 if not present
-        })
-    return team_members
+        return MemberTable.from_frame(pd.DataFrame(columns=["Name", "Role", "Hours", "FTE"] + DAYS_OFF_COLUMNS)) if as_table else []
 
 def load_team_velocity_data(file_path, velocity_sheet_name):
     try:
-        data = pd.read_excel(file_path, sheet_name=velocity_sheet_name)
-        return data
+        return read_sheet(file_path, velocity_sheet_name)
     except Exception as e:
         st.error(f"Error loading team velocity data: {e}")
         return None
-    
 
 def calculate_average_team_members(file_path, team_name, pi, sheet_name):
     try:
-        data = pd.read_excel(file_path, sheet_name=sheet_name)
-        filtered_data = data[(data["Team Name"] == team_name) & (data["PI"] == f"PI {pi}")]
-        if not filtered_data.empty:
-            return filtered_data['Team Members'].mean()
-        return 0  # Return 0 if no data available
+        return loaders.calculate_average_team_members(file_path, team_name, pi, sheet_name)
     except Exception as e:
         st.error(f"Failed to calculate average team members: {e}")
         return 0
 
-def load_role_relevance(file_path, sheet_name, team_name, pi):
-    df = pd.read_excel(file_path, sheet_name=sheet_name)
-    relevance_data = df[(df["Team Name"] == team_name) & (df["PI"] == pi)]
-    return relevance_data.set_index("Role")["Relevant"].to_dict()
-
-def save_role_relevance(file_path, sheet_name, team_name, pi, role_relevance_dict):
-    df = pd.read_excel(file_path, sheet_name=sheet_name)
-    relevance_data = pd.DataFrame([
-        {"Team Name": team_name, "PI": pi, "Role": role, "Relevant": relevant}
-        for role, relevant in role_relevance_dict.items()
-    ])
-    df = df[~((df["Team Name"] == team_name) & (df["PI"] == pi))]
-    df = pd.concat([df, relevance_data], ignore_index=True)
-    save_data(file_path, sheet_name, df)
\ No newline at end of file
+# Saves handed to the write queue are tracked in the session and reported on the next reruns:
+# the error or success message once the write is done, and "Saving..." while it is running
+def queue_save(future, success_message, error_message):
+    st.session_state.setdefault("pending_saves", []).append((future, success_message, error_message))
+    return future
+
+def show_save_status():
+    pending = []
+    for future, success_message, error_message in st.session_state.get("pending_saves", []):
+        if not future.done():
+            pending.append((future, success_message, error_message))
+        elif future.exception() is not None:
+            print(f"{error_message}: {future.exception()}")
+            st.error(f"{error_message}: {future.exception()}")
+        elif success_message:
+            st.success(success_message)
+    st.session_state["pending_saves"] = pending
+    if pending:
+        show_saving_indicator()
+
+# Polls the pending saves and reruns the app once they are written, so it shows the saved data
+@st.fragment(run_every=0.5)
+def show_saving_indicator():
+    pending = st.session_state.get("pending_saves", [])
+    if all(future.done() for future, _, _ in pending):
+        st.rerun()
+    st.info(f"⏳ Saving… ({sum(not future.done() for future, _, _ in pending)} pending)")
@@ -0,0 +1,55 @@
+import logging
+import os
+import streamlit as st
+import pandas as pd
+from capacity_core.instrumentation import background_spans, export_json, prometheus_text, serve_metrics, summarize
+from capacity_core.sheet_cache import cache_stats
+
+logger = logging.getLogger(__name__)
+
+# Set to a port number to serve the metrics at http://<host>:<port>/metrics for Prometheus. The
+# server listens on 127.0.0.1 unless CAPACITY_METRICS_HOST names another address to bind to.
+METRICS_PORT_VARIABLE = "CAPACITY_METRICS_PORT"
+METRICS_HOST_VARIABLE = "CAPACITY_METRICS_HOST"
+
+def start_metrics_server():
+    port = os.environ.get(METRICS_PORT_VARIABLE)
+    if port:
+        try:
+            serve_metrics(int(port), os.environ.get(METRICS_HOST_VARIABLE, "127.0.0.1"))
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to serve the metrics on port %s: %s", port, e)
+
+# Collapsible sidebar panel with the time the last rerun spent in loads, calculations and saves
+def instrumentation_panel(run):
+    with st.sidebar.expander("⏱️ Performance"):
+        totals = run.totals()
+        st.markdown(
+            f"**Rerun:** {totals['seconds'] * 1000:.0f} ms  \n"
+            f"Loads {totals['load_seconds'] * 1000:.0f} ms · Calculations {totals['compute_seconds'] * 1000:.0f} ms · Saves {totals['save_seconds'] * 1000:.0f} ms  \n"
+            f"{totals['rows_read']:,} rows read · {totals['bytes_written']:,} bytes written"
+        )
+        breakdown = pd.DataFrame(run.breakdown(), columns=["name", "kind", "calls", "seconds", "rows", "bytes_written"])
+        breakdown["ms"] = breakdown.pop("seconds") * 1000
+        st.dataframe(
+            breakdown[["name", "kind", "calls", "ms", "rows", "bytes_written"]],
+            hide_index=True,
+            use_container_width=True,
+            column_config={"ms": st.column_config.NumberColumn("ms", format="%.1f")},
+        )
+        st.caption("Times include nested operations, e.g. get_team_members includes its read_sheet.")
+
+        # Saves run on the write queue's worker thread, outside of any rerun
+        background = summarize(background_spans())
+        if background:
+            st.markdown("**Background saves**")
+            background = pd.DataFrame(background)
+            background["ms"] = background.pop("seconds") * 1000
+            st.dataframe(background[["name", "calls", "ms", "bytes_written"]], hide_index=True, use_container_width=True)
+
+        with st.popover("Sheet caches"):
+            st.dataframe(pd.DataFrame.from_dict(cache_stats(), orient="index"), use_container_width=True)
+
+        col1, col2 = st.columns(2)
+        col1.download_button("JSON", export_json(), file_name="capacity_metrics.json", mime="application/json")
+        col2.download_button("Prometheus", prometheus_text(), file_name="capacity_metrics.prom", mime="text/plain")
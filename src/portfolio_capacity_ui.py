@@ -0,0 +1,70 @@
+import streamlit as st
+from data_management import read_sheet
+from capacity_core.capacity import compute_portfolio_capacity
+from capacity_core.allocation import ALLOCATION_MODES, available_capacity
+from capacity_core.capabilities import get_capability_allocation
+
+def portfolio_capacity_ui(file_path, team_member_sheet_name, team_data_sheet_name, role_relevance_sheet_name, team_sheet_name, area, pi_options, capability_sheet_name, enabler_blocker, uncertainty_buffer):
+    st.header(f"Portfolio Capacity - {area}")
+
+    # Load the data
+    try:
+        team_member_data = read_sheet(file_path, team_member_sheet_name)
+        team_data = read_sheet(file_path, team_data_sheet_name)
+        role_relevance = read_sheet(file_path, role_relevance_sheet_name)
+        teams = read_sheet(file_path, team_sheet_name)
+    except Exception as e:
+        st.error(f"Failed to load portfolio capacity data: {e}")
+        return
+
+    # Capacity of all teams and PIs in one pass, then narrow down to the teams of the selected area.
+    # "PI Capacity with Buffer (SP)" is the capacity after the uncertainty buffer per PI.
+    rollup = compute_portfolio_capacity(team_member_data, team_data, role_relevance, pi_buffer=uncertainty_buffer)
+    if "Area" in teams.columns:
+        area_teams = teams.loc[teams["Area"] == area, "Team"].tolist()
+        rollup = rollup[rollup["Team Name"].isin(area_teams)]
+    rollup = rollup[rollup["PI"].isin(pi_options)]
+
+    if rollup.empty:
+        st.warning("No team member data found for the teams of this area.")
+        return
+
+    pi_capacity = rollup.pivot_table(index="PI", columns="Team Name", values="PI Capacity (SP)", aggfunc="sum", fill_value=0)
+    col1, col2, col3 = st.columns(3)
+    col1.metric(label="Teams", value=rollup["Team Name"].nunique())
+    col2.metric(label="PIs with Capacity", value=len(pi_capacity))
+    col3.metric(label="Total Capacity (SP)", value=round(rollup["PI Capacity (SP)"].sum(), 1))
+
+    st.subheader("Capacity per PI and Team")
+    st.bar_chart(pi_capacity)
+
+    st.subheader("Capacity Details")
+    st.dataframe(rollup, hide_index=True, use_container_width=True)
+
+    # Fit the open SP of the area's capabilities, in WSJF order, into the capacity left per PI
+    # after the blocker for dependencies and the uncertainty buffer
+    st.subheader("Capability Allocation")
+    pi_capacity = available_capacity(rollup.groupby("PI")["PI Capacity (SP)"].sum().reindex(pi_options, fill_value=0), enabler_blocker, uncertainty_buffer)
+    mode = st.radio(
+        "Allocation Mode",
+        ALLOCATION_MODES,
+        horizontal=True,
+        help="'Greedy' allocates the capabilities by descending WSJF to the earliest capacity left and may allocate the last fitting capability partially. 'ILP' only allocates whole capabilities, choosing those that deliver the highest cost of delay (WSJF x SP); it requires SciPy.")
+    try:
+        result = get_capability_allocation(file_path, capability_sheet_name, area, tuple(pi_capacity.items()), mode)
+    except (ImportError, RuntimeError) as e:
+        st.error(f"Failed to allocate the capabilities: {e}")
+        return
+    except Exception as e:
+        st.error(f"Failed to load capability data: {e}")
+        return
+    allocation, pi_usage = result
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric(label="Fully Allocated Capabilities", value=int((allocation["Allocation"] == "Fully allocated").sum()))
+    col2.metric(label="Partially Allocated Capabilities", value=int((allocation["Allocation"] == "Partially allocated").sum()))
+    col3.metric(label="Unallocated Capabilities", value=int((allocation["Allocation"] == "Not allocated").sum()))
+    col4.metric(label="Capabilities without Open SP", value=int((allocation["Allocation"] == "No open SP").sum()))
+
+    st.bar_chart(pi_usage.set_index("PI")[["Allocated SP", "Remaining SP"]])
+    st.dataframe(allocation.round(1), hide_index=True, use_container_width=True)
@@ -1,55 +1,7 @@
 import streamlit as st
-from data_management import load_team_data, load_team_velocity_data, load_team_member_data, save_data, get_latest_team_data, update_team_data
-
-def calculate_avg_velocity(velocity_data, team_name, pi, num_sprints):
-    # Format the PI value to match the format in the dataframe
-    formatted_pi = f"PI {pi}"
-    
-    # Filter data for the selected team
-    team_data = velocity_data[velocity_data["Team"] == team_name]
-
-    # Sorting by Year, PI and Sprint to ensure proper order
-    team_data = team_data.sort_values(by=["Year", "PI", "Sprint"], ascending=[True, True, True])
-
-    # Check if the desired PI has any data
-    team_pi_data = team_data[team_data["PI"] == formatted_pi]
-
-    if team_pi_data.empty:
-        # Find the latest available PI and its data
-        latest_pi_data = team_data.drop_duplicates("PI", keep='last')
-        if latest_pi_data.empty:
-            return 0, "No data available for the selected team.", ""
-
-        # Use the latest PI available
-        latest_pi = latest_pi_data.iloc[-1]
-        team_pi_data = team_data[team_data["PI"] == latest_pi["PI"]]
-    else:
-        # Use the identified PI's data
-        latest_pi = team_pi_data.iloc[-1]
-
-    # Getting the index of the latest PI's latest sprint
-    latest_sprint_index = team_data.index.get_loc(latest_pi.name)
-
-    # Calculate the start index for fetching sprints, starting one before the latest
-    start_index = max(0, latest_sprint_index - num_sprints)
-
-    # Fetch the relevant sprints, excluding the very latest one
-    relevant_sprints = team_data.iloc[start_index:latest_sprint_index]
-
-    if relevant_sprints.empty:
-        return 0, "Insufficient sprints data available for the selected PI.", ""
-
-    avg_velocity = relevant_sprints["SprintVelocity"].mean()
-
-    # Fetching start and end sprint details
-    start_sprint = relevant_sprints.iloc[0]["Sprint"]
-    end_sprint = relevant_sprints.iloc[-1]["Sprint"]
-
-    # Constructing the message
-    info_message = f"Average velocity calculated from {start_sprint} to {end_sprint} over {len(relevant_sprints)} sprints."
-    
-    return avg_velocity, "", info_message
-
+from data_management import load_team_data, load_team_velocity_data, workbook_transaction, get_team_pi_data, get_velocity_index, get_velocity_forecast, save_rows, RowChanges, write_queue, queue_save
+from capacity_core import loaders
+from capacity_core.forecast import FORECAST_METHODS
 
 def manage_team_data_ui(file_path, sheet_name, velocity_sheet_name, team_name, pi, avg_duration, team_member_sheet_name, sp_conversion, user_role):
     st.header(f"Manage Team Data - PI {pi}")
@@ -57,21 +9,12 @@ def manage_team_data_ui(file_path, sheet_name, velocity_sheet_name, team_name, p
     # Load the data
     data = load_team_data(file_path, sheet_name)
     velocity_data = load_team_velocity_data(file_path, velocity_sheet_name)
-    team_member_data = load_team_member_data(file_path, team_member_sheet_name)
     
     # Check if the data was loaded successfully
     if data is None or velocity_data is None:
         st.error("Failed to load team data. Please check the file and sheet names.")
         return
     
-    # Function to get data for the selected PI and team
-    def get_team_pi_data(data, team_name, pi):
-        team_pi_data = data[(data["Team Name"] == team_name) & (data["PI"] == pi)]
-        if not team_pi_data.empty:
-            return team_pi_data.iloc[0]
-        else:
-            return None
-    
     # Initialize session state for the selected PI
     if f"pi_{pi}_team_{team_name}" not in st.session_state:
         st.session_state[f"pi_{pi}_team_{team_name}"] = {
@@ -83,15 +26,10 @@ def manage_team_data_ui(file_path, sheet_name, velocity_sheet_name, team_name, p
         }
     
     # Get the data for the selected team and PI
-    team_pi_data = get_team_pi_data(data, team_name, pi)
-    latest_team_data = get_latest_team_data(file_path, team_name, sheet_name)
+    team_pi_data = get_team_pi_data(file_path, sheet_name, team_name, pi)
 
-    
     if team_pi_data is None:
         # No data for the selected PI, so show default values
-        latest_team_data = get_latest_team_data(file_path, team_name, sheet_name)
-        if not data[data["Team Name"] == team_name].empty:
-            latest_team_data = get_latest_team_data(file_path, team_name, sheet_name)
         button_text = "Save Team Data"
     else:
         # Data exists for the selected PI, so show that data
@@ -129,8 +67,16 @@ def manage_team_data_ui(file_path, sheet_name, velocity_sheet_name, team_name, p
             value=6, 
             key=f"num_sprints_{pi}_{team_name}",
             help="Define the number of sprints across which you want to calculate the baseline average velocity.")
+        forecast_method = st.selectbox(
+            "Velocity Forecast Method",
+            list(FORECAST_METHODS),
+            key=f"forecast_method_{pi}_{team_name}",
+            help="Choose how the baseline velocity is derived from the chosen sprints: their average, their median, an exponentially weighted average favouring recent sprints, or the velocity reached with 50% / 85% confidence according to a bootstrap of the sprints.")
         # Calculate the average velocity based on the selected number of sprints
-        avg_velocity, warning_message, info_message = calculate_avg_velocity(velocity_data, team_name, pi, num_sprints)
+        if forecast_method == "Average":
+            avg_velocity, warning_message, info_message = get_velocity_index(file_path, velocity_sheet_name).average(team_name, pi, num_sprints)
+        else:
+            avg_velocity, warning_message, info_message = get_velocity_forecast(file_path, velocity_sheet_name, num_sprints).forecast(team_name, pi, forecast_method)
         if warning_message:
             st.warning(warning_message)
         else:
@@ -176,14 +122,20 @@ def manage_team_data_ui(file_path, sheet_name, velocity_sheet_name, team_name, p
             "Approach": approach,
             "SP Conversion": sp_conversion
         }
-        update_team_data(file_path, new_data, sheet_name)
-        
-        if approach == "Velocity":
-            # Update SP Focus Factor for all team members in the team_member_data
-            team_members_to_update = (team_member_data["Team Name"] == team_name) & (team_member_data["PI"] == pi)
-            team_member_data.loc[team_members_to_update, "SP Focus Factor (%)"] = sp_focus_factor
-            save_data(file_path, "team_member_data", team_member_data)
-        
+        # Team data and team member data are written together in one workbook transaction,
+        # run by the write queue so the script doesn't wait for it
+        def save_team_data():
+            with workbook_transaction(file_path):
+                # The loader itself, so a failed save reaches the future and is shown by queue_save
+                loaders.update_team_data(file_path, new_data, sheet_name)
+
+                if approach == "Velocity":
+                    # Update SP Focus Factor for all team members of the team in this PI
+                    changes = RowChanges(team_member_sheet_name)
+                    changes.update_matching({"Team Name": team_name, "PI": pi}, {"SP Focus Factor (%)": sp_focus_factor})
+                    save_rows(file_path, changes)
+        queue_save(write_queue.submit(file_path, save_team_data), None, "Failed to save the team data")
+
         st.rerun()  # Rerun the script to update the UI
 
     # Display the data for the selected team
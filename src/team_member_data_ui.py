@@ -1,18 +1,15 @@
 import streamlit as st
 import pandas as pd
-from data_management import load_team_member_data, save_data
+from data_management import read_sheet, get_team_pi_rows, RowChanges, write_queue, queue_save
+from capacity_core.capacity import capacity_ledger, MemberTable
 
 def manage_team_member_ui(file_path, sheet_name, role_sheet_name, team_name, pi, fte, hours, user_role):
     # Fetch team data
-    team_data_df = pd.read_excel(file_path, 'team_data')
-    team_member_data = pd.read_excel(file_path, sheet_name)
-    team_data = team_data_df[(team_data_df['Team Name'] == team_name) & (team_data_df['PI'] == pi)]
-
-    team_member_df = load_team_member_data(file_path, sheet_name)
-    team_member_data = team_member_df[(team_member_df['Team Name'] == team_name) & (team_member_df['PI'] == pi)]
+    team_data = get_team_pi_rows(file_path, 'team_data', team_name, pi)
+    team_member_data = get_team_pi_rows(file_path, sheet_name, team_name, pi)
     
     # Load role options
-    role_data = pd.read_excel(file_path, role_sheet_name)
+    role_data = read_sheet(file_path, role_sheet_name)
     # Create a dictionary for role emojis
     role_emoji_dict = pd.Series(role_data.Emoji.values, index=role_data.Role).to_dict()
 
@@ -86,15 +83,28 @@ def manage_team_member_ui(file_path, sheet_name, role_sheet_name, team_name, pi,
             display_team_members(file_path, sheet_name, team_name, pi, role_emoji_dict, role_display_options, role_to_emoji_map, approach)
 
 def add_new_team_member(file_path, sheet_name, member_data):
-    df = pd.read_excel(file_path, sheet_name=sheet_name)
-    new_member_df = pd.DataFrame([member_data])
-    df = pd.concat([df, new_member_df], ignore_index=True)
-    save_data(file_path, sheet_name, df)
-    st.success("Added new team member!")
+    changes = RowChanges(sheet_name)
+    changes.insert(member_data)
+    future = queue_save(write_queue.submit_rows(file_path, changes), "Added new team member!", "Failed to add the team member")
+    # Add only the new member's capacity to the dashboard totals once it is saved
+    future.add_done_callback(lambda future: ledger_update_member(future, file_path, member_data["Team Name"], member_data["PI"]))
+
+# Called by the write queue when a member's row is saved
+def ledger_update_member(future, file_path, team_name, pi):
+    if future.exception() is None:
+        result = future.result()
+        index = result.positions[0]
+        capacity_ledger.update_member(file_path, team_name, pi, MemberTable.from_frame(result.data.loc[[index]]), result.version_before, result.version_after)
+
+def ledger_remove_member(future, file_path, team_name, pi):
+    if future.exception() is None:
+        result = future.result()
+        capacity_ledger.remove_member(file_path, team_name, pi, result.positions[0], result.version_before, result.version_after)
 
 def display_team_members(file_path, sheet_name, team_name, pi, role_emoji_dict, role_display_options, role_to_emoji_map, approach):
-    df = load_team_member_data(file_path, sheet_name)
-    team_df = df[(df['Team Name'] == team_name) & (df['PI'] == pi)]
+    # The members as stored, to tell the write coordinator which version of a row was edited
+    members = get_team_pi_rows(file_path, sheet_name, team_name, pi)
+    team_df = members.copy()
     # Normalize FTE values to a range of 0-1
     team_df['FTE'] = team_df['FTE'] / 100.0 if team_df['FTE'].max() > 1 else team_df['FTE']
 
@@ -128,8 +138,6 @@ def display_team_members(file_path, sheet_name, team_name, pi, role_emoji_dict,
     # Display each team member with details
     st.markdown("##### Adjust details")
     for index, row in team_df.iterrows():
-        print(f"Row FTE value type: {type(row['FTE'])}")  # Debug print to check the type of FTE
-        print(f"Row FTE value: {row['FTE']}")  # Debug print to check the value of FTE
         # Ensure the FTE value is a float
         if isinstance(row['FTE'], list):
             row['FTE'] = row['FTE'][0] if row['FTE'] else 0.0
@@ -149,7 +157,7 @@ def display_team_members(file_path, sheet_name, team_name, pi, role_emoji_dict,
                 updated_role = role_to_emoji_map[updated_role_display]  # Map back to the original role for storage
                 updated_hours = st.number_input("Hours", value=row['Hours'], key=f"hours_{index}")
                 updated_fte = st.slider("FTE (%)", value=row['FTE'], key=f"fte_{index}", min_value=0.0, max_value=1.0, step=0.01)
-                updated_focus_factor = st.slider("SP Focus Factor (%)", value=row.get('SP Focus Factor (%)', 0.0), key=f"focus_{index}", disabled=(approach == "Velocity"), step=0.01),
+                updated_focus_factor = st.slider("SP Focus Factor (%)", value=row.get('SP Focus Factor (%)', 0.0), key=f"focus_{index}", disabled=(approach == "Velocity"), step=0.01)
                 current_status = row['Status']
                 updated_status = st.selectbox("Status", ["Onboarding", "Offboarding", "Active"], index=["Onboarding", "Offboarding", "Active"].index(current_status), key=f"status_{index}")
             with col2:
@@ -166,15 +174,13 @@ def display_team_members(file_path, sheet_name, team_name, pi, role_emoji_dict,
                     "Status": updated_status,
                     "Multiplier": updated_multiplier
                 }
-                update_team_member(file_path, sheet_name, df, row.name, update_member_data)
+                update_team_member(file_path, sheet_name, members.loc[index], update_member_data)
             if st.button('Delete', key=f'delete{index}'):
-                delete_team_member(file_path, sheet_name, df, row.name)
+                delete_team_member(file_path, sheet_name, members.loc[index])
 
 def copy_pi_data(file_path, sheet_name, team_name, source_pi, target_pi, team_data):
-    df = pd.read_excel(file_path, sheet_name=sheet_name)
-    
-    source_data = df[(df['Team Name'] == team_name) & (df['PI'] == source_pi)]
-    target_data = df[(df['Team Name'] == team_name) & (df['PI'] == target_pi)]
+    source_data = get_team_pi_rows(file_path, sheet_name, team_name, source_pi)
+    target_data = get_team_pi_rows(file_path, sheet_name, team_name, target_pi)
 
     # Check if target PI already has data
     if not target_data.empty:
@@ -194,32 +200,30 @@ def copy_pi_data(file_path, sheet_name, team_name, source_pi, target_pi, team_da
         new_sp_focus_factor = float(team_data.iloc[0].get('SP Focus Factor', 0.0))
         new_data['SP Focus Factor (%)'] = new_sp_focus_factor
 
-    # Remove existing data for target PI
-    df = df[df['PI'] != target_pi]
-
-    # Append new data
-    df = pd.concat([df, new_data], ignore_index=True)
-
-    # Save the updated data
-    save_data(file_path, sheet_name, df)
-    st.success(f"Data from PI {source_pi} successfully copied to PI {target_pi} with updated Days Off and SP Focus Factor: {new_sp_focus_factor:.2%}.")
+    # Replace the team's members of the target PI, leaving every other team and PI untouched
+    changes = RowChanges(sheet_name)
+    changes.replace({"Team Name": team_name, "PI": target_pi}, new_data.to_dict("records"))
+    queue_save(write_queue.submit_rows(file_path, changes), f"Data from PI {source_pi} successfully copied to PI {target_pi} with updated Days Off and SP Focus Factor: {new_sp_focus_factor:.2%}.", "Failed to copy the PI data")
 
-def update_team_member(file_path, sheet_name, df, index, member_data):
-    for key, value in member_data.items():
-        df.at[index, key] = value
+def update_team_member(file_path, sheet_name, member, member_data):
+    # Only the edited cells are written, onto the sheet as it is at the time of the save
+    changes = RowChanges(sheet_name)
+    changes.update(member, member_data)
+    future = queue_save(write_queue.submit_rows(file_path, changes), None, "Failed to update the team member")
 
-    # Save the updated DataFrame to Excel using the save_data function
-    save_data(file_path, sheet_name, df)
+    # Apply only this member's capacity delta to the dashboard totals once it is saved
+    future.add_done_callback(lambda future: ledger_update_member(future, file_path, member["Team Name"], member["PI"]))
     
     # Refresh the UI to reflect the changes
     st.rerun()
 
-def delete_team_member(file_path, sheet_name, df, index):
-    # Drop the row and reset the index
-    df = df.drop(index).reset_index(drop=True)
+def delete_team_member(file_path, sheet_name, member):
+    changes = RowChanges(sheet_name)
+    changes.delete(member)
+    future = queue_save(write_queue.submit_rows(file_path, changes), None, "Failed to delete the team member")
 
-    # Save the updated DataFrame back to the Excel file using the save_data function
-    save_data(file_path, sheet_name, df)
+    # Remove only this member's capacity from the dashboard totals once it is saved
+    future.add_done_callback(lambda future: ledger_remove_member(future, file_path, member["Team Name"], member["PI"]))
 
     # Refresh the UI to reflect the changes
     st.rerun()
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+from capacity_core.capabilities import apply_capability_edits, prepare_capability_data
+from capacity_core.loaders import read_sheet, save_rows
+from capacity_core.storage import get_backend
+from capacity_core.write_coordinator import RowChanges, WriteConflictError
+
+SHEET = "capability_data"
+PI_COLUMNS = ["PI 24-03", "PI 24-04"]
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = str(tmp_path / "workbook.xlsx")
+    data = pd.DataFrame({
+        "ID": [101, 102],
+        "Title": ["CRM Capability 1", "CRM Capability 2"],
+        "State": ["1 - New", "4 - Implementing"],
+        "Start Date": ["2024-05-01", "2024-06-01"],
+        "Target Date": ["2024-12-01", "2025-01-01"],
+        "Tags": ["24-03, CRM WG", "24-04"],
+        "Area Path": ["ONE Digital\\CRM art\\CRM area"] * 2,
+        "Budget SP": [20, 40],
+        "PI 24-03": [np.nan, 10.0],
+        "PI 24-04": [5.0, np.nan],
+        "Comment": ["", "Effort to be discussed"],
+        "To be aligned": [False, True],
+    })
+    get_backend(path).write_sheets({SHEET: data})
+    return path
+
+# Save the edited cells the way the Save Changes button of the capability tab does
+def save_edits(path, prepared, edited, columns):
+    capability_data = prepared.data.copy()
+    changed_cells = apply_capability_edits(capability_data, edited, columns)
+    changes = RowChanges(SHEET)
+    for index in changed_cells.index[changed_cells.any(axis=1)]:
+        edited_columns = changed_cells.columns[changed_cells.loc[index].to_numpy()]
+        changes.update(prepared.raw.loc[index], capability_data.loc[index, edited_columns].to_dict())
+    save_rows(path, changes)
+    return changed_cells
+
+def test_only_edited_cells_are_written(workbook):
+    prepared = prepare_capability_data(workbook, SHEET)
+    edited = prepared.data[["ID"] + PI_COLUMNS].copy()
+    edited.loc[1, "PI 24-04"] = 15.0
+
+    changed_cells = save_edits(workbook, prepared, edited, PI_COLUMNS)
+
+    assert changed_cells.to_numpy().sum() == 1 and changed_cells.loc[1, "PI 24-04"]
+    saved = read_sheet(workbook, SHEET)
+    assert saved.loc[1, "PI 24-04"] == 15.0
+    # Blank PI cells the prepared data shows as 0 stay blank
+    assert pd.isna(saved.loc[0, "PI 24-03"])
+
+def test_edit_keeps_other_cells_changed_since(workbook):
+    prepared = prepare_capability_data(workbook, SHEET)
+    other = RowChanges(SHEET)
+    other.update(read_sheet(workbook, SHEET).loc[1], {"Comment": "Agreed"})
+    save_rows(workbook, other)
+
+    edited = prepared.data[["ID"] + PI_COLUMNS].copy()
+    edited.loc[1, "PI 24-03"] = 12.0
+    save_edits(workbook, prepared, edited, PI_COLUMNS)
+
+    saved = read_sheet(workbook, SHEET)
+    assert saved.loc[1, "PI 24-03"] == 12.0
+    assert saved.loc[1, "Comment"] == "Agreed"
+
+def test_edit_of_a_cell_changed_since_conflicts(workbook):
+    prepared = prepare_capability_data(workbook, SHEET)
+    other = RowChanges(SHEET)
+    other.update(read_sheet(workbook, SHEET).loc[1], {"PI 24-03": 20.0})
+    save_rows(workbook, other)
+
+    edited = prepared.data[["ID"] + PI_COLUMNS].copy()
+    edited.loc[1, "PI 24-03"] = 12.0
+    with pytest.raises(WriteConflictError):
+        save_edits(workbook, prepared, edited, PI_COLUMNS)
+    assert read_sheet(workbook, SHEET).loc[1, "PI 24-03"] == 20.0
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from capacity_core.capacity import calculate_capacity, calculate_team_capacity
+
+ROLES = ["Developer", "Tester", "Product Owner", "SCRUM Master"]
+RELEVANCE = {"Developer": True, "Tester": True, "Product Owner": False}
+
+# The per-member loop calculate_capacity and calculate_team_capacity replaced
+def baseline_capacity(team_members, approach, sp_conversion, sprint_duration, num_sprints, role_relevance_dict):
+    capacities = []
+    for member in team_members:
+        role = member["role"]
+        if not role_relevance_dict.get(role, False):
+            member_capacities = [0] * num_sprints
+        else:
+            sp_focus_factor = member["sp_focus_factor"]
+            hours = member["hours"]
+            multiplier = member.get("multiplier", 1.0)
+            fte = member["fte"]
+            member_capacities = []
+            if approach == "Velocity":
+                for sprint in range(num_sprints):
+                    days_off = member["days_off"][sprint]
+                    actual_capacity = (sprint_duration - days_off) * fte * sp_focus_factor * multiplier
+                    member_capacities.append(actual_capacity)
+            elif approach == "Percentages":
+                for sprint in range(num_sprints):
+                    days_off = member["days_off"][sprint]
+                    hours_capacity = (sprint_duration - days_off) * hours * fte
+                    actual_capacity = (hours_capacity / sp_conversion) * sp_focus_factor * multiplier
+                    member_capacities.append(actual_capacity)
+        capacities.append(member_capacities)
+    return capacities
+
+def baseline_team_capacity(team_members, pi_buffer, approach, sp_conversion, sprint_duration=10, num_sprints=5, role_relevance_dict={}):
+    member_capacities = baseline_capacity(team_members, approach, sp_conversion, sprint_duration, num_sprints, role_relevance_dict)
+    total_capacity_per_sprint_without_buffer = [sum(sprint) for sprint in zip(*member_capacities)]
+    total_capacity_per_sprint_with_buffer = [capacity * (1 - pi_buffer) for capacity in total_capacity_per_sprint_without_buffer]
+    total_capacity_pi_without_buffer = sum(total_capacity_per_sprint_without_buffer)
+    total_capacity_pi_with_buffer = sum(total_capacity_per_sprint_with_buffer)
+    return member_capacities, total_capacity_per_sprint_without_buffer, total_capacity_per_sprint_with_buffer, total_capacity_pi_without_buffer, total_capacity_pi_with_buffer
+
+def make_members(count, seed):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "row": row,
+            "name": f"Member {row}",
+            "role": str(rng.choice(ROLES)),
+            "hours": float(rng.choice([4, 6, 8])),
+            "fte": float(rng.choice([0.5, 0.8, 1.0])),
+            "days_off": rng.integers(0, 6, 5).astype(float).tolist(),
+            "sp_focus_factor": float(rng.uniform(0.1, 0.8)),
+            "multiplier": float(rng.choice([-0.75, 0.25, 1.0])),
+        }
+        for row in range(count)
+    ]
+
+@pytest.mark.parametrize("approach", ["Velocity", "Percentages", "Unknown"])
+@pytest.mark.parametrize("seed", range(5))
+def test_team_capacity_matches_baseline(approach, seed):
+    members = make_members(12, seed)
+    expected = baseline_team_capacity(members, 0.2, approach, 8, role_relevance_dict=RELEVANCE)
+    result = calculate_team_capacity(members, 0.2, approach, 8, role_relevance_dict=RELEVANCE)
+
+    assert len(result[0]) == len(expected[0])
+    for member_capacities, expected_capacities in zip(result[0], expected[0]):
+        assert member_capacities == pytest.approx(expected_capacities)
+    for value, expected_value in zip(result[1:], expected[1:]):
+        assert value == pytest.approx(expected_value)
+
+@pytest.mark.parametrize("approach", ["Velocity", "Percentages", "Unknown"])
+def test_capacity_matches_baseline(approach):
+    members = make_members(8, 42)
+    expected = baseline_capacity(members, approach, 8, 10, 5, RELEVANCE)
+    result = calculate_capacity(members, approach, 8, 10, 5, RELEVANCE)
+    assert len(result) == len(expected)
+    for member_capacities, expected_capacities in zip(result, expected):
+        assert member_capacities == pytest.approx(expected_capacities)
+
+def test_unknown_approach_without_relevant_members():
+    members = [member for member in make_members(12, 1) if not RELEVANCE.get(member["role"], False)]
+    assert calculate_team_capacity(members, 0.1, "Unknown", 8, role_relevance_dict=RELEVANCE) == pytest.approx(
+        baseline_team_capacity(members, 0.1, "Unknown", 8, role_relevance_dict=RELEVANCE))
+
+def test_no_members():
+    assert calculate_team_capacity([], 0.1, "Velocity", 8) == baseline_team_capacity([], 0.1, "Velocity", 8)
@@ -0,0 +1,160 @@
+# Stress test of the write coordinator: writer threads in several processes add, update and
+# delete team members, save the whole sheet from a read that is stale by then and save role
+# relevance in one copy of test_data.xlsx at the same time. The edits go to the change journal;
+# afterwards it is folded into the workbook, where every writer's edits must be and no other row
+# may have changed.
+import multiprocessing
+import os
+import shutil
+import threading
+import pandas as pd
+import pytest
+from capacity_core.loaders import get_team_pi_rows, read_sheet, read_sheet_at_version, save_data, save_role_relevance, save_rows
+from capacity_core.storage import get_backend
+from capacity_core.write_coordinator import RowChanges, WriteConflictError
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MEMBER_SHEET = "team_member_data"
+RELEVANCE_SHEET = "role_relevance"
+TEAM_NAME = "CRM AS 1"
+PI = "24-03"
+PROCESSES = 3
+THREADS = 2
+EDITS = 3
+# A whole-sheet save conflicts when another writer saved the whole sheet since it was read; it
+# is retried from a fresh read, as the UI asks the user to do
+SAVE_ATTEMPTS = 50
+
+def member_name(writer, edit):
+    return f"Stress {writer} #{edit}"
+
+def new_member(name):
+    return {
+        "Team Name": TEAM_NAME, "PI": PI, "Name": name, "Role": "Developer",
+        "Hours": 8.0, "FTE": 1.0, **{f"Days Off Sprint {i}": 0 for i in range(1, 6)},
+        "SP Focus Factor (%)": 0.0, "Status": "Active", "Multiplier": 1.0,
+    }
+
+def find_member(file_path, name):
+    members = get_team_pi_rows(file_path, MEMBER_SHEET, TEAM_NAME, PI)
+    return members[members["Name"] == name].iloc[0]
+
+def save_whole_sheet(file_path, name, data, version):
+    for _ in range(SAVE_ATTEMPTS):
+        try:
+            save_data(file_path, MEMBER_SHEET, pd.concat([data, pd.DataFrame([new_member(name)])], ignore_index=True), version)
+            return
+        except WriteConflictError:
+            data, version = read_sheet_at_version(file_path, MEMBER_SHEET)
+    raise WriteConflictError(f"Saving {name} conflicted {SAVE_ATTEMPTS} times")
+
+# Add EDITS members, set the days off of each (from a possibly stale read), delete the first one,
+# add one more member by saving the whole sheet as read before all that and save the role
+# relevance of the writer's own PI
+def run_writer(file_path, writer):
+    stale_data, stale_version = read_sheet_at_version(file_path, MEMBER_SHEET)
+    for edit in range(EDITS):
+        changes = RowChanges(MEMBER_SHEET)
+        changes.insert(new_member(member_name(writer, edit)))
+        save_rows(file_path, changes)
+    for edit in range(EDITS):
+        changes = RowChanges(MEMBER_SHEET)
+        changes.update(find_member(file_path, member_name(writer, edit)), {"Days Off Sprint 1": edit + 1, "Hours": 6.0})
+        save_rows(file_path, changes)
+    changes = RowChanges(MEMBER_SHEET)
+    changes.delete(find_member(file_path, member_name(writer, 0)))
+    save_rows(file_path, changes)
+    save_whole_sheet(file_path, f"Stress {writer} whole", stale_data, stale_version)
+    save_role_relevance(file_path, RELEVANCE_SHEET, TEAM_NAME, f"Stress {writer}", {"Developer": True, "Tester": writer.endswith("0")})
+
+def run_process(file_path, process, errors):
+    def target(thread):
+        try:
+            run_writer(file_path, f"{process}-{thread}")
+        except Exception as e:
+            errors.put(f"Writer {process}-{thread}: {type(e).__name__}: {e}")
+    threads = [threading.Thread(target=target, args=(thread,)) for thread in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def check(file_path, original_members, original_relevance, writers):
+    members = pd.read_excel(file_path, sheet_name=MEMBER_SHEET)
+    relevance = pd.read_excel(file_path, sheet_name=RELEVANCE_SHEET)
+    problems = []
+
+    untouched = members.iloc[:len(original_members)]
+    if not untouched.equals(original_members):
+        problems.append("rows that existed before the test changed")
+    for writer in writers:
+        rows = members[members["Name"].str.startswith(f"Stress {writer} #", na=False)]
+        expected = {member_name(writer, edit): edit + 1 for edit in range(1, EDITS)}
+        actual = dict(zip(rows["Name"], rows["Days Off Sprint 1"]))
+        if actual != expected:
+            problems.append(f"members of writer {writer}: expected {expected}, found {actual}")
+        if (members["Name"] == f"Stress {writer} whole").sum() != 1:
+            problems.append(f"member saved with the whole sheet by writer {writer} is missing")
+        if len(relevance[relevance["PI"] == f"Stress {writer}"]) != 2:
+            problems.append(f"role relevance of writer {writer} is missing")
+    expected_rows = len(original_members) + len(writers) * EDITS
+    if len(members) != expected_rows:
+        problems.append(f"expected {expected_rows} member rows, found {len(members)}")
+    if not relevance.iloc[:len(original_relevance)].equals(original_relevance):
+        problems.append("role relevance rows that existed before the test changed")
+    return problems
+
+@pytest.fixture
+def workbook(tmp_path):
+    file_path = str(tmp_path / "workbook.xlsx")
+    shutil.copyfile(os.path.join(ROOT, "test_data.xlsx"), file_path)
+    return file_path
+
+def test_concurrent_writers_lose_no_edits(workbook):
+    original_members = read_sheet(workbook, MEMBER_SHEET)
+    original_relevance = read_sheet(workbook, RELEVANCE_SHEET)
+
+    errors = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=run_process, args=(workbook, process, errors)) for process in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    writers = [f"{process}-{thread}" for process in range(PROCESSES) for thread in range(THREADS)]
+    problems = []
+    while not errors.empty():
+        problems.append(errors.get())
+    get_backend(workbook).compact()
+    problems += check(workbook, original_members, original_relevance, writers)
+    assert problems == []
+
+# A sheet saved whole from a read that row edits were saved after keeps those edits
+def test_stale_whole_sheet_save_keeps_newer_row_edits(workbook):
+    data, version = read_sheet_at_version(workbook, MEMBER_SHEET)
+    changes = RowChanges(MEMBER_SHEET)
+    changes.update(data.iloc[0], {"FTE": 0.25})
+    save_rows(workbook, changes)
+
+    data.loc[1, "Hours"] = 3.0
+    save_data(workbook, MEMBER_SHEET, data, version)
+
+    saved = read_sheet(workbook, MEMBER_SHEET)
+    assert saved.loc[0, "FTE"] == 0.25
+    assert saved.loc[1, "Hours"] == 3.0
+    get_backend(workbook).compact()
+    saved = pd.read_excel(workbook, sheet_name=MEMBER_SHEET)
+    assert saved.loc[0, "FTE"] == 0.25
+    assert saved.loc[1, "Hours"] == 3.0
+
+# A sheet saved whole from a read that another whole-sheet save came after conflicts
+def test_stale_whole_sheet_save_after_another_whole_sheet_save_conflicts(workbook):
+    data, version = read_sheet_at_version(workbook, MEMBER_SHEET)
+    other = data.copy()
+    other.loc[0, "FTE"] = 0.25
+    save_data(workbook, MEMBER_SHEET, other, version)
+
+    data.loc[1, "Hours"] = 3.0
+    with pytest.raises(WriteConflictError):
+        save_data(workbook, MEMBER_SHEET, data, version)
+    assert read_sheet(workbook, MEMBER_SHEET).loc[0, "FTE"] == 0.25
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+from capacity_core.loaders import save_rows
+from capacity_core.storage import filter_rows, get_backend
+from capacity_core.write_coordinator import RowChanges
+
+SHEET = "team_member_data"
+TEAMS = ["CRM 1", "CRM 2", "ERP 1"]
+PIS = ["24-01", "24-02"]
+
+def make_workbook(path):
+    rng = np.random.default_rng(0)
+    rows = [
+        {"Team Name": team, "PI": pi, "Name": f"{team} {pi} Member {number}", "FTE": float(rng.choice([0.5, 1.0])), "Hours": 8}
+        for team in TEAMS for pi in PIS for number in range(3)
+    ]
+    sheets = {SHEET: pd.DataFrame(rows), "pi_dropdown": pd.DataFrame({"PI": PIS})}
+    get_backend(path).write_sheets(sheets)
+
+def random_changes(data, rng):
+    changes = RowChanges(SHEET)
+    team, pi = str(rng.choice(TEAMS)), str(rng.choice(PIS))
+    kind = rng.choice(["insert", "update", "move", "delete", "upsert", "update_matching", "replace"])
+    row = data.iloc[int(rng.integers(len(data)))]
+    if kind == "insert":
+        changes.insert({"Team Name": team, "PI": pi, "Name": f"New {rng.integers(1_000_000)}", "FTE": 0.8, "Hours": 6})
+    elif kind == "update":
+        changes.update(row, {"FTE": float(rng.uniform())})
+    elif kind == "move":
+        # Moves the member into another team, in or out of the rows a query filters
+        changes.update(row, {"Team Name": team, "PI": pi})
+    elif kind == "delete":
+        changes.delete(row)
+    elif kind == "upsert":
+        changes.upsert({"Team Name": row["Team Name"], "PI": row["PI"], "Name": row["Name"], "Hours": 4})
+    elif kind == "update_matching":
+        changes.update_matching({"Team Name": team, "PI": pi}, {"Hours": 7})
+    else:
+        changes.replace({"Team Name": team, "PI": pi}, [{"Team Name": team, "PI": pi, "Name": f"Copy {number}", "FTE": 1.0, "Hours": 8} for number in range(int(rng.integers(0, 4)))])
+    return changes
+
+@pytest.mark.parametrize("extension", [".xlsx", ".db"])
+def test_query_applies_the_journal_to_the_filtered_rows(tmp_path, extension):
+    path = str(tmp_path / f"workbook{extension}")
+    make_workbook(path)
+    backend = get_backend(path)
+    rng = np.random.default_rng(1)
+    for _ in range(40):
+        save_rows(path, random_changes(backend.read_sheet(SHEET), rng))
+        data = backend.read_sheet(SHEET)
+        for team in TEAMS:
+            for pi in PIS:
+                filters = {"Team Name": team, "PI": pi}
+                pd.testing.assert_frame_equal(backend.query(SHEET, filters), filter_rows(data, filters), check_dtype=False)
+    assert backend.compact() > 0